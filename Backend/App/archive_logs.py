@@ -0,0 +1,52 @@
+"""Apply the audit log partitioning and retention policy.
+
+Moves audit rows older than AUDIT_HOT_DAYS out of the hot audit_logs table
+into compressed daily segments, then deletes segments and per-minute
+rollups older than AUDIT_RETENTION_DAYS. Meant to run daily (cron / systemd
+timer).
+
+Usage: python -m App.archive_logs [--hot-days N] [--retention-days N] [--dir PATH] [--vacuum]
+"""
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from App import config
+from App.database.session import SessionLocal, engine
+from App.core.audit_archive import archive_before, apply_retention
+from App.core.audit_rollup import purge_before as purge_rollups_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hot-days", type=int, default=config.AUDIT_HOT_DAYS)
+    parser.add_argument("--retention-days", type=int, default=config.AUDIT_RETENTION_DAYS)
+    parser.add_argument("--dir", default=config.AUDIT_ARCHIVE_DIR)
+    parser.add_argument("--vacuum", action="store_true", help="reclaim the freed space in the SQLite file")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        moved = archive_before(db, datetime.utcnow() - timedelta(days=args.hot_days), args.dir)
+    finally:
+        db.close()
+    for day, count in sorted(moved.items()):
+        print(f"archived {count} rows for {day}")
+
+    for day in apply_retention(args.retention_days, args.dir):
+        print(f"deleted segment for {day}")
+
+    db = SessionLocal()
+    try:
+        purged = purge_rollups_before(db, datetime.utcnow() - timedelta(days=args.retention_days))
+    finally:
+        db.close()
+    if purged:
+        print(f"deleted {purged} rollup rows")
+
+    if args.vacuum and moved:
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+
+if __name__ == "__main__":
+    main()
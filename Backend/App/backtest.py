@@ -0,0 +1,309 @@
+"""Replay audit_logs through a candidate risk policy and report how decisions shift.
+
+Every `api_call` row is re-scored from signals rebuilt the way `require_roles`
+computes them (request rate, recent failed logins, token reuse, IP/UA change
+since the last login), once under the baseline policy and once under the
+candidate. Users are split into partitions that are replayed in parallel
+worker processes; each partition is streamed in keyset chunks and only one
+user's state is held at a time, so memory stays flat however many rows the
+table has. Archived days (see App.archive_logs) are not replayed.
+
+Policies are files in the App.core.policy format; the baseline defaults to
+the active policy.
+
+Usage: python -m App.backtest --candidate policy.json [--baseline policy.json]
+       [--workers N] [--chunk-size N] [--since ISO] [--until ISO] [--top N]
+       [--json report.json] [--database-url URL]
+"""
+import argparse
+import json
+import os
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from sqlalchemy import create_engine, func, select, tuple_
+from App.database.models import AuditLog
+from App.core.policy import RiskPolicy, active_policy
+from App.core.risk_engine import calculate_risk_batch
+from App.core.signal_store import RECENT_WINDOW_SECONDS, FAILED_LOGIN_WINDOW_SECONDS
+
+DECISIONS = ("allow", "allow+log", "deny")
+# token ages that land in each calculate_risk age tier (none, > 1 day, > 7 days)
+TOKEN_AGE_TIERS = (0, 60 * 60 * 24 + 1, 60 * 60 * 24 * 7 + 1)
+
+
+def _jti(details: str | None) -> str | None:
+    if details and details.startswith("jti:"):
+        return details[4:].split(";", 1)[0] or None
+    return None
+
+
+class _UserReplay:
+    """Signal state for one user while walking their rows in time order."""
+
+    def __init__(self):
+        self.recent = deque()
+        self.failed = deque()
+        self.last_login = None
+        self.token_ips: dict[str, set] = {}
+
+    def signals(self, ts: datetime, ip, user_agent, jti) -> tuple:
+        while self.recent and self.recent[0] < ts - timedelta(seconds=RECENT_WINDOW_SECONDS):
+            self.recent.popleft()
+        while self.failed and self.failed[0] < ts - timedelta(seconds=FAILED_LOGIN_WINDOW_SECONDS):
+            self.failed.popleft()
+        reuse = len(self.token_ips.get(jti, set()) - {ip, None}) if jti else 0
+        ip_change = ua_change = False
+        if self.last_login:
+            last_ip, last_user_agent = self.last_login
+            ip_change = bool(ip and last_ip and ip != last_ip)
+            ua_change = bool(user_agent and last_user_agent and user_agent != last_user_agent)
+        return len(self.recent), len(self.failed), reuse, ip_change, ua_change
+
+    def observe(self, ts: datetime, event_type, ip, user_agent, jti):
+        self.recent.append(ts)
+        if event_type == "login_failed":
+            self.failed.append(ts)
+        elif event_type == "login_success":
+            self.last_login = (ip, user_agent)
+        if jti:
+            self.token_ips.setdefault(jti, set()).add(ip)
+
+
+class BacktestReport:
+    """Decision-change counts as {old decision: {new decision: count}} per scope."""
+
+    def __init__(self):
+        self.rows = 0
+        self.replay_mismatches = 0
+        self.overall = Counter()
+        self.endpoints = Counter()
+        self.users = Counter()
+
+    def add(self, endpoints, usernames, recorded, baseline, candidate):
+        self.rows += len(baseline)
+        for endpoint, username, was, old, new in zip(endpoints, usernames, recorded, baseline, candidate):
+            if was is not None and was != old:
+                self.replay_mismatches += 1
+            self.overall[(old, new)] += 1
+            self.endpoints[(endpoint, old, new)] += 1
+            self.users[(username, old, new)] += 1
+
+    def merge(self, other: "BacktestReport"):
+        self.rows += other.rows
+        self.replay_mismatches += other.replay_mismatches
+        self.overall.update(other.overall)
+        self.endpoints.update(other.endpoints)
+        self.users.update(other.users)
+
+    @staticmethod
+    def _matrix(counts) -> dict:
+        matrix = {}
+        for (old, new), count in sorted(counts.items()):
+            matrix.setdefault(old, {})[new] = count
+        return matrix
+
+    def _scoped(self, counts: Counter, top: int | None) -> dict:
+        per_key, changed = {}, Counter()
+        for (key, old, new), count in counts.items():
+            per_key.setdefault(key, Counter())[(old, new)] += count
+            if old != new:
+                changed[key] += count
+        keys = [key for key, _ in changed.most_common(top)]
+        return {key: {"changed": changed[key], "matrix": self._matrix(per_key[key])} for key in keys}
+
+    def as_dict(self, top: int | None = None) -> dict:
+        return {
+            "rows": self.rows,
+            "changed": sum(c for (old, new), c in self.overall.items() if old != new),
+            "replay_mismatches": self.replay_mismatches,
+            "overall": self._matrix(self.overall),
+            "endpoints": self._scoped(self.endpoints, top),
+            "users": self._scoped(self.users, top),
+        }
+
+
+def _partition_stmt(first, last, since, until, after, limit):
+    stmt = select(
+        AuditLog.id, AuditLog.username, AuditLog.endpoint, AuditLog.event_type, AuditLog.ip,
+        AuditLog.user_agent, AuditLog.details, AuditLog.risk_score, AuditLog.decision, AuditLog.timestamp,
+    ).where(AuditLog.username >= first, AuditLog.username <= last)
+    if since is not None:
+        # start early enough that the first scored rows see full windows
+        stmt = stmt.where(AuditLog.timestamp >= since - timedelta(seconds=FAILED_LOGIN_WINDOW_SECONDS))
+    if until is not None:
+        stmt = stmt.where(AuditLog.timestamp < until)
+    if after is not None:
+        stmt = stmt.where(tuple_(AuditLog.username, AuditLog.timestamp, AuditLog.id) > tuple_(*after))
+    return stmt.order_by(AuditLog.username, AuditLog.timestamp, AuditLog.id).limit(limit)
+
+
+def replay_partition(task: tuple) -> BacktestReport:
+    """Replay users `first`..`last` (inclusive); runs inside a worker process."""
+    database_url, first, last, baseline, candidate, since, until, chunk_size = task
+    engine = create_engine(database_url)
+    report = BacktestReport()
+    state, current_user, after = None, None, None
+    try:
+        with engine.connect() as conn:
+            while True:
+                rows = conn.execute(_partition_stmt(first, last, since, until, after, chunk_size)).all()
+                if not rows:
+                    break
+                after = (rows[-1].username, rows[-1].timestamp, rows[-1].id)
+
+                cols = {k: [] for k in ("endpoints", "usernames", "request_count", "failed_login_count",
+                                        "token_reuse_count", "ip_change", "ua_change", "recorded_score", "recorded")}
+                for row in rows:
+                    if row.username != current_user:
+                        state, current_user = _UserReplay(), row.username
+                    jti = _jti(row.details)
+                    if row.event_type == "api_call" and (since is None or row.timestamp >= since):
+                        recent, failed, reuse, ip_change, ua_change = state.signals(row.timestamp, row.ip, row.user_agent, jti)
+                        cols["endpoints"].append(row.endpoint or "")
+                        cols["usernames"].append(row.username)
+                        cols["request_count"].append(recent)
+                        cols["failed_login_count"].append(failed)
+                        cols["token_reuse_count"].append(reuse)
+                        cols["ip_change"].append(ip_change)
+                        cols["ua_change"].append(ua_change)
+                        cols["recorded_score"].append(row.risk_score)
+                        cols["recorded"].append(row.decision)
+                    state.observe(row.timestamp, row.event_type, row.ip, row.user_agent, jti)
+
+                if cols["endpoints"]:
+                    _score_chunk(report, cols, baseline, candidate)
+                if len(rows) < chunk_size:
+                    break
+    finally:
+        engine.dispose()
+    return report
+
+
+def _score_chunk(report: BacktestReport, cols: dict, baseline: RiskPolicy, candidate: RiskPolicy):
+    import numpy as np
+
+    signals = {k: cols[k] for k in ("endpoints", "request_count", "failed_login_count", "token_reuse_count",
+                                     "ip_change", "ua_change")}
+    # Role mismatch and token age are not stored on the audit row. Both add
+    # fixed amounts (40, and 0/5/10), so they are recovered from how far the
+    # recorded score sits above what the baseline gives without them.
+    partial, _ = calculate_risk_batch(**signals, policy=baseline)
+    recorded = np.array([partial[i] if s is None else s for i, s in enumerate(cols["recorded_score"])], dtype=np.int64)
+    residual = np.maximum(recorded - partial, 0)
+    role_mismatch = residual >= 40
+    age_tier = np.clip((residual - role_mismatch * 40) // 5, 0, 2)
+    signals["role_mismatch"] = role_mismatch
+    signals["token_age_seconds"] = np.array(TOKEN_AGE_TIERS)[age_tier]
+
+    _, old = calculate_risk_batch(**signals, policy=baseline)
+    _, new = calculate_risk_batch(**signals, policy=candidate)
+    report.add(cols["endpoints"], cols["usernames"], cols["recorded"], old, new)
+
+
+def plan_partitions(conn, parts: int, since=None, until=None) -> list[tuple[str, str]]:
+    """Split users into up to `parts` contiguous username ranges of similar row counts."""
+    stmt = select(AuditLog.username, func.count()).where(AuditLog.username.is_not(None))
+    if since is not None:
+        stmt = stmt.where(AuditLog.timestamp >= since - timedelta(seconds=FAILED_LOGIN_WINDOW_SECONDS))
+    if until is not None:
+        stmt = stmt.where(AuditLog.timestamp < until)
+    counts = conn.execute(stmt.group_by(AuditLog.username).order_by(AuditLog.username)).all()
+    if not counts:
+        return []
+    target = sum(c for _, c in counts) / max(1, parts)
+    ranges, first, acc = [], counts[0][0], 0
+    for username, count in counts:
+        if first is None:
+            first = username
+        acc += count
+        if acc >= target:
+            ranges.append((first, username))
+            first, acc = None, 0
+    if first is not None:
+        ranges.append((first, counts[-1][0]))
+    return ranges
+
+
+def run_backtest(
+    database_url: str,
+    candidate: RiskPolicy,
+    baseline: RiskPolicy | None = None,
+    *,
+    workers: int = 1,
+    chunk_size: int = 50000,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> BacktestReport:
+    baseline = baseline or active_policy()
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as conn:
+            # a few partitions per worker keeps the cores busy when users are skewed
+            ranges = plan_partitions(conn, workers * 4 if workers > 1 else 1, since, until)
+    finally:
+        engine.dispose()
+
+    tasks = [(database_url, first, last, baseline, candidate, since, until, chunk_size) for first, last in ranges]
+    report = BacktestReport()
+    if workers > 1 and len(tasks) > 1:
+        with Pool(workers) as pool:
+            for part in pool.imap_unordered(replay_partition, tasks):
+                report.merge(part)
+    else:
+        for task in tasks:
+            report.merge(replay_partition(task))
+    return report
+
+
+def _print_report(data: dict):
+    print(f"replayed {data['rows']} requests, {data['changed']} decisions change "
+          f"({data['replay_mismatches']} baseline replays differ from the recorded decision)")
+
+    def matrix(title, m):
+        print(f"\n{title}")
+        print("  old \\ new    " + "".join(f"{d:>11}" for d in DECISIONS))
+        for old in DECISIONS:
+            print(f"  {old:<12}" + "".join(f"{m.get(old, {}).get(new, 0):>11}" for new in DECISIONS))
+
+    matrix("overall", data["overall"])
+    for scope in ("endpoints", "users"):
+        for key, entry in data[scope].items():
+            matrix(f"{scope[:-1]} {key}: {entry['changed']} changed", entry["matrix"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--candidate", required=True, help="candidate policy JSON")
+    parser.add_argument("--baseline", help="policy the rows were recorded under (default: current)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat)
+    parser.add_argument("--top", type=int, default=10, help="endpoints/users with the most changes to show")
+    parser.add_argument("--json", help="also write the full report here")
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    if args.database_url:
+        database_url = args.database_url
+    else:
+        from App.database.session import SQLALCHEMY_DATABASE_URL as database_url
+
+    report = run_backtest(
+        database_url,
+        RiskPolicy.from_file(args.candidate),
+        RiskPolicy.from_file(args.baseline) if args.baseline else None,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        since=args.since,
+        until=args.until,
+    )
+    _print_report(report.as_dict(args.top))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report.as_dict(), fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
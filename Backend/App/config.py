@@ -1,4 +1,6 @@
+import hashlib
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,3 +8,127 @@ load_dotenv()
 JWT_SECRET = os.getenv("JWT_SECRET", "supersecretkey")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXP_MINUTES = 60
+
+# Maximum number of users tracked by the in-memory risk signal store
+SIGNAL_STORE_MAX_USERS = int(os.getenv("SIGNAL_STORE_MAX_USERS", "10000"))
+
+# Where the risk signal counters live: "memory" (per process; only correct
+# with a single worker), or, to share them between workers, "mmap" (a
+# memory-mapped file, in /dev/shm where available) or "redis". The mmap file
+# is named after this install so separate checkouts on one host don't collide.
+SIGNAL_BACKEND = os.getenv("SIGNAL_BACKEND", "memory")
+SIGNAL_MMAP_PATH = os.getenv("SIGNAL_MMAP_PATH", os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+    "accessguard-signals-" + hashlib.sha1(os.path.dirname(os.path.abspath(__file__)).encode()).hexdigest()[:8],
+))
+SIGNAL_REDIS_URL = os.getenv("SIGNAL_REDIS_URL", "redis://localhost:6379/0")
+SIGNAL_REDIS_PREFIX = os.getenv("SIGNAL_REDIS_PREFIX", "accessguard")
+
+# How often expired refresh tokens are deleted (seconds; 0 disables the purge)
+REFRESH_PURGE_INTERVAL_SECONDS = float(os.getenv("REFRESH_PURGE_INTERVAL_SECONDS", "3600"))
+
+# Access token revocation: Bloom filter size and false-positive rate, how
+# often each worker loads new revocations and rebuilds the filter (seconds)
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "1000000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "1"))
+REVOCATION_REBUILD_SECONDS = float(os.getenv("REVOCATION_REBUILD_SECONDS", "3600"))
+
+# Login throttling ahead of bcrypt: token buckets per client IP and per
+# username (attempts per minute, burst), failures before an exponential
+# lockout starts, and how often each key reports blocked attempts (seconds)
+LOGIN_THROTTLE_ENABLED = os.getenv("LOGIN_THROTTLE_ENABLED", "true").lower() in ("1", "true", "yes")
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "30"))
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "30"))
+LOGIN_IP_LOCKOUT_AFTER = int(os.getenv("LOGIN_IP_LOCKOUT_AFTER", "20"))
+LOGIN_USER_PER_MINUTE = float(os.getenv("LOGIN_USER_PER_MINUTE", "5"))
+LOGIN_USER_BURST = int(os.getenv("LOGIN_USER_BURST", "5"))
+LOGIN_LOCKOUT_AFTER = int(os.getenv("LOGIN_LOCKOUT_AFTER", "5"))
+LOGIN_LOCKOUT_BASE_SECONDS = float(os.getenv("LOGIN_LOCKOUT_BASE_SECONDS", "30"))
+LOGIN_LOCKOUT_MAX_SECONDS = float(os.getenv("LOGIN_LOCKOUT_MAX_SECONDS", "3600"))
+LOGIN_THROTTLE_REPORT_SECONDS = float(os.getenv("LOGIN_THROTTLE_REPORT_SECONDS", "60"))
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+
+# Audit writer: "sync" commits every event inside the request, "batched"
+# queues events for a background thread that bulk-inserts them
+AUDIT_WRITER_MODE = os.getenv("AUDIT_WRITER_MODE", "sync")
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+
+# Keep per-minute audit counts (per decision, endpoint, user and risk bucket)
+# up to date as events are written; served by /admin/stats
+AUDIT_ROLLUPS_ENABLED = os.getenv("AUDIT_ROLLUPS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Live audit stream (/admin/logs/stream): events buffered per subscriber
+# before the oldest are dropped, open streams per worker, seconds between
+# heartbeats, and rows replayed for a client resuming with Last-Event-ID
+EVENT_STREAM_BUFFER = int(os.getenv("EVENT_STREAM_BUFFER", "1000"))
+EVENT_STREAM_MAX_SUBSCRIBERS = int(os.getenv("EVENT_STREAM_MAX_SUBSCRIBERS", "1000"))
+EVENT_STREAM_HEARTBEAT_SECONDS = float(os.getenv("EVENT_STREAM_HEARTBEAT_SECONDS", "15"))
+EVENT_STREAM_REPLAY_LIMIT = int(os.getenv("EVENT_STREAM_REPLAY_LIMIT", "1000"))
+
+# Database access mode for the zero-trust dependency: "sync" or "async"
+# (AsyncSession over aiosqlite, keeps DB work off the event loop)
+DB_MODE = os.getenv("DB_MODE", "sync")
+
+# Number of verified access-token payloads cached by decode_access_token (0 disables)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+
+# Worker pool for bcrypt hashing/verification: "thread" or "process".
+# PASSWORD_WORKERS=0 means one worker per CPU core.
+PASSWORD_POOL = os.getenv("PASSWORD_POOL", "thread")
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "0"))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "64"))
+
+# Audit log partitioning: days kept in the hot audit_logs table, days of
+# compressed archive segments kept on disk, and where the segments live
+AUDIT_HOT_DAYS = int(os.getenv("AUDIT_HOT_DAYS", "7"))
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "365"))
+AUDIT_ARCHIVE_DIR = os.getenv(
+    "AUDIT_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "database", "archive")
+)
+
+# Risk policy file (JSON or YAML) with endpoint sensitivity patterns and
+# decision thresholds; empty uses the built-in policy. The file is checked
+# for changes every RISK_POLICY_RELOAD_SECONDS.
+RISK_POLICY_FILE = os.getenv("RISK_POLICY_FILE", "")
+RISK_POLICY_RELOAD_SECONDS = float(os.getenv("RISK_POLICY_RELOAD_SECONDS", "2"))
+RISK_POLICY_CACHE_SIZE = int(os.getenv("RISK_POLICY_CACHE_SIZE", "4096"))
+
+# Per-stage latency histograms and decision counters served at /metrics.
+# Scrapers must send "Authorization: Bearer <METRICS_TOKEN>"; while no token
+# is set the route is hidden, though the metrics are still collected.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Slow-request profiler (opt-in): keeps sampled call stacks for requests slower
+# than PROFILER_THRESHOLD_MS, plus a random PROFILER_SAMPLE_RATE fraction, in a
+# ring of at most PROFILER_MAX_FILES files under PROFILER_DIR
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_THRESHOLD_MS = float(os.getenv("PROFILER_THRESHOLD_MS", "500"))
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILER_MAX_FILES = int(os.getenv("PROFILER_MAX_FILES", "100"))
+PROFILER_DIR = os.getenv(
+    "PROFILER_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "database", "profiles")
+)
+
+# Database. DATABASE_URL defaults to the SQLite file in App/database; set
+# DATABASE_READ_URL to send reads to a replica and DATABASE_ASYNC_URL for
+# the async driver when it can't be derived (non-SQLite backends).
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+DATABASE_ASYNC_URL = os.getenv("DATABASE_ASYNC_URL", "")
+DB_WRITE_POOL_SIZE = int(os.getenv("DB_WRITE_POOL_SIZE", "1"))
+DB_WRITE_MAX_OVERFLOW = int(os.getenv("DB_WRITE_MAX_OVERFLOW", "0"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# SQLite connection pragmas (see App/database/engines.py)
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() in ("1", "true", "yes")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
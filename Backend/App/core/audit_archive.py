@@ -0,0 +1,175 @@
+"""Compressed daily archive segments for audit_logs.
+
+`audit_logs` is the hot partition: it only keeps recent days, which is all
+the risk checks ever look at. Older days are moved into one gzip-compressed
+NDJSON segment per UTC day (`audit-YYYY-MM-DD.ndjson.gz`), and segments past
+the retention period are deleted. Readers merge the hot table and the
+segments so the admin views see one continuous, newest-first log.
+
+A segment's lines are kept in the same newest-first (timestamp, id) order,
+so readers stream a segment and stop early instead of loading and sorting it.
+"""
+import gzip
+import heapq
+import json
+import os
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from App import config
+from App.database.models import AuditLog
+from App.core.audit_query import LOG_FIELDS, LogFilters, iter_logs
+
+SEGMENT_PREFIX = "audit-"
+SEGMENT_SUFFIX = ".ndjson.gz"
+
+ArchivedRow = namedtuple("ArchivedRow", LOG_FIELDS)
+
+
+def archive_dir(directory: str | os.PathLike | None = None) -> Path:
+    return Path(directory or config.AUDIT_ARCHIVE_DIR)
+
+
+def segment_path(directory: Path, day: date) -> Path:
+    return directory / f"{SEGMENT_PREFIX}{day.isoformat()}{SEGMENT_SUFFIX}"
+
+
+def list_segments(directory: str | os.PathLike | None = None) -> list[tuple[date, Path]]:
+    """Archived segments as (day, path), newest day first."""
+    directory = archive_dir(directory)
+    if not directory.is_dir():
+        return []
+    segments = []
+    for path in directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"):
+        try:
+            day = date.fromisoformat(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+        except ValueError:
+            continue
+        segments.append((day, path))
+    return sorted(segments, reverse=True)
+
+
+def archive_version(directory: str | os.PathLike | None = None) -> int:
+    """Changes whenever a segment is written, rewritten or deleted (the directory's mtime)."""
+    try:
+        return os.stat(archive_dir(directory)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _encode(row) -> str:
+    out = dict(zip(LOG_FIELDS, row))
+    out["timestamp"] = out["timestamp"].isoformat() if out["timestamp"] else None
+    return json.dumps(out)
+
+
+def _decode(line: str) -> ArchivedRow:
+    data = json.loads(line)
+    if data.get("timestamp"):
+        data["timestamp"] = datetime.fromisoformat(data["timestamp"])
+    return ArchivedRow(**{field: data.get(field) for field in LOG_FIELDS})
+
+
+def _read_segment(path: Path):
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            yield _decode(line)
+
+
+def _sort_key(row) -> tuple[datetime, int]:
+    return row.timestamp, row.id
+
+
+def archive_before(db: Session, cutoff: datetime, directory: str | os.PathLike | None = None) -> dict[date, int]:
+    """Move every audit row older than the start of `cutoff`'s day into segments.
+
+    Each day's segment is written to a temporary file, fsynced and renamed
+    into place before the day's rows are deleted from the hot table, so a
+    crash can at worst leave a row in both places. When the segment already
+    exists, its rows and the new ones are merged as two sorted streams, which
+    keeps the file newest first without holding either in memory.
+    """
+    directory = archive_dir(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    boundary = datetime.combine(cutoff.date(), time.min)
+    moved = {}
+
+    def next_day(start: datetime):
+        row = (
+            db.query(AuditLog.timestamp)
+            .filter(AuditLog.timestamp >= start, AuditLog.timestamp < boundary)
+            .order_by(AuditLog.timestamp)
+            .first()
+        )
+        return row[0].date() if row else None
+
+    day = next_day(datetime.min)
+    while day is not None:
+        start = datetime.combine(day, time.min)
+        end = start + timedelta(days=1)
+        path = segment_path(directory, day)
+        partial = path.with_name(path.name + ".partial")
+        count = 0
+
+        def hot_rows():
+            nonlocal count
+            for rows in iter_logs(db, LogFilters(since=start, until=end), chunk_size=5000, include_archive=False):
+                count += len(rows)
+                yield from rows
+
+        rows = hot_rows()
+        if path.exists():
+            rows = heapq.merge(rows, _read_segment(path), key=_sort_key, reverse=True)
+        with gzip.open(partial, "wt", encoding="utf-8") as fh:
+            for row in rows:
+                fh.write(_encode(row) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(partial, path)
+        db.execute(delete(AuditLog).where(AuditLog.timestamp >= start, AuditLog.timestamp < end))
+        db.commit()
+        moved[day] = count
+        day = next_day(end)
+    return moved
+
+
+def apply_retention(keep_days: int, directory: str | os.PathLike | None = None, now: datetime | None = None) -> list[date]:
+    """Delete segments for days older than `keep_days` before `now`."""
+    oldest_kept = (now or datetime.utcnow()).date() - timedelta(days=keep_days)
+    removed = []
+    for day, path in list_segments(directory):
+        if day < oldest_kept:
+            path.unlink()
+            removed.append(day)
+    return removed
+
+
+def iter_archived(
+    filters: LogFilters | None = None,
+    after: tuple[datetime, int] | None = None,
+    directory: str | os.PathLike | None = None,
+):
+    """Yield archived rows newest first, honouring `filters` and a keyset `after`.
+
+    Segments outside the filter's time range are skipped without being
+    opened, and the others are streamed line by line, so memory does not
+    grow with the size of a day.
+    """
+    filters = filters or LogFilters()
+    for day, path in list_segments(directory):
+        day_start = datetime.combine(day, time.min)
+        if filters.since is not None and day_start + timedelta(days=1) <= filters.since:
+            break
+        if filters.until is not None and day_start >= filters.until:
+            continue
+        if after is not None and day_start > after[0]:
+            continue
+        for row in _read_segment(path):
+            if after is not None and _sort_key(row) >= after:
+                continue
+            if filters.since is not None and row.timestamp < filters.since:
+                break  # everything further down the segment is older still
+            if filters.matches(row):
+                yield row
@@ -1,8 +1,17 @@
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from App.database.models import AuditLog
 from datetime import datetime
+from itertools import islice
 from sqlalchemy.exc import OperationalError
-from App.database.models import Base as ModelsBase
+from App.database.schema import ensure_schema, invalidate as invalidate_schema
+from App.core.signal_store import signal_store
+from App.core.token_usage import record_token_use, record_token_use_async
+from App.core.audit_writer import audit_writer
+from App.core.audit_archive import iter_archived
+from App.core.audit_rollup import record_rollups
+from App.core.event_bus import event_bus
+from App.core.metrics import metrics
 
 
 def log_access(
@@ -17,6 +26,7 @@ def log_access(
     event_type: str | None = None,
     user_agent: str | None = None,
     suspicious: int = 0,
+    jti: str | None = None,
 ):
     log_entry = AuditLog(
         username=username,
@@ -30,14 +40,36 @@ def log_access(
         suspicious=suspicious,
         timestamp=datetime.utcnow(),
     )
-    try:
+
+    # In batched mode the row is handed to the background writer; the signal
+    # store is updated right away so risk checks see the unflushed event.
+    if audit_writer.running:
+        with metrics.stage("audit_enqueue"):
+            queued = audit_writer.enqueue(_row(log_entry, jti))
+        if queued:
+            signal_store.record(username, event_type, log_entry.timestamp, ip=ip, user_agent=user_agent, jti=jti)
+            return log_entry
+
+    def _write():
         db.add(log_entry)
+        if jti:
+            # index the token use so reuse checks don't scan audit_logs
+            record_token_use(db, jti, username=username, ip=ip, user_agent=user_agent, seen_at=log_entry.timestamp)
+        record_rollups(db, [_row(log_entry, None)])
+        # the flush fills in the id; detached, the entry isn't expired by the
+        # commit, so reading it later doesn't check the writer connection out again
+        db.flush()
+        db.expunge(log_entry)
         db.commit()
-        db.refresh(log_entry)
+
+    try:
+        with metrics.stage("audit_commit"):
+            _write()
     except OperationalError:
         # If tables are missing on this session's bind (e.g., in-memory
-        # sqlite used in tests), attempt to create metadata on the
-        # underlying bind and retry once.
+        # sqlite used in tests), drop the cached readiness for the bind,
+        # create the tables and retry once.
+        db.rollback()
         try:
             bind = None
             try:
@@ -45,15 +77,99 @@ def log_access(
             except Exception:
                 bind = getattr(db, "bind", None)
             if bind is not None:
-                ModelsBase.metadata.create_all(bind=bind)
+                invalidate_schema(bind)
+                ensure_schema(bind)
         except Exception:
             pass
+        _write()
+    signal_store.record(username, event_type, log_entry.timestamp, ip=ip, user_agent=user_agent, jti=jti)
+    if event_bus.active:
+        event_bus.publish(_event(log_entry))
+    return log_entry
+
+
+def _event(log_entry: AuditLog) -> dict:
+    row = _row(log_entry, None)
+    row["id"] = log_entry.id
+    return row
+
+
+def _row(log_entry: AuditLog, jti: str | None) -> dict:
+    return {
+        "username": log_entry.username,
+        "endpoint": log_entry.endpoint,
+        "risk_score": log_entry.risk_score,
+        "decision": log_entry.decision,
+        "ip": log_entry.ip,
+        "details": log_entry.details,
+        "event_type": log_entry.event_type,
+        "user_agent": log_entry.user_agent,
+        "suspicious": log_entry.suspicious,
+        "timestamp": log_entry.timestamp,
+        "jti": jti,
+    }
+
+
+async def log_access_async(
+    db: AsyncSession,
+    username: str | None,
+    endpoint: str | None,
+    risk_score: int | None,
+    decision: str | None,
+    *,
+    ip: str | None = None,
+    details: str | None = None,
+    event_type: str | None = None,
+    user_agent: str | None = None,
+    suspicious: int = 0,
+    jti: str | None = None,
+):
+    """Async variant of `log_access` for `AsyncSession` callers.
+
+    The primary key is populated by the INSERT itself, so there is no
+    refresh round trip after the commit.
+    """
+    log_entry = AuditLog(
+        username=username,
+        endpoint=endpoint,
+        risk_score=risk_score,
+        decision=decision,
+        ip=ip,
+        details=details,
+        event_type=event_type,
+        user_agent=user_agent,
+        suspicious=suspicious,
+        timestamp=datetime.utcnow(),
+    )
+
+    if audit_writer.running:
+        with metrics.stage("audit_enqueue"):
+            queued = audit_writer.enqueue(_row(log_entry, jti))
+        if queued:
+            signal_store.record(username, event_type, log_entry.timestamp, ip=ip, user_agent=user_agent, jti=jti)
+            return log_entry
+
+    with metrics.stage("audit_commit"):
         db.add(log_entry)
-        db.commit()
-        db.refresh(log_entry)
+        if jti:
+            await record_token_use_async(db, jti, username=username, ip=ip, user_agent=user_agent, seen_at=log_entry.timestamp)
+        await db.run_sync(record_rollups, [_row(log_entry, None)])
+        await db.commit()
+    signal_store.record(username, event_type, log_entry.timestamp, ip=ip, user_agent=user_agent, jti=jti)
+    if event_bus.active:
+        event_bus.publish(_event(log_entry))
     return log_entry
 
 
 def get_logs(db: Session, limit: int = 200):
-    """Return recent audit logs ordered by timestamp desc."""
-    return db.query(AuditLog).order_by(AuditLog.timestamp.desc()).limit(limit).all()
+    """Return recent audit logs ordered by timestamp desc.
+
+    If the hot table holds fewer than `limit` rows, the rest come from the
+    archived segments as detached `AuditLog` objects.
+    """
+    logs = db.query(AuditLog).order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit).all()
+    if len(logs) < limit:
+        after = (logs[-1].timestamp, logs[-1].id) if logs else None
+        for row in islice(iter_archived(after=after), limit - len(logs)):
+            logs.append(AuditLog(**row._asdict()))
+    return logs
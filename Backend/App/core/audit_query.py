@@ -0,0 +1,215 @@
+import base64
+import hashlib
+from contextlib import closing
+from dataclasses import astuple, dataclass
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+from App.database.models import AuditLog
+
+# Columns served by the admin log views, in output order
+LOG_COLUMNS = (
+    AuditLog.id,
+    AuditLog.username,
+    AuditLog.event_type,
+    AuditLog.endpoint,
+    AuditLog.risk_score,
+    AuditLog.decision,
+    AuditLog.ip,
+    AuditLog.user_agent,
+    AuditLog.details,
+    AuditLog.suspicious,
+    AuditLog.timestamp,
+)
+LOG_FIELDS = tuple(col.key for col in LOG_COLUMNS)
+
+MAX_PAGE_SIZE = 1000
+# Path whose api_call rows from the poller itself `logs_etag` ignores
+LOG_POLL_ENDPOINT = "/admin/logs"
+
+
+@dataclass
+class LogFilters:
+    username: str | None = None
+    event_type: str | None = None
+    decision: str | None = None
+    suspicious: int | None = None
+    since: datetime | None = None
+    until: datetime | None = None
+
+    def apply(self, stmt):
+        if self.username is not None:
+            stmt = stmt.where(AuditLog.username == self.username)
+        if self.event_type is not None:
+            stmt = stmt.where(AuditLog.event_type == self.event_type)
+        if self.decision is not None:
+            stmt = stmt.where(AuditLog.decision == self.decision)
+        if self.suspicious is not None:
+            stmt = stmt.where(AuditLog.suspicious == self.suspicious)
+        if self.since is not None:
+            stmt = stmt.where(AuditLog.timestamp >= self.since)
+        if self.until is not None:
+            stmt = stmt.where(AuditLog.timestamp < self.until)
+        return stmt
+
+    def matches(self, row) -> bool:
+        """The same test as `apply`, for a row already in memory."""
+        if self.username is not None and row.username != self.username:
+            return False
+        if self.event_type is not None and row.event_type != self.event_type:
+            return False
+        if self.decision is not None and row.decision != self.decision:
+            return False
+        if self.suspicious is not None and row.suspicious != self.suspicious:
+            return False
+        if self.since is not None and (row.timestamp is None or row.timestamp < self.since):
+            return False
+        if self.until is not None and (row.timestamp is None or row.timestamp >= self.until):
+            return False
+        return True
+
+
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{log_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of `encode_cursor`; raises ValueError for a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, log_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(log_id)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def serialize_row(row) -> dict:
+    out = dict(zip(LOG_FIELDS, row))
+    ts = out["timestamp"]
+    out["timestamp"] = ts.isoformat() if ts else None
+    return out
+
+
+def _page_stmt(filters: LogFilters, after: tuple[datetime, int] | None, limit: int):
+    # newest first; (timestamp, id) is the keyset so equal timestamps page stably
+    stmt = filters.apply(select(*LOG_COLUMNS))
+    if after is not None:
+        ts, log_id = after
+        stmt = stmt.where(or_(AuditLog.timestamp < ts, and_(AuditLog.timestamp == ts, AuditLog.id < log_id)))
+    return stmt.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit)
+
+
+def query_logs(
+    db: Session,
+    filters: LogFilters | None = None,
+    *,
+    limit: int = 200,
+    cursor: str | None = None,
+    include_archive: bool = True,
+) -> tuple[list[dict], str | None]:
+    """Return one page of serialized logs and the cursor for the next page (or None).
+
+    When the hot table runs out before the page is full, the page continues
+    into the archived segments, which only hold older days.
+    """
+    filters = filters or LogFilters()
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+    rows = db.execute(_page_stmt(filters, after, limit + 1)).all()
+    if len(rows) <= limit and include_archive:
+        from App.core.audit_archive import iter_archived
+
+        archive_after = (rows[-1].timestamp, rows[-1].id) if rows else after
+        with closing(iter_archived(filters, archive_after)) as archived:
+            rows += list(islice(archived, limit + 1 - len(rows)))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.timestamp, last.id)
+    return [serialize_row(r) for r in rows], next_cursor
+
+
+def query_since(db: Session, filters: LogFilters | None, since_id: int, *, limit: int = 200) -> list[dict]:
+    """Serialized logs with an id above `since_id`, oldest first.
+
+    A poller passes the highest id it has seen and gets only the rows added
+    since, through the primary key index. A full page means more may follow.
+    Archived rows are always older than the hot table, so they never qualify.
+    """
+    filters = filters or LogFilters()
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    stmt = filters.apply(select(*LOG_COLUMNS)).where(AuditLog.id > since_id).order_by(AuditLog.id).limit(limit)
+    return [serialize_row(r) for r in db.execute(stmt).all()]
+
+
+def latest_id(db: Session, filters: LogFilters | None = None, *, ignore_polls_by: str | None = None) -> int:
+    """Highest audit log id matching `filters` (0 when none do).
+
+    With `ignore_polls_by`, that user's own api_call rows for /admin/logs don't count.
+    """
+    stmt = (filters or LogFilters()).apply(select(func.max(AuditLog.id)))
+    if ignore_polls_by is not None:
+        stmt = stmt.where(or_(
+            AuditLog.username.is_distinct_from(ignore_polls_by),
+            AuditLog.event_type.is_distinct_from("api_call"),
+            AuditLog.endpoint.is_distinct_from(LOG_POLL_ENDPOINT),
+        ))
+    return db.execute(stmt).scalar() or 0
+
+
+def logs_etag(db: Session, filters: LogFilters | None = None, *, poller: str | None = None, **params) -> str:
+    """Weak ETag for a log view: the newest matching id, the archive version and a digest of the request.
+
+    Audit rows are never updated. The view changes when a newer matching row
+    is written, or when archiving or retention moves or deletes rows, which
+    changes the archive version. The poller's own /admin/logs calls are
+    logged before the view is read, so they are left out of the id; they
+    still appear in the rows, which is why the tag is weak.
+    """
+    from App.core.audit_archive import archive_version
+
+    filters = filters or LogFilters()
+    key = repr((astuple(filters), sorted(params.items()))).encode()
+    newest = latest_id(db, filters, ignore_polls_by=poller)
+    return f'W/"{newest}-{archive_version()}-{hashlib.sha1(key).hexdigest()[:16]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match compares weakly: W/ prefixes are ignored on both sides
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def iter_logs(db: Session, filters: LogFilters | None = None, *, chunk_size: int = 1000, include_archive: bool = True):
+    """Yield chunks of raw rows for the filtered logs, newest first.
+
+    Each chunk is a separate keyset query, so memory stays bounded by
+    `chunk_size` however many rows match. Archived rows follow the hot
+    table unless `include_archive` is False.
+    """
+    filters = filters or LogFilters()
+    after = None
+    while True:
+        rows = db.execute(_page_stmt(filters, after, chunk_size)).all()
+        if rows:
+            yield rows
+            after = (rows[-1].timestamp, rows[-1].id)
+        if len(rows) < chunk_size:
+            break
+
+    if include_archive:
+        from App.core.audit_archive import iter_archived
+
+        with closing(iter_archived(filters, after)) as archived:
+            while True:
+                rows = list(islice(archived, chunk_size))
+                if not rows:
+                    return
+                yield rows
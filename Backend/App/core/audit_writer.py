@@ -0,0 +1,209 @@
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import insert
+from App.database.models import AuditLog
+from App.core.token_usage import record_token_use
+from App.core.audit_rollup import record_rollups
+from App.core.event_bus import event_bus
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """Background writer that persists audit rows in bulk.
+
+    `log_access` hands rows to `enqueue` instead of committing them inside the
+    request. A daemon thread drains the bounded queue and writes a batch with a
+    single bulk INSERT once `batch_size` rows are waiting or `flush_interval`
+    seconds have passed. When the queue is full, `enqueue` blocks for up to
+    `put_timeout` seconds and then reports failure so the caller can write the
+    row synchronously instead of dropping it.
+    """
+
+    def __init__(self, session_factory, *, max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.5, put_timeout: float = 0.05):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._write_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        # jti -> {ip: rows not yet flushed}, so reuse checks see queued rows
+        self._pending_ips: dict[str, dict[str, int]] = {}
+        self.enqueued = 0
+        self.flushed = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the background thread and flush everything still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def enqueue(self, row: dict) -> bool:
+        jti, ip = row.get("jti"), row.get("ip")
+        pending = {(jti, ip, None): [row]} if jti and ip else {}
+        # register the pending use before the row becomes visible to the writer
+        with self._pending_lock:
+            for (jti, ip, _) in pending:
+                ips = self._pending_ips.setdefault(jti, {})
+                ips[ip] = ips.get(ip, 0) + 1
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            self._release_pending(pending)
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def pending_ips(self, jti: str) -> set:
+        with self._pending_lock:
+            return set(self._pending_ips.get(jti, ()))
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self) -> int:
+        """Synchronously write everything currently queued."""
+        written = 0
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return written
+            self._persist(batch)
+            written += len(batch)
+
+    def _drain(self, limit: int) -> list:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                batch.extend(self._drain(self.batch_size - len(batch)))
+            if batch:
+                self._persist(batch)
+
+    def _persist(self, batch: list):
+        """Write a batch, retrying it once and then row by row so a bad row only loses itself."""
+        try:
+            for attempt in range(2):
+                try:
+                    self._write(batch)
+                    return
+                except Exception:
+                    logger.warning("audit writer failed to flush %d rows (attempt %d)", len(batch), attempt + 1,
+                                   exc_info=True)
+            lost = 0
+            for row in batch:
+                try:
+                    self._write([row])
+                except Exception:
+                    lost += 1
+                    logger.exception("audit writer dropped a row: %r", row)
+            if lost:
+                logger.error("audit writer lost %d of %d rows", lost, len(batch))
+        finally:
+            self._release_pending(self._split(batch)[1])
+
+    @staticmethod
+    def _split(batch: list) -> tuple[list, dict]:
+        """The audit rows without their jti, and the token uses by (jti, ip, user agent)."""
+        rows = []
+        token_uses = defaultdict(list)
+        for row in batch:
+            row = dict(row)
+            jti = row.pop("jti", None)
+            rows.append(row)
+            if jti:
+                token_uses[(jti, row.get("ip"), row.get("user_agent"))].append(row)
+        return rows, token_uses
+
+    def _write(self, batch: list):
+        rows, token_uses = self._split(batch)
+        with self._write_lock:
+            db = self.session_factory()
+            try:
+                if event_bus.active:
+                    # the stream needs ids; RETURNING keeps this a single bulk insert
+                    ids = db.execute(insert(AuditLog).returning(AuditLog.id, sort_by_parameter_order=True),
+                                     rows).scalars().all()
+                else:
+                    ids = None
+                    db.execute(insert(AuditLog), rows)
+                for (jti, ip, user_agent), uses in token_uses.items():
+                    record_token_use(db, jti, username=uses[0].get("username"), ip=ip, user_agent=user_agent,
+                                     seen_at=uses[-1].get("timestamp"), count=len(uses))
+                # one upsert per distinct (minute, dimension, key) in the batch
+                record_rollups(db, rows)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            self.flushed += len(rows)
+        if ids is not None:
+            for row, row_id in zip(rows, ids):
+                event_bus.publish({**row, "id": row_id})
+
+    def _release_pending(self, token_uses: dict):
+        with self._pending_lock:
+            for (jti, ip, _), uses in token_uses.items():
+                ips = self._pending_ips.get(jti)
+                if not ips or ip not in ips:
+                    continue
+                ips[ip] -= len(uses)
+                if ips[ip] <= 0:
+                    del ips[ip]
+                if not ips:
+                    del self._pending_ips[jti]
+
+
+def _default_writer() -> AuditWriter:
+    from App.config import AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL
+    from App.database.session import SessionLocal
+
+    return AuditWriter(
+        SessionLocal,
+        max_queue=AUDIT_QUEUE_SIZE,
+        batch_size=AUDIT_BATCH_SIZE,
+        flush_interval=AUDIT_FLUSH_INTERVAL,
+    )
+
+
+audit_writer = _default_writer()
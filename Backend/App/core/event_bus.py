@@ -0,0 +1,174 @@
+"""In-process pub/sub for audit events, served at /admin/logs/stream.
+
+`log_access` (and the batched audit writer, once its rows have ids)
+publishes every committed event here. Each open dashboard is a
+`Subscription` with its own filters and a bounded buffer. Events that do
+not match are never buffered. When a slow client lets its buffer fill up,
+the oldest events are dropped and counted, and the stream tells the client
+how many it missed.
+
+An event is serialized at most once, however many subscribers receive it.
+Publishing is a no-op while nobody is subscribed.
+
+A reconnecting client sends Last-Event-ID (the audit log id of the last event
+it saw). The stream first replays newer rows from the database and then
+switches to live events, skipping any it has already replayed.
+
+The bus is per process. With several workers, each dashboard sees the
+events written by the worker it is connected to, and replay from the
+database fills in the rest on reconnect.
+"""
+import asyncio
+import json
+import threading
+from collections import deque, namedtuple
+from fastapi import HTTPException, status
+from App.core.audit_query import LOG_FIELDS, LogFilters, serialize_row
+
+LiveRow = namedtuple("LiveRow", LOG_FIELDS)
+
+
+class Event:
+    __slots__ = ("id", "row", "_data")
+
+    def __init__(self, row: LiveRow):
+        self.id = row.id
+        self.row = row
+        self._data = None
+
+    @property
+    def data(self) -> str:
+        if self._data is None:
+            self._data = json.dumps(serialize_row(self.row))
+        return self._data
+
+
+def format_sse(event_type: str, data: str, event_id: int | None = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event_type}\ndata: {data}\n\n"
+
+
+class Subscription:
+    def __init__(self, bus: "EventBus", filters: LogFilters, buffer_size: int, loop: asyncio.AbstractEventLoop):
+        self.bus = bus
+        self.filters = filters
+        self.buffer_size = buffer_size
+        self.dropped = 0
+        self.after_id = 0  # events up to this id were already sent (replay)
+        self._buffer: deque[Event] = deque()
+        self._unreported = 0
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._waiting = False
+
+    def _offer(self, event: Event):
+        # called with the bus lock held, from whichever thread published
+        if not self.filters.matches(event.row):
+            return
+        if len(self._buffer) >= self.buffer_size:
+            self._buffer.popleft()
+            self.dropped += 1
+            self._unreported += 1
+        self._buffer.append(event)
+        if self._waiting:
+            self._waiting = False
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def next_batch(self, timeout: float) -> tuple[list[Event], int]:
+        """Buffered events (waiting up to `timeout` for one) and the drops since the last call."""
+        with self.bus._lock:
+            if not self._buffer:
+                self._wakeup.clear()
+                self._waiting = True
+        if self._waiting:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        with self.bus._lock:
+            self._waiting = False
+            events = [e for e in self._buffer if e.id is None or e.id > self.after_id]
+            self._buffer.clear()
+            dropped, self._unreported = self._unreported, 0
+        return events, dropped
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self, buffer_size: int = 1000, max_subscribers: int = 1000):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: list[Subscription] = []
+        self._lock = threading.Lock()
+        self.published = 0
+
+    @property
+    def active(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self, filters: LogFilters | None = None, loop: asyncio.AbstractEventLoop | None = None,
+                  buffer_size: int | None = None) -> Subscription:
+        sub = Subscription(self, filters or LogFilters(), buffer_size or self.buffer_size,
+                           loop or asyncio.get_running_loop())
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Too many event stream subscribers")
+            # copy on write so publishers can iterate without holding the list
+            self._subscribers = self._subscribers + [sub]
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not sub]
+
+    def publish(self, row: dict):
+        """Fan an audit row (a dict with the LOG_FIELDS keys) out to the matching subscribers."""
+        if not self._subscribers:
+            return
+        event = Event(LiveRow(**{field: row.get(field) for field in LOG_FIELDS}))
+        with self._lock:
+            for sub in self._subscribers:
+                sub._offer(event)
+            self.published += 1
+
+    def stats(self) -> dict:
+        subscribers = self._subscribers
+        return {
+            "subscribers": len(subscribers),
+            "published": self.published,
+            "dropped": sum(s.dropped for s in subscribers),
+        }
+
+
+async def stream(sub: Subscription, replay=(), truncated: bool = False, heartbeat: float = 15.0):
+    """SSE body: replayed rows, then live events with drop notices and heartbeats."""
+    try:
+        for row in replay:
+            event = Event(LiveRow(*row))
+            sub.after_id = max(sub.after_id, event.id)
+            yield format_sse("audit", event.data, event.id)
+        if truncated:
+            # more rows are missing than a replay covers; the client should page /admin/logs
+            yield format_sse("truncated", json.dumps({"last_id": sub.after_id}))
+        while True:
+            events, dropped = await sub.next_batch(heartbeat)
+            if dropped:
+                yield format_sse("dropped", json.dumps({"dropped": dropped}))
+            if events:
+                yield "".join(format_sse("audit", e.data, e.id) for e in events)
+            elif not dropped:
+                yield ": ping\n\n"
+    finally:
+        sub.close()
+
+
+def _default_bus() -> EventBus:
+    from App.config import EVENT_STREAM_BUFFER, EVENT_STREAM_MAX_SUBSCRIBERS
+
+    return EventBus(EVENT_STREAM_BUFFER, EVENT_STREAM_MAX_SUBSCRIBERS)
+
+
+event_bus = _default_bus()
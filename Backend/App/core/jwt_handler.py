@@ -3,12 +3,18 @@ from jose import jwt
 from jose.exceptions import JWTError, ExpiredSignatureError
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException, status
-from App.config import JWT_SECRET, JWT_ALGORITHM, JWT_EXP_MINUTES
+from App.config import JWT_SECRET, JWT_ALGORITHM, JWT_EXP_MINUTES, TOKEN_CACHE_SIZE
+from collections import OrderedDict
+import hashlib
+import threading
 import uuid
 
 # Refresh token life (days)
 REFRESH_EXP_DAYS = 7
 
+# Clock-skew tolerance applied to `exp`
+EXP_LEEWAY_SECONDS = 60
+
 
 def _now_utc() -> datetime:
     return datetime.now(timezone.utc)
@@ -38,7 +44,105 @@ def create_refresh_token(data: dict, expires_days: int | None = None):
     return token
 
 
+class _VerifiedTokenCache:
+    """Bounded LRU of verified access-token payloads keyed by a SHA-256 digest.
+
+    Entries live until the token's `exp` plus leeway, so a cached token
+    expires exactly when a fresh decode would start rejecting it.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._by_jti: dict[str, set] = {}
+
+    def get(self, digest: bytes, now_ts: int):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                payload, expires_at = entry
+                if expires_at is None or now_ts <= expires_at:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return payload
+                self._remove(digest)
+            self.misses += 1
+            return None
+
+    def put(self, digest: bytes, payload: dict):
+        if self.max_size <= 0:
+            return
+        exp = payload.get("exp")
+        expires_at = int(exp) + EXP_LEEWAY_SECONDS if exp is not None else None
+        jti = payload.get("jti")
+        with self._lock:
+            self._entries[digest] = (payload, expires_at)
+            self._entries.move_to_end(digest)
+            if jti:
+                self._by_jti.setdefault(jti, set()).add(digest)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def evict_jti(self, jti: str) -> int:
+        with self._lock:
+            digests = self._by_jti.pop(jti, set())
+            for digest in digests:
+                self._entries.pop(digest, None)
+            return len(digests)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_jti.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, digest: bytes):
+        entry = self._entries.pop(digest, None)
+        if entry is None:
+            return
+        jti = entry[0].get("jti")
+        digests = self._by_jti.get(jti)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_jti[jti]
+
+
+_token_cache = _VerifiedTokenCache(TOKEN_CACHE_SIZE)
+
+
+def token_cache_stats() -> dict:
+    return _token_cache.stats()
+
+
+def evict_cached_jti(jti: str) -> int:
+    """Drop cached payloads for `jti`, e.g. when the token is revoked."""
+    return _token_cache.evict_jti(jti)
+
+
+def clear_token_cache():
+    _token_cache.clear()
+
+
 def decode_access_token(token: str):
+    digest = hashlib.sha256(token.encode()).digest()
+    cached = _token_cache.get(digest, int(_now_utc().timestamp()))
+    if cached is not None:
+        return dict(cached)
+    payload = _decode_access_token(token)
+    _token_cache.put(digest, dict(payload))
+    return payload
+
+
+def _decode_access_token(token: str):
     try:
         # python-jose doesn't accept a `leeway` kwarg in decode; decode without exp verification
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM], options={"verify_exp": False})
@@ -46,7 +150,7 @@ def decode_access_token(token: str):
         exp = payload.get("exp")
         if exp is not None:
             now_ts = int(_now_utc().timestamp())
-            if now_ts > int(exp) + 60:
+            if now_ts > int(exp) + EXP_LEEWAY_SECONDS:
                 raise ExpiredSignatureError()
         return payload
     except ExpiredSignatureError:
@@ -61,7 +165,7 @@ def decode_refresh_token(token: str):
         exp = payload.get("exp")
         if exp is not None:
             now_ts = int(_now_utc().timestamp())
-            if now_ts > int(exp) + 60:
+            if now_ts > int(exp) + EXP_LEEWAY_SECONDS:
                 raise ExpiredSignatureError()
         return payload
     except ExpiredSignatureError:
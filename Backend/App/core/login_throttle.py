@@ -0,0 +1,289 @@
+"""Pre-authentication throttling for the password login routes.
+
+`/token` and `/login` call `login_throttle.check` before the user lookup and
+bcrypt verify. Each attempt takes a token from two buckets, one for the
+client IP and one for the username. An empty bucket, or a key that is locked
+out, is rejected with 429 and Retry-After, which costs a dict lookup
+instead of a bcrypt round.
+
+Failed attempts escalate per key. After LOGIN_LOCKOUT_AFTER failures (for
+usernames) or LOGIN_IP_LOCKOUT_AFTER failures (for IPs) the key is locked for
+LOGIN_LOCKOUT_BASE_SECONDS, doubling with each further failure up to
+LOGIN_LOCKOUT_MAX_SECONDS. A successful login clears the username's failures.
+
+Rejected attempts are not audited one by one. Each key reports at most one
+`login_throttled` event per LOGIN_THROTTLE_REPORT_SECONDS, carrying the
+number of attempts blocked since its last report. Counts held back when an
+attack stops are written by `LoginThrottleReporter`, which sweeps the keys
+with unreported attempts on the same interval.
+
+State is per process, bounded to LOGIN_THROTTLE_MAX_KEYS keys (least
+recently used keys are dropped first).
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, status
+from App import config
+
+logger = logging.getLogger(__name__)
+
+
+class LoginThrottled(HTTPException):
+    """A login attempt rejected before any password work."""
+
+    def __init__(self, retry_after: float, key: str, blocked: int = 0):
+        seconds = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(seconds)},
+        )
+        self.retry_after = seconds
+        self.key = key
+        # attempts to report in an audit event now; 0 while the report is held back
+        self.blocked = blocked
+
+    @property
+    def details(self) -> str:
+        return f"{self.key} blocked:{self.blocked} retry_after:{self.retry_after}"
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "failures", "locked_until", "blocked", "reported_at", "route")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+        self.failures = 0
+        self.locked_until = 0.0
+        self.blocked = 0
+        self.reported_at = None
+        self.route = None
+
+class _Limit:
+    __slots__ = ("rate", "burst", "lockout_after")
+
+    def __init__(self, per_minute: float, burst: int, lockout_after: int):
+        self.rate = per_minute / 60.0
+        self.burst = float(burst)
+        self.lockout_after = lockout_after
+
+
+class LoginThrottle:
+    def __init__(self, enabled: bool = True, *, ip_per_minute: float = 30, ip_burst: int = 30,
+                 ip_lockout_after: int = 20, user_per_minute: float = 5, user_burst: int = 5,
+                 user_lockout_after: int = 5, lockout_base: float = 30.0, lockout_max: float = 3600.0,
+                 report_interval: float = 60.0, max_keys: int = 100_000):
+        self.enabled = enabled
+        self.limits = {
+            "ip": _Limit(ip_per_minute, ip_burst, ip_lockout_after),
+            "user": _Limit(user_per_minute, user_burst, user_lockout_after),
+        }
+        self.lockout_base = lockout_base
+        self.lockout_max = lockout_max
+        self.report_interval = report_interval
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, _Bucket] = OrderedDict()
+        # keys holding blocked attempts that have not been reported yet
+        self._unreported: set[str] = set()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.lockouts = 0
+
+    @staticmethod
+    def _keys(ip: str | None, username: str | None):
+        if ip:
+            yield "ip", f"ip:{ip}"
+        if username:
+            yield "user", f"user:{username[:254]}"
+
+    def _bucket(self, key: str, limit: _Limit, now: float) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(limit.burst, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return bucket
+        self._buckets.move_to_end(key)
+        elapsed = now - bucket.updated
+        if elapsed > 0:
+            bucket.tokens = min(limit.burst, bucket.tokens + elapsed * limit.rate)
+            bucket.updated = now
+            # a key quiet for a full maximum lockout starts over
+            if elapsed >= self.lockout_max:
+                bucket.failures = 0
+        return bucket
+
+    def _wait(self, bucket: _Bucket, limit: _Limit, now: float) -> float:
+        if bucket.locked_until > now:
+            return bucket.locked_until - now
+        if bucket.tokens < 1:
+            return (1 - bucket.tokens) / limit.rate if limit.rate > 0 else self.lockout_max
+        return 0.0
+
+    def check(self, ip: str | None, username: str | None, now: float | None = None, *, route: str | None = None):
+        """Take one attempt from the IP and username buckets or raise `LoginThrottled`."""
+        if not self.enabled:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            buckets = [(key, self._bucket(key, self.limits[kind], now), self.limits[kind])
+                       for kind, key in self._keys(ip, username)]
+            for key, bucket, limit in buckets:
+                wait = self._wait(bucket, limit, now)
+                if wait > 0:
+                    self.rejected += 1
+                    bucket.blocked += 1
+                    bucket.route = route
+                    blocked = 0
+                    if bucket.reported_at is None or now - bucket.reported_at >= self.report_interval:
+                        blocked, bucket.blocked, bucket.reported_at = bucket.blocked, 0, now
+                        self._unreported.discard(key)
+                    else:
+                        self._unreported.add(key)
+                    raise LoginThrottled(wait, key, blocked)
+            for _, bucket, _ in buckets:
+                bucket.tokens -= 1
+            self.allowed += 1
+
+    def due_reports(self, now: float | None = None) -> list[tuple[str, int, str | None]]:
+        """Take the held-back blocked counts whose report interval has passed, as (key, blocked, route)."""
+        now = time.monotonic() if now is None else now
+        due = []
+        with self._lock:
+            for key in list(self._unreported):
+                bucket = self._buckets.get(key)
+                if bucket is None or not bucket.blocked:
+                    self._unreported.discard(key)
+                elif bucket.reported_at is None or now - bucket.reported_at >= self.report_interval:
+                    due.append((key, bucket.blocked, bucket.route))
+                    bucket.blocked, bucket.reported_at = 0, now
+                    self._unreported.discard(key)
+        return due
+
+    def report_due(self, db, now: float | None = None) -> int:
+        """Audit the due held-back counts as `login_throttled` events; returns how many were written."""
+        from App.core.audit_logger import log_access
+
+        due = self.due_reports(now)
+        for key, blocked, route in due:
+            kind, _, value = key.partition(":")
+            log_access(db, value if kind == "user" else None, route, None, "throttled", event_type="login_throttled",
+                       ip=value if kind == "ip" else None, details=f"{key} blocked:{blocked}", suspicious=1)
+        return len(due)
+
+    def record_failure(self, ip: str | None, username: str | None, now: float | None = None):
+        if not self.enabled:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for kind, key in self._keys(ip, username):
+                limit = self.limits[kind]
+                bucket = self._bucket(key, limit, now)
+                bucket.failures += 1
+                over = bucket.failures - limit.lockout_after
+                if over >= 0:
+                    lockout = min(self.lockout_max, self.lockout_base * 2 ** min(over, 32))
+                    bucket.locked_until = max(bucket.locked_until, now + lockout)
+                    self.lockouts += 1
+
+    def record_success(self, ip: str | None, username: str | None):
+        # only the account's streak is cleared; one good password must not
+        # reset the budget of an address that is spraying other accounts
+        if not self.enabled or not username:
+            return
+        with self._lock:
+            bucket = self._buckets.get(f"user:{username[:254]}")
+            if bucket is not None:
+                bucket.failures = 0
+                bucket.locked_until = 0.0
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            locked = sum(1 for b in self._buckets.values() if b.locked_until > now)
+            return {
+                "enabled": self.enabled,
+                "keys": len(self._buckets),
+                "locked_keys": locked,
+                "allowed": self.allowed,
+                "rejected": self.rejected,
+                "lockouts": self.lockouts,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._unreported.clear()
+
+
+class LoginThrottleReporter:
+    """Background thread running `LoginThrottle.report_due` every `interval` seconds."""
+
+    def __init__(self, throttle: LoginThrottle, session_factory, interval: float = 60.0):
+        self.throttle = throttle
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or self.interval <= 0 or not self.throttle.enabled:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="login-throttle-reporter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the thread and write out every held-back count, due or not."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+            self.report_once(now=math.inf)
+
+    def report_once(self, now: float | None = None) -> int:
+        db = self.session_factory()
+        try:
+            return self.throttle.report_due(db, now)
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.report_once()
+            except Exception:
+                logger.exception("login throttle report failed")
+
+
+login_throttle = LoginThrottle(
+    config.LOGIN_THROTTLE_ENABLED,
+    ip_per_minute=config.LOGIN_IP_PER_MINUTE,
+    ip_burst=config.LOGIN_IP_BURST,
+    ip_lockout_after=config.LOGIN_IP_LOCKOUT_AFTER,
+    user_per_minute=config.LOGIN_USER_PER_MINUTE,
+    user_burst=config.LOGIN_USER_BURST,
+    user_lockout_after=config.LOGIN_LOCKOUT_AFTER,
+    lockout_base=config.LOGIN_LOCKOUT_BASE_SECONDS,
+    lockout_max=config.LOGIN_LOCKOUT_MAX_SECONDS,
+    report_interval=config.LOGIN_THROTTLE_REPORT_SECONDS,
+    max_keys=config.LOGIN_THROTTLE_MAX_KEYS,
+)
+
+
+def _default_reporter() -> LoginThrottleReporter:
+    from App.database.session import SessionLocal
+
+    return LoginThrottleReporter(login_throttle, SessionLocal, interval=config.LOGIN_THROTTLE_REPORT_SECONDS)
+
+
+login_throttle_reporter = _default_reporter()
@@ -0,0 +1,235 @@
+"""Config-driven risk policy: endpoint sensitivity patterns and decision thresholds.
+
+A policy file is JSON (or YAML, when PyYAML is installed):
+
+    {
+      "sensitivity": {
+        "/admin/**": 35,
+        "/admin/logs": 35,
+        "/user/{user_id}/settings": 10,
+        "/user/*": 5
+      },
+      "thresholds": {"allow": 30, "allow+log": 60}
+    }
+
+Patterns are matched segment by segment. `*` (or a `{param}` segment)
+matches exactly one segment and `**` matches any number of segments,
+including none. When several patterns match, the most specific one wins,
+comparing left to right: a literal segment beats `*`, which beats `**`.
+Segments are compared as-is, so "/admin/logs/" is not "/admin/logs".
+Paths no pattern matches have sensitivity 0. Scores up to `allow` are
+allowed, up to `allow+log` are allowed and logged, the rest are denied.
+
+The patterns are compiled into a trie, so resolving a path costs about one
+dict lookup per segment however many patterns there are, and resolved
+paths are kept in an LRU cache.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from App.config import RISK_POLICY_FILE, RISK_POLICY_RELOAD_SECONDS, RISK_POLICY_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class PolicyError(ValueError):
+    """The policy file could not be parsed or is not a valid policy."""
+
+
+class _Node:
+    __slots__ = ("children", "star", "globstar", "value")
+
+    def __init__(self):
+        self.children = {}
+        self.star = None
+        self.globstar = None
+        self.value = None
+
+
+def _segments(path: str) -> list[str]:
+    # no normalisation: a pattern without wildcards matches exactly the same
+    # strings as plain equality, which the batch scorer relies on
+    return path.split("/")
+
+
+class RiskPolicy:
+    """A compiled policy; immutable once built, so it can be shared freely."""
+
+    def __init__(self, rules: dict | None = None, allow_max: int = 30, log_max: int = 60,
+                 cache_size: int = RISK_POLICY_CACHE_SIZE):
+        if rules is None:
+            from App.core.risk_engine import SENSITIVITY_MAP
+
+            rules = SENSITIVITY_MAP
+        if allow_max > log_max:
+            raise PolicyError("the allow threshold must not exceed the allow+log threshold")
+        self.rules = dict(rules)
+        self.allow_max = int(allow_max)
+        self.log_max = int(log_max)
+        self.cache_size = cache_size
+        self._root = _Node()
+        self.exact = True  # no wildcard patterns: plain path equality is enough
+        for pattern, sensitivity in self.rules.items():
+            self._insert(pattern, sensitivity)
+        self.sensitivity = lru_cache(maxsize=cache_size)(self._resolve)
+
+    def __reduce__(self):
+        # the lru_cache wrapper can't be pickled; rebuild from the rules instead
+        return (RiskPolicy, (self.rules, self.allow_max, self.log_max, self.cache_size))
+
+    def __eq__(self, other):
+        if not isinstance(other, RiskPolicy):
+            return NotImplemented
+        return (self.rules, self.allow_max, self.log_max) == (other.rules, other.allow_max, other.log_max)
+
+    @classmethod
+    def from_dict(cls, data: dict, cache_size: int = RISK_POLICY_CACHE_SIZE) -> "RiskPolicy":
+        if not isinstance(data, dict):
+            raise PolicyError("a policy must be a mapping")
+        thresholds = data.get("thresholds") or {}
+        try:
+            return cls(
+                data.get("sensitivity"),
+                int(thresholds.get("allow", 30)),
+                int(thresholds.get("allow+log", 60)),
+                cache_size,
+            )
+        except (TypeError, ValueError) as exc:
+            raise PolicyError(str(exc)) from exc
+
+    @classmethod
+    def from_file(cls, path: str, cache_size: int = RISK_POLICY_CACHE_SIZE) -> "RiskPolicy":
+        with open(path, encoding="utf-8") as fh:
+            text = fh.read()
+        try:
+            if path.endswith((".yml", ".yaml")):
+                try:
+                    import yaml
+                except ImportError as exc:
+                    raise PolicyError("PyYAML is required for YAML policy files") from exc
+                data = yaml.safe_load(text)
+            else:
+                data = json.loads(text)
+        except PolicyError:
+            raise
+        except Exception as exc:
+            raise PolicyError(f"cannot parse {path}: {exc}") from exc
+        return cls.from_dict(data, cache_size)
+
+    def _insert(self, pattern: str, sensitivity):
+        if not isinstance(sensitivity, int) or isinstance(sensitivity, bool):
+            raise PolicyError(f"sensitivity for {pattern!r} must be an integer")
+        node = self._root
+        for seg in _segments(pattern):
+            if seg == "**":
+                node.globstar = node.globstar or _Node()
+                node = node.globstar
+                self.exact = False
+            elif seg == "*" or (seg.startswith("{") and seg.endswith("}")):
+                node.star = node.star or _Node()
+                node = node.star
+                self.exact = False
+            else:
+                node = node.children.setdefault(seg, _Node())
+        node.value = sensitivity
+
+    def _resolve(self, path: str) -> int:
+        value = self._match(self._root, _segments(path or ""), 0)
+        return 0 if value is None else value
+
+    def _match(self, node: _Node, segs: list, i: int):
+        if i == len(segs) and node.value is not None:
+            return node.value
+        if i < len(segs):
+            child = node.children.get(segs[i])
+            if child is not None:
+                value = self._match(child, segs, i + 1)
+                if value is not None:
+                    return value
+            if node.star is not None:
+                value = self._match(node.star, segs, i + 1)
+                if value is not None:
+                    return value
+        if node.globstar is not None:
+            for j in range(i, len(segs) + 1):
+                value = self._match(node.globstar, segs, j)
+                if value is not None:
+                    return value
+        return None
+
+    def decision(self, risk_score: int) -> str:
+        if risk_score <= self.allow_max:
+            return "allow"
+        if risk_score <= self.log_max:
+            return "allow+log"
+        return "deny"
+
+    def cache_info(self):
+        return self.sensitivity.cache_info()
+
+
+class PolicyManager:
+    """Holds the active policy and reloads it when the policy file changes.
+
+    The file's mtime is checked at most every `reload_interval` seconds from
+    `current()`, so hot reload costs nothing on most requests. A file that
+    fails to load is logged and the previous policy stays active.
+    """
+
+    def __init__(self, path: str | None = None, reload_interval: float = 2.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._policy = None
+        self._mtime = None
+        self._checked = 0.0
+
+    def current(self) -> RiskPolicy:
+        policy = self._policy
+        if policy is not None and (not self.path or time.monotonic() - self._checked < self.reload_interval):
+            return policy
+        with self._lock:
+            if self._policy is None or self.path:
+                self._refresh()
+            return self._policy
+
+    def _refresh(self):
+        self._checked = time.monotonic()
+        if not self.path:
+            if self._policy is None:
+                self._policy = RiskPolicy()
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            logger.warning("risk policy %s not found; keeping the current policy", self.path)
+            self._policy = self._policy or RiskPolicy()
+            return
+        if mtime == self._mtime and self._policy is not None:
+            return
+        try:
+            self._policy = RiskPolicy.from_file(self.path)
+            self.reloads += 1
+        except (OSError, PolicyError):
+            logger.exception("failed to load risk policy %s; keeping the current policy", self.path)
+            self._policy = self._policy or RiskPolicy()
+        self._mtime = mtime
+
+    def load(self, path: str | None):
+        """Switch to `path` (None for the built-in policy) and load it now."""
+        with self._lock:
+            self.path = path
+            self._policy = None
+            self._mtime = None
+            self._refresh()
+
+
+policy_manager = PolicyManager(RISK_POLICY_FILE or None, RISK_POLICY_RELOAD_SECONDS)
+
+
+def active_policy() -> RiskPolicy:
+    return policy_manager.current()
@@ -0,0 +1,237 @@
+"""Opt-in slow-request profiler.
+
+While at least one request is in flight, a background thread samples the
+call stacks of every busy thread every PROFILER_INTERVAL_MS. When a request
+finishes, the samples taken during it are kept only if the request was slower
+than PROFILER_THRESHOLD_MS or was picked by PROFILER_SAMPLE_RATE. They are
+folded into per-stack counts and saved with the route, user and stage timings.
+The sampler sleeps whenever nothing is in flight, and fast requests simply
+let their samples age out of a bounded buffer, with no disk I/O.
+
+Profiles are JSON files in a bounded on-disk ring (PROFILER_MAX_FILES, oldest
+deleted first), listed and downloaded through /admin/profiles. The stacks can
+also be exported in collapsed "frame;frame;frame count" form for flame graph
+tools. On the async path, samples from the event loop thread include whatever
+other request was running at the time, which is usually why a request stalled.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+from App import config
+from App.core.metrics import end_trace, route_label, start_trace
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID = re.compile(r"^\d{13}-[0-9a-f]{8}$")
+MAX_STACK_DEPTH = 64
+
+# leaf frames of threads that are parked rather than working
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("_worker.py", "run"),
+}
+
+
+def _is_idle(code) -> bool:
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES
+
+
+class StackSampler:
+    """Samples all thread stacks at a fixed interval while requests are active."""
+
+    def __init__(self, interval: float = 0.005, max_samples: int = 50000):
+        self.interval = interval
+        self._samples = deque(maxlen=max_samples)  # (perf_counter, thread id, stack)
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def begin(self):
+        with self._lock:
+            self._active += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+            self._wake.set()
+
+    def end(self):
+        with self._lock:
+            self._active -= 1
+            if self._active <= 0:
+                self._active = 0
+                self._wake.clear()
+
+    def samples_between(self, start: float, end: float) -> list:
+        with self._lock:
+            return [(tid, stack) for ts, tid, stack in self._samples if start <= ts <= end]
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self._wake.wait()
+            now = time.perf_counter()
+            taken = []
+            for tid, frame in sys._current_frames().items():
+                if tid == own or _is_idle(frame.f_code):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append((frame.f_code, frame.f_lineno))
+                    frame = frame.f_back
+                taken.append((now, tid, tuple(reversed(stack))))
+            with self._lock:
+                self._samples.extend(taken)
+            time.sleep(self.interval)
+
+
+def _frame_label(code, lineno) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{lineno})"
+
+
+def fold_stacks(samples) -> list[dict]:
+    """Fold raw samples into [{"stack": "root;...;leaf", "count": n}], most frequent first."""
+    counts = Counter()
+    for _, stack in samples:
+        counts[";".join(_frame_label(code, lineno) for code, lineno in stack)] += 1
+    return [{"stack": stack, "count": count} for stack, count in counts.most_common()]
+
+
+class ProfileStore:
+    """Bounded ring of profile files; ids sort by capture time."""
+
+    def __init__(self, directory, max_files: int = 100):
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self._last_ms = 0
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str) -> Path:
+        return self.directory / f"{profile_id}.json"
+
+    def save(self, profile: dict) -> str:
+        with self._lock:
+            # strictly increasing, so ids order captures even within a millisecond
+            self._last_ms = max(int(time.time() * 1000), self._last_ms + 1)
+            profile_id = f"{self._last_ms:013d}-{uuid.uuid4().hex[:8]}"
+        profile["id"] = profile_id
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / f".{profile_id}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(profile, fh)
+        os.replace(tmp, self._path(profile_id))
+        for stale in self.ids()[self.max_files:]:
+            try:
+                self._path(stale).unlink()
+            except OSError:
+                pass
+        return profile_id
+
+    def ids(self) -> list[str]:
+        """Stored profile ids, newest first."""
+        if not self.directory.is_dir():
+            return []
+        ids = [p.stem for p in self.directory.glob("*.json") if PROFILE_ID.match(p.stem)]
+        return sorted(ids, reverse=True)
+
+    def get(self, profile_id: str) -> dict | None:
+        if not PROFILE_ID.match(profile_id or ""):
+            return None
+        try:
+            with open(self._path(profile_id), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def list(self) -> list[dict]:
+        """Profile summaries (everything but the stacks), newest first."""
+        out = []
+        for profile_id in self.ids():
+            profile = self.get(profile_id)
+            if profile is not None:
+                profile.pop("stacks", None)
+                out.append(profile)
+        return out
+
+
+class SlowRequestProfiler:
+    def __init__(self, store: ProfileStore, *, threshold_ms: float = 500.0, sample_rate: float = 0.0,
+                 interval_ms: float = 5.0, enabled: bool = False):
+        self.store = store
+        self.threshold = threshold_ms / 1000.0
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self.sampler = StackSampler(interval_ms / 1000.0)
+        self.captured = 0
+
+    def should_keep(self, duration: float, sampled: bool) -> str | None:
+        if duration >= self.threshold:
+            return "slow"
+        if sampled:
+            return "sampled"
+        return None
+
+    async def handle(self, request, call_next):
+        """HTTP middleware body: time the request and keep a profile for outliers."""
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        trace, token = start_trace()
+        self.sampler.begin()
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            finished = time.perf_counter()
+            self.sampler.end()
+            end_trace(token)
+            reason = self.should_keep(finished - started, sampled)
+            if reason:
+                profile = {
+                    "reason": reason,
+                    "method": request.method,
+                    "route": route_label(request),
+                    "path": request.url.path,
+                    "status": status,
+                    "user": trace.user,
+                    "started": started_at.isoformat(),
+                    "duration_ms": round((finished - started) * 1000, 3),
+                    "stages_ms": {k: round(v * 1000, 3) for k, v in trace.stages.items()},
+                    "interval_ms": self.sampler.interval * 1000,
+                    "stacks": fold_stacks(self.sampler.samples_between(started, finished)),
+                }
+                profile["samples"] = sum(s["count"] for s in profile["stacks"])
+                try:
+                    await asyncio.to_thread(self.store.save, profile)
+                    self.captured += 1
+                except Exception:
+                    logger.exception("failed to save request profile")
+
+
+def collapsed(profile: dict) -> str:
+    """The profile's stacks in collapsed format, one "stack count" line each."""
+    return "".join(f"{s['stack']} {s['count']}\n" for s in profile.get("stacks", ()))
+
+
+profiler = SlowRequestProfiler(
+    ProfileStore(config.PROFILER_DIR, config.PROFILER_MAX_FILES),
+    threshold_ms=config.PROFILER_THRESHOLD_MS,
+    sample_rate=config.PROFILER_SAMPLE_RATE,
+    interval_ms=config.PROFILER_INTERVAL_MS,
+    enabled=config.PROFILER_ENABLED,
+)
@@ -0,0 +1,184 @@
+"""Refresh token persistence: digests, rotation and purging.
+
+Rows hold a SHA-256 digest of each refresh token, never the token itself, so
+lookups use a fixed-size unique index and a leaked table cannot be replayed.
+Every login starts a token family (one per session). `/refresh` consumes
+the presented token and issues the next one in the same family, so a session
+keeps exactly one row. A token that still verifies but has no row was either
+rotated already or purged; if its family is still alive, an old token is
+being replayed, and the whole family is revoked.
+
+Expired rows are deleted in small batches by `RefreshTokenPurger`, so the
+table stays proportional to the number of live sessions.
+"""
+import hashlib
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from App.core.jwt_handler import REFRESH_EXP_DAYS, create_refresh_token, decode_refresh_token
+from App.database.models import RefreshToken, User
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshTokenReuse(HTTPException):
+    """A rotated refresh token was presented again; its family has been revoked."""
+
+    def __init__(self, username: str | None, family: str):
+        super().__init__(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        self.username = username
+        self.family = family
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_refresh_token(db: Session, user_id: int, username: str, family: str | None = None,
+                        now: datetime | None = None) -> str:
+    """Create a refresh token and add its row to `db`; the caller commits."""
+    now = now or datetime.utcnow()
+    jti = uuid.uuid4().hex
+    family = family or uuid.uuid4().hex
+    token = create_refresh_token({"username": username, "jti": jti, "fam": family})
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_token(token),
+        jti=jti,
+        family=family,
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_EXP_DAYS),
+    ))
+    return token
+
+
+def find_refresh_token(db: Session, token: str):
+    """The stored row and its user in one joined lookup, or None."""
+    stmt = (
+        select(RefreshToken, User)
+        .join(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.token_hash == hash_token(token))
+    )
+    return db.execute(stmt).first()
+
+
+def revoke_family(db: Session, family: str) -> int:
+    return db.execute(delete(RefreshToken).where(RefreshToken.family == family)).rowcount or 0
+
+
+def rotate_refresh_token(db: Session, token: str, read_db: Session | None = None,
+                         now: datetime | None = None) -> tuple[User, str]:
+    """Consume `token` and return its user and the next token in the family.
+
+    The token is decoded once (signature and expiry), then looked up with its
+    user on `read_db`. The old row is claimed with a DELETE on `db`, so two
+    concurrent refreshes of the same token cannot both succeed.
+    """
+    now = now or datetime.utcnow()
+    payload = decode_refresh_token(token)
+    found = find_refresh_token(read_db or db, token)
+    if found is None:
+        family = payload.get("fam")
+        if family and revoke_family(db, family):
+            db.commit()
+            raise RefreshTokenReuse(payload.get("username"), family)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+    stored, user = found
+    if stored.expires_at and stored.expires_at < now:
+        db.execute(delete(RefreshToken).where(RefreshToken.id == stored.id))
+        db.commit()
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token expired")
+    if payload.get("username") != user.username:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+
+    claimed = db.execute(delete(RefreshToken).where(RefreshToken.id == stored.id)).rowcount
+    if not claimed:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token already used")
+    # tokens issued before families existed start one now
+    new_token = issue_refresh_token(db, user.id, user.username, family=stored.family, now=now)
+    db.commit()
+    return user, new_token
+
+
+def purge_expired(db: Session, now: datetime | None = None, batch_size: int = 1000) -> int:
+    """Delete expired rows in batches, committing each so the write lock stays short."""
+    now = now or datetime.utcnow()
+    purged = 0
+    while True:
+        ids = select(RefreshToken.id).where(RefreshToken.expires_at < now).limit(batch_size)
+        deleted = db.execute(delete(RefreshToken).where(RefreshToken.id.in_(ids))).rowcount or 0
+        db.commit()
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+
+
+class RefreshTokenPurger:
+    """Background thread running `purge_expired` every `interval` seconds.
+
+    Expired access token revocations and the usage rows of expired access
+    tokens are deleted in the same pass.
+    """
+
+    def __init__(self, session_factory, interval: float = 3600.0, batch_size: int = 1000):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.purged = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="refresh-token-purger", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def purge_once(self) -> int:
+        from App.core.revocation import purge_expired as purge_expired_revocations
+        from App.core.token_usage import purge_stale as purge_stale_token_usage
+
+        db = self.session_factory()
+        try:
+            purged = purge_expired(db, batch_size=self.batch_size)
+            # revocations outlive their tokens only briefly; drop them on the same schedule
+            purge_expired_revocations(db)
+            purge_stale_token_usage(db, batch_size=self.batch_size)
+        finally:
+            db.close()
+        self.purged += purged
+        return purged
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.purge_once()
+            except Exception:
+                logger.exception("refresh token purge failed")
+
+
+def _default_purger() -> RefreshTokenPurger:
+    from App.config import REFRESH_PURGE_INTERVAL_SECONDS
+    from App.database.session import SessionLocal
+
+    return RefreshTokenPurger(SessionLocal, interval=REFRESH_PURGE_INTERVAL_SECONDS)
+
+
+refresh_purger = _default_purger()
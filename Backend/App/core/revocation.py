@@ -0,0 +1,231 @@
+"""Access token revocation: a Bloom filter in front of the revoked_tokens table.
+
+Admins revoke a single token (by jti) or every token a user holds. Each is
+a row in `revoked_tokens`. A user-wide revocation rejects every token of
+that user issued before it, at one-second `iat` granularity.
+
+`require_roles` checks every decoded token. Revoked jtis are loaded into a
+Bloom filter, so the usual answer ("not revoked") needs no I/O at all. Only
+a filter hit is confirmed against the table (about one in a thousand for
+tokens that were never revoked). User-wide cutoffs are a dict lookup.
+
+Each worker picks up new rows incrementally (`id > last seen id`) at most
+every REVOCATION_SYNC_SECONDS. Ids are AUTOINCREMENT so they keep growing
+after expired rows are purged. The filter is rebuilt from the unexpired rows
+every REVOCATION_REBUILD_SECONDS, since a Bloom filter cannot forget
+entries. Rows expire once every token they could match has expired.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from App import config
+from App.core.jwt_handler import EXP_LEEWAY_SECONDS, evict_cached_jti
+from App.database.models import RefreshToken, RevokedToken, User
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for `capacity` keys at `error_rate`."""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        bits = self._bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+def _expiry(now: datetime) -> datetime:
+    # no access token issued before `now` can outlive this
+    return now + timedelta(minutes=config.JWT_EXP_MINUTES, seconds=EXP_LEEWAY_SECONDS)
+
+
+def _epoch(ts: datetime) -> int:
+    return int((ts - datetime(1970, 1, 1)).total_seconds())
+
+
+class RevocationList:
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001,
+                 sync_interval: float = 1.0, rebuild_interval: float = 3600.0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._cutoffs: dict[str, int] = {}  # username -> reject tokens with iat before this
+        self._last_id = 0
+        self._synced = 0.0
+        self._rebuilt = None
+        self.checks = 0
+        self.filter_hits = 0
+        self.false_positives = 0
+
+    # -- checking -------------------------------------------------------------
+
+    def needs_sync(self) -> bool:
+        return time.monotonic() - self._synced >= self.sync_interval
+
+    def check(self, payload: dict) -> bool | None:
+        """True/False from memory, or None when a filter hit needs the exact lookup."""
+        self.checks += 1
+        cutoff = self._cutoffs.get(payload.get("username"))
+        if cutoff is not None and int(payload.get("iat") or 0) < cutoff:
+            return True
+        jti = payload.get("jti")
+        if not jti or jti not in self._bloom:
+            return False
+        self.filter_hits += 1
+        return None
+
+    @staticmethod
+    def _exact_stmt(jti: str):
+        return select(RevokedToken.id).where(RevokedToken.jti == jti).limit(1)
+
+    def _confirmed(self, found) -> bool:
+        if found is None:
+            self.false_positives += 1
+            return False
+        return True
+
+    def is_revoked(self, payload: dict, db: Session) -> bool:
+        if self.needs_sync():
+            self.sync(db)
+        result = self.check(payload)
+        if result is None:
+            result = self._confirmed(db.execute(self._exact_stmt(payload["jti"])).first())
+        return result
+
+    async def is_revoked_async(self, payload: dict, db) -> bool:
+        if self.needs_sync():
+            await db.run_sync(self.sync)
+        result = self.check(payload)
+        if result is None:
+            result = self._confirmed((await db.execute(self._exact_stmt(payload["jti"]))).first())
+        return result
+
+    # -- loading --------------------------------------------------------------
+
+    def _apply(self, bloom: BloomFilter, cutoffs: dict, rows):
+        last_id = 0
+        for row_id, jti, username, revoked_at in rows:
+            last_id = max(last_id, row_id)
+            if jti:
+                bloom.add(jti)
+            elif username:
+                cutoffs[username] = max(cutoffs.get(username, 0), _epoch(revoked_at))
+        return last_id
+
+    def sync(self, db: Session) -> int:
+        """Load rows added since the last sync; rebuild the filter when it is due."""
+        now = time.monotonic()
+        with self._lock:
+            self._synced = now
+            columns = (RevokedToken.id, RevokedToken.jti, RevokedToken.username, RevokedToken.revoked_at)
+            if (self._rebuilt is None or now - self._rebuilt >= self.rebuild_interval
+                    or self._bloom.count >= self.capacity):
+                rows = db.execute(
+                    select(*columns).where(RevokedToken.expires_at >= datetime.utcnow())
+                ).all()
+                bloom, cutoffs = BloomFilter(self.capacity, self.error_rate), {}
+                last_id = max(self._apply(bloom, cutoffs, rows),
+                              db.execute(select(func.max(RevokedToken.id))).scalar() or 0)
+                # swap whole structures so concurrent checks never see a half-built filter
+                self._bloom, self._cutoffs = bloom, cutoffs
+                # the table's own watermark, even if it went down, so a rebuild always recovers
+                self._last_id = last_id
+                self._rebuilt = now
+                return len(rows)
+            rows = db.execute(select(*columns).where(RevokedToken.id > self._last_id).order_by(RevokedToken.id)).all()
+            if rows:
+                cutoffs = dict(self._cutoffs)
+                self._last_id = max(self._last_id, self._apply(self._bloom, cutoffs, rows))
+                self._cutoffs = cutoffs
+            return len(rows)
+
+    # -- revoking -------------------------------------------------------------
+
+    def revoke_jti(self, db: Session, jti: str, *, reason: str | None = None, revoked_by: str | None = None) -> bool:
+        """Revoke one access token; False when it was already revoked."""
+        now = datetime.utcnow()
+        db.add(RevokedToken(jti=jti, revoked_at=now, expires_at=_expiry(now), reason=reason, revoked_by=revoked_by))
+        try:
+            db.commit()
+            added = True
+        except IntegrityError:
+            db.rollback()
+            added = False
+        with self._lock:
+            self._bloom.add(jti)
+        evict_cached_jti(jti)
+        return added
+
+    def revoke_user(self, db: Session, username: str, *, reason: str | None = None,
+                    revoked_by: str | None = None) -> int:
+        """Revoke every token `username` holds: access tokens by cutoff, refresh rows by deletion.
+
+        Returns the number of refresh tokens (sessions) removed.
+        """
+        now = datetime.utcnow()
+        db.add(RevokedToken(username=username, revoked_at=now, expires_at=_expiry(now), reason=reason,
+                            revoked_by=revoked_by))
+        sessions = db.execute(
+            delete(RefreshToken).where(RefreshToken.user_id.in_(select(User.id).where(User.username == username)))
+        ).rowcount or 0
+        db.commit()
+        with self._lock:
+            cutoffs = dict(self._cutoffs)
+            cutoffs[username] = max(cutoffs.get(username, 0), _epoch(now))
+            self._cutoffs = cutoffs
+        return sessions
+
+    def stats(self) -> dict:
+        return {
+            "revoked_jtis": self._bloom.count,
+            "revoked_users": len(self._cutoffs),
+            "filter_bits": self._bloom.size,
+            "filter_hashes": self._bloom.hashes,
+            "checks": self.checks,
+            "filter_hits": self.filter_hits,
+            "false_positives": self.false_positives,
+        }
+
+
+def purge_expired(db: Session, now: datetime | None = None) -> int:
+    """Delete revocations that can no longer match a live token."""
+    deleted = db.execute(delete(RevokedToken).where(RevokedToken.expires_at < (now or datetime.utcnow()))).rowcount
+    db.commit()
+    return deleted or 0
+
+
+revocations = RevocationList(
+    capacity=config.REVOCATION_BLOOM_CAPACITY,
+    error_rate=config.REVOCATION_BLOOM_ERROR_RATE,
+    sync_interval=config.REVOCATION_SYNC_SECONDS,
+    rebuild_interval=config.REVOCATION_REBUILD_SECONDS,
+)
@@ -1,4 +1,5 @@
 from typing import List
+from App.core.policy import RiskPolicy, active_policy
 
 
 SENSITIVITY_MAP = {
@@ -38,8 +39,8 @@ def calculate_risk(
     if required_roles and user_role not in required_roles:
         risk_score += 40
 
-    # Endpoint sensitivity
-    sensitivity = SENSITIVITY_MAP.get(endpoint, 0)
+    # Endpoint sensitivity from the active policy's patterns
+    sensitivity = active_policy().sensitivity(endpoint)
     risk_score += sensitivity
 
     # Behavior risk based on frequency
@@ -84,9 +85,83 @@ def calculate_risk(
 
 
 def evaluate_risk_score(risk_score: int) -> str:
-    if risk_score <= 30:
-        return "allow"
-    elif 31 <= risk_score <= 60:
-        return "allow+log"
+    return active_policy().decision(risk_score)
+
+
+def calculate_risk_batch(
+    endpoints,
+    role_mismatch=None,
+    request_count=None,
+    failed_login_count=None,
+    token_age_seconds=None,
+    token_reuse_count=None,
+    ip_change=None,
+    ua_change=None,
+    *,
+    policy: RiskPolicy | None = None,
+):
+    """Score many requests at once; returns `(scores, decisions)` as NumPy arrays.
+
+    Every argument is a column with one entry per request (omitted columns
+    count as zero/False). `role_mismatch` replaces the `user_role` /
+    `required_roles` pair of `calculate_risk`: it is True where the role was
+    not among the required ones. Results match `calculate_risk` and
+    `evaluate_risk_score` row for row. `policy` defaults to the active one;
+    pass another to score a candidate policy.
+    """
+    import numpy as np
+
+    policy = policy or active_policy()
+
+    endpoints = np.asarray(endpoints)
+    if endpoints.dtype.kind != "U":
+        endpoints = endpoints.astype(str)
+    n = len(endpoints)
+
+    def column(values, dtype):
+        if values is None:
+            return np.zeros(n, dtype=dtype)
+        values = np.asarray(values, dtype=dtype)
+        if values.shape != (n,):
+            raise ValueError(f"expected {n} values per column, got shape {values.shape}")
+        return values
+
+    role_mismatch = column(role_mismatch, bool)
+    request_count = column(request_count, np.int64)
+    failed_login_count = column(failed_login_count, np.int64)
+    token_age_seconds = column(token_age_seconds, np.int64)
+    token_reuse_count = column(token_reuse_count, np.int64)
+    ip_change = column(ip_change, bool)
+    ua_change = column(ua_change, bool)
+
+    scores = np.full(n, 5, dtype=np.int64)
+    scores += role_mismatch * 40
+
+    if policy.exact and len(policy.rules) <= 32:
+        # a few literal paths: one vectorized comparison each, everything else scores 0
+        for endpoint, sensitivity in policy.rules.items():
+            scores += (endpoints == endpoint) * sensitivity
     else:
-        return "deny"
+        # resolve through the policy's trie; repeated paths hit its cache
+        scores += np.fromiter(map(policy.sensitivity, endpoints.tolist()), dtype=np.int64, count=n)
+
+    # tiers are written as increments, e.g. >5 -> 10, >20 -> 10 + 10, >50 -> 10 + 10 + 10
+    scores += (request_count > 5) * 10 + (request_count > 20) * 10 + (request_count > 50) * 10
+    scores += (failed_login_count >= 5) * 20 + (failed_login_count >= 10) * 15 + (failed_login_count >= 20) * 15
+    scores += (token_reuse_count >= 1) * 15 + (token_reuse_count >= 2) * 15 + (token_reuse_count >= 3) * 20
+    scores += ip_change * 15
+    scores += ua_change * 5
+    scores += (token_age_seconds > 60 * 60 * 24) * 5 + (token_age_seconds > 60 * 60 * 24 * 7) * 5
+
+    np.clip(scores, 0, 100, out=scores)
+    return scores, evaluate_risk_scores(scores, policy)
+
+
+def evaluate_risk_scores(scores, policy: RiskPolicy | None = None):
+    """Vectorized `evaluate_risk_score` over an array of integer scores."""
+    import numpy as np
+
+    policy = policy or active_policy()
+    scores = np.asarray(scores)
+    decisions = np.array(["allow", "allow+log", "deny"], dtype=object)
+    return decisions[(scores > policy.allow_max).astype(np.intp) + (scores > policy.log_max)]
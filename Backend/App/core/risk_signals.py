@@ -0,0 +1,158 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from App.database.models import AuditLog
+from App.core.shared_state import fingerprint
+from App.core.signal_store import signal_store, RECENT_WINDOW_SECONDS, FAILED_LOGIN_WINDOW_SECONDS
+from App.core.token_usage import token_reuse_query
+
+
+@dataclass
+class RiskSignals:
+    """Behavioural signals for one request, named after `calculate_risk` kwargs."""
+
+    request_count: int = 0
+    failed_login_count: int = 0
+    token_age_seconds: int = 0
+    token_reuse_count: int = 0
+    ip_change: bool = False
+    ua_change: bool = False
+
+    def as_kwargs(self) -> dict:
+        return asdict(self)
+
+
+class _SignalQuery:
+    """Plan for one request's signals: what the store answers and the SQL for the rest."""
+
+    def __init__(self, username, jti, iat, ip, user_agent, pending_ips, store, now):
+        self.signals = RiskSignals()
+        self.jti = jti
+        self.ip = ip
+        self.user_agent = user_agent
+        self.stmt = None
+
+        if iat:
+            try:
+                self.signals.token_age_seconds = int(now.timestamp()) - int(iat)
+            except Exception:
+                self.signals.token_age_seconds = 0
+
+        columns = []
+        self.counts = None
+        if store.ready:
+            self.signals.request_count = store.recent_count(username, now)
+            self.signals.failed_login_count = store.failed_login_count(username, now)
+        else:
+            minute_ago = now - timedelta(seconds=RECENT_WINDOW_SECONDS)
+            window_start = now - timedelta(seconds=FAILED_LOGIN_WINDOW_SECONDS)
+            self.counts = (
+                select(
+                    func.coalesce(func.sum(case((AuditLog.timestamp >= minute_ago, 1), else_=0)), 0).label("request_count"),
+                    func.coalesce(func.sum(case((AuditLog.event_type == "login_failed", 1), else_=0)), 0).label("failed_login_count"),
+                )
+                .where(and_(AuditLog.username == username, AuditLog.timestamp >= window_start))
+                .cte("counts")
+            )
+            columns += [self.counts.c.request_count, self.counts.c.failed_login_count]
+
+        self.pending = set(pending_ips) - {ip, None}
+        if jti:
+            if store.ready:
+                # uses other workers recorded but may not have flushed yet
+                self.pending |= store.token_ips(jti, now) - {ip, None}
+            columns.append(token_reuse_query(jti, ip, self.pending).scalar_subquery().label("token_reuse_count"))
+
+        self.last_login = store.last_login(username)
+        if self.last_login is None:
+            last_success = (
+                select(AuditLog.ip, AuditLog.user_agent)
+                .where(AuditLog.username == username, AuditLog.event_type == "login_success")
+                .order_by(AuditLog.timestamp.desc())
+                .limit(1)
+            )
+            columns += [
+                last_success.with_only_columns(AuditLog.ip).scalar_subquery().label("last_ip"),
+                last_success.with_only_columns(AuditLog.user_agent).scalar_subquery().label("last_user_agent"),
+            ]
+
+        if columns:
+            self.stmt = select(*columns)
+            if self.counts is not None:
+                self.stmt = self.stmt.select_from(self.counts)
+
+    def finish(self, row) -> RiskSignals:
+        signals = self.signals
+        last_login = self.last_login
+        if self.stmt is not None:
+            row = row or {}
+            if self.counts is not None:
+                signals.request_count = int(row.get("request_count") or 0)
+                signals.failed_login_count = int(row.get("failed_login_count") or 0)
+            if self.jti:
+                signals.token_reuse_count = int(row.get("token_reuse_count") or 0) + len(self.pending)
+            if last_login is None:
+                last_login = (row.get("last_ip"), row.get("last_user_agent"))
+
+        if last_login:
+            last_ip, last_user_agent = last_login
+            signals.ip_change = bool(self.ip and last_ip and self.ip != last_ip)
+            # a shared store may hold a long user agent as its fingerprint
+            signals.ua_change = bool(
+                self.user_agent and last_user_agent and fingerprint(self.user_agent) != fingerprint(last_user_agent)
+            )
+        return signals
+
+
+def gather_signals(
+    db: Session,
+    username: str,
+    *,
+    jti: str | None = None,
+    iat: int | None = None,
+    ip: str | None = None,
+    user_agent: str | None = None,
+    pending_ips=(),
+    store=signal_store,
+    now: datetime | None = None,
+) -> RiskSignals:
+    """Collect the risk signals for a request with at most one SQL statement.
+
+    Counts come from the signal store once it has been rebuilt; until then
+    they are computed with conditional aggregation over the user's recent
+    audit rows. Token reuse and, when the store does not know it, the last
+    successful login are folded into the same statement as scalar subqueries.
+    """
+    plan = _SignalQuery(username, jti, iat, ip, user_agent, pending_ips, store, now or datetime.utcnow())
+    row = None
+    if plan.stmt is not None:
+        try:
+            row = db.execute(plan.stmt).mappings().one()
+        except Exception:
+            row = None
+    return plan.finish(row)
+
+
+async def gather_signals_async(
+    db: AsyncSession,
+    username: str,
+    *,
+    jti: str | None = None,
+    iat: int | None = None,
+    ip: str | None = None,
+    user_agent: str | None = None,
+    pending_ips=(),
+    store=signal_store,
+    now: datetime | None = None,
+) -> RiskSignals:
+    """Async variant of `gather_signals`; runs the same single statement."""
+    plan = _SignalQuery(username, jti, iat, ip, user_agent, pending_ips, store, now or datetime.utcnow())
+    row = None
+    if plan.stmt is not None:
+        try:
+            row = (await db.execute(plan.stmt)).mappings().one()
+        except Exception:
+            row = None
+    return plan.finish(row)
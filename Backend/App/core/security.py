@@ -1,4 +1,12 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
+from App.config import PASSWORD_POOL, PASSWORD_WORKERS, PASSWORD_MAX_PENDING
+from App.core.metrics import metrics
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -13,3 +21,136 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     except Exception:
         # If stored password is plain text (legacy), fall back to direct compare
         return plain_password == hashed_password
+
+
+def _timed(fn, *args):
+    # runs in the worker; wall-clock so it is comparable across processes
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+class PasswordPool:
+    """Runs bcrypt work on a worker pool so it doesn't hold the event loop.
+
+    `kind` is "thread" (bcrypt releases the GIL, so threads use every core)
+    or "process". At most `max_pending` operations may be queued or running;
+    beyond that callers get a 503 instead of piling up behind the pool.
+    """
+
+    def __init__(self, kind: str = "thread", workers: int | None = None, max_pending: int = 64):
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.run_time_total = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many concurrent password operations",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+
+    def _finish(self, submitted: float, started: float, finished: float):
+        with self._lock:
+            queued = max(0.0, started - submitted)
+            self.completed += 1
+            self.queue_time_total += queued
+            self.queue_time_max = max(self.queue_time_max, queued)
+            self.run_time_total += finished - started
+
+    async def run(self, fn, *args):
+        self._acquire()
+        submitted = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started, finished = await loop.run_in_executor(self._get_executor(), _timed, fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+        self._finish(submitted, started, finished)
+        return result
+
+    def call(self, fn, *args):
+        """Blocking variant of `run` for sync routes, which already run on a worker thread."""
+        self._acquire()
+        submitted = time.time()
+        try:
+            result, started, finished = self._get_executor().submit(_timed, fn, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+        self._finish(submitted, started, finished)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = self.completed or 1
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "queue_time_ms_avg": self.queue_time_total / done * 1000,
+                "queue_time_ms_max": self.queue_time_max * 1000,
+                "run_time_ms_avg": self.run_time_total / done * 1000,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+password_pool = PasswordPool(PASSWORD_POOL, PASSWORD_WORKERS or None, PASSWORD_MAX_PENDING)
+
+
+def hash_password_pooled(password: str) -> str:
+    return password_pool.call(hash_password, password)
+
+
+def verify_password_pooled(plain_password: str, hashed_password: str) -> bool:
+    return password_pool.call(verify_password, plain_password, hashed_password)
+
+
+def password_pool_stats() -> dict:
+    return password_pool.stats()
+
+
+@metrics.gauges
+def _password_pool_gauges() -> dict:
+    stats = password_pool_stats()
+    return {
+        "password_pool_workers": ("gauge", "Password hashing workers.", stats["workers"]),
+        "password_pool_pending": ("gauge", "Hashes queued or running.", stats["pending"]),
+        "password_pool_completed_total": ("counter", "Hashes completed.", stats["completed"]),
+        "password_pool_rejected_total": ("counter", "Hashes refused because the queue was full.", stats["rejected"]),
+        "password_pool_queue_seconds_avg": ("gauge", "Mean time a hash waited for a worker.",
+                                            stats["queue_time_ms_avg"] / 1000),
+        "password_pool_queue_seconds_max": ("gauge", "Longest time a hash waited for a worker.",
+                                            stats["queue_time_ms_max"] / 1000),
+        "password_pool_run_seconds_avg": ("gauge", "Mean time to compute a hash.", stats["run_time_ms_avg"] / 1000),
+    }
@@ -0,0 +1,563 @@
+"""Backends that share risk-signal state between worker processes.
+
+With several uvicorn workers, counters kept in one process only see the
+requests that process served. These backends hold the same state where every
+worker reads and updates it:
+
+`MmapSharedState` keeps fixed-size hash tables in a memory-mapped file
+(by default in /dev/shm, i.e. a shared-memory segment). Every operation runs
+under an exclusive `flock` on the file, so read-modify-write updates are
+atomic across processes. Tables are declared up front and never grow: when a
+probe window is full, the entry with the oldest activity is overwritten.
+
+`RedisSharedState` stores the same data in Redis over a minimal RESP client,
+so any server that speaks the protocol will do.
+
+Both expose the same small set of operations, keyed by a table name and a key:
+sliding-window counters of one-second buckets (`hit`, `window_count`), the
+latest value of a tuple of strings (`put_latest`, `latest`) and a small set of
+recently seen members (`add_member`, `members`).
+"""
+import contextlib
+import hashlib
+import logging
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from urllib.parse import unquote, urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process and Redis backends work there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStateError(RuntimeError):
+    """The shared state backend could not be reached or returned an error."""
+
+
+def fingerprint(value: str | None, limit: int = 254) -> str | None:
+    """`value` if it fits in `limit` UTF-8 bytes, otherwise a digest of it.
+
+    Equal strings have equal fingerprints, so change detection can compare
+    fingerprints when the stored copy had to be shortened.
+    """
+    if value is None:
+        return None
+    data = value.encode("utf-8")
+    if len(data) <= limit:
+        return value
+    return "#" + hashlib.sha256(data).hexdigest()
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+# -- memory-mapped file -------------------------------------------------------
+
+_MAGIC = b"AGSIGNL1"
+_HEADER = struct.Struct("<8sQQd")  # magic, slots, layout hash, rebuilt_at
+HEADER_SIZE = 64
+_SLOT = struct.Struct("<16sq")  # key digest, last activity (epoch second)
+_EMPTY = bytes(16)
+_Q = struct.Struct("<q")
+_I = struct.Struct("<i")
+_H = struct.Struct("<H")
+_NONE = 0xFFFF
+MAX_PROBE = 32
+
+
+def _pack_str(mm, offset: int, size: int, value: str | None):
+    if value is None:
+        _H.pack_into(mm, offset, _NONE)
+        return
+    data = fingerprint(value, size - 2).encode("utf-8")
+    _H.pack_into(mm, offset, len(data))
+    mm[offset + 2:offset + 2 + len(data)] = data
+
+
+def _unpack_str(mm, offset: int) -> str | None:
+    (length,) = _H.unpack_from(mm, offset)
+    if length == _NONE:
+        return None
+    return bytes(mm[offset + 2:offset + 2 + length]).decode("utf-8")
+
+
+class _Table:
+    value_size = 0
+
+    def __init__(self):
+        self.offset = 0
+        self.slots = 0
+
+    @property
+    def size(self) -> int:
+        return _SLOT.size + self.value_size
+
+    def describe(self) -> str:
+        return f"{type(self).__name__}:{self.value_size}"
+
+    def find(self, mm, digest: bytes, create: bool = False) -> int | None:
+        """Offset of the record for `digest`; with `create`, claim a slot for it."""
+        start = int.from_bytes(digest[:8], "little") % self.slots
+        free = oldest = oldest_seen = None
+        for i in range(min(MAX_PROBE, self.slots)):
+            off = self.offset + ((start + i) % self.slots) * self.size
+            stored, seen = _SLOT.unpack_from(mm, off)
+            if stored == digest:
+                return off
+            if stored == _EMPTY:
+                free = off
+                break
+            if oldest_seen is None or seen < oldest_seen:
+                oldest, oldest_seen = off, seen
+        if not create:
+            return None
+        off = free if free is not None else oldest
+        mm[off:off + self.size] = bytes(self.size)
+        _SLOT.pack_into(mm, off, digest, 0)
+        return off
+
+    @staticmethod
+    def touch(mm, off: int, second: int):
+        digest, seen = _SLOT.unpack_from(mm, off)
+        if second > seen:
+            _SLOT.pack_into(mm, off, digest, second)
+
+
+class WindowTable(_Table):
+    """Counters over the last `window` seconds, one bucket per second."""
+
+    def __init__(self, window: int):
+        super().__init__()
+        self.window = window
+        self.value_size = 16 + 4 * window  # head second, running total, buckets
+
+    def _advance(self, mm, off: int, second: int) -> tuple[int, int]:
+        # same bookkeeping as the in-process _WindowCounter; head 0 means empty
+        base = off + _SLOT.size
+        head, total = _Q.unpack_from(mm, base)[0], _Q.unpack_from(mm, base + 8)[0]
+        buckets = base + 16
+        if head == 0:
+            head = second
+        elif second > head:
+            if second - head >= self.window:
+                mm[buckets:buckets + 4 * self.window] = bytes(4 * self.window)
+                total = 0
+            else:
+                for s in range(head + 1, second + 1):
+                    at = buckets + 4 * (s % self.window)
+                    total -= _I.unpack_from(mm, at)[0]
+                    _I.pack_into(mm, at, 0)
+            head = second
+        _Q.pack_into(mm, base, head)
+        _Q.pack_into(mm, base + 8, total)
+        return head, total
+
+    def hit(self, mm, digest: bytes, second: int, amount: int):
+        off = self.find(mm, digest, create=True)
+        head, total = self._advance(mm, off, second)
+        self.touch(mm, off, second)
+        if second <= head - self.window:
+            return
+        at = off + _SLOT.size + 16 + 4 * (second % self.window)
+        _I.pack_into(mm, at, _I.unpack_from(mm, at)[0] + amount)
+        _Q.pack_into(mm, off + _SLOT.size + 8, total + amount)
+
+    def count(self, mm, digest: bytes, second: int) -> int:
+        off = self.find(mm, digest)
+        if off is None:
+            return 0
+        return self._advance(mm, off, second)[1]
+
+
+class LatestTable(_Table):
+    """The newest tuple of strings per key; longer strings are fingerprinted."""
+
+    def __init__(self, *field_sizes: int):
+        super().__init__()
+        self.field_sizes = field_sizes
+        self.value_size = 8 + sum(field_sizes)
+
+    def describe(self) -> str:
+        return f"LatestTable:{self.field_sizes}"
+
+    def put(self, mm, digest: bytes, second: int, values: tuple):
+        off = self.find(mm, digest, create=True)
+        base = off + _SLOT.size
+        current = _Q.unpack_from(mm, base)[0]
+        if current and second < current:
+            return
+        _Q.pack_into(mm, base, second)
+        at = base + 8
+        for size, value in zip(self.field_sizes, values):
+            _pack_str(mm, at, size, value)
+            at += size
+        self.touch(mm, off, second)
+
+    def get(self, mm, digest: bytes) -> tuple | None:
+        off = self.find(mm, digest)
+        if off is None:
+            return None
+        at = off + _SLOT.size + 8
+        values = []
+        for size in self.field_sizes:
+            values.append(_unpack_str(mm, at))
+            at += size
+        return tuple(values)
+
+
+class MembersTable(_Table):
+    """Up to `capacity` members per key with the second each was last added."""
+
+    def __init__(self, capacity: int = 8, field_size: int = 64):
+        super().__init__()
+        self.capacity = capacity
+        self.field_size = field_size
+        self.value_size = capacity * (8 + field_size)
+
+    def _entries(self, mm, off: int):
+        at = off + _SLOT.size
+        for _ in range(self.capacity):
+            yield at, _Q.unpack_from(mm, at)[0]
+            at += 8 + self.field_size
+
+    def add(self, mm, digest: bytes, member: str, second: int):
+        off = self.find(mm, digest, create=True)
+        target = oldest = oldest_second = None
+        for at, seen in self._entries(mm, off):
+            if seen and _unpack_str(mm, at + 8) == fingerprint(member, self.field_size - 2):
+                target = at
+                break
+            if oldest_second is None or seen < oldest_second:
+                oldest, oldest_second = at, seen
+        target = target if target is not None else oldest
+        _Q.pack_into(mm, target, max(second, _Q.unpack_from(mm, target)[0]))
+        _pack_str(mm, target + 8, self.field_size, member)
+        self.touch(mm, off, second)
+
+    def members(self, mm, digest: bytes, since: int) -> set:
+        off = self.find(mm, digest)
+        if off is None:
+            return set()
+        return {_unpack_str(mm, at + 8) for at, seen in self._entries(mm, off) if seen and seen > since}
+
+
+class MmapSharedState:
+    """Shared tables in a memory-mapped file, locked with `flock`.
+
+    All processes must open the file with the same tables and slot count; a
+    file with a different layout is reinitialised by the first process that
+    opens it. The file is opened lazily and reopened after a fork, since a
+    `flock` taken through an inherited descriptor would not exclude the parent.
+    """
+
+    def __init__(self, path: str, tables: dict, slots: int = 20000):
+        if fcntl is None:
+            raise SharedStateError("the mmap shared state backend needs fcntl (POSIX)")
+        self.path = path
+        self.slots = slots
+        self.tables = tables
+        offset = HEADER_SIZE
+        for table in tables.values():
+            table.offset, table.slots = offset, slots
+            offset += table.size * slots
+        self.size = offset
+        layout = ";".join(f"{name}={table.describe()}" for name, table in sorted(tables.items()))
+        self._layout = int.from_bytes(_digest(f"{slots};{layout}")[:8], "little")
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._mm = None
+        self._pid = None
+
+    def _open(self):
+        self.close()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, _HEADER.size, 0)
+            valid = (
+                os.fstat(fd).st_size == self.size
+                and len(header) == _HEADER.size
+                and _HEADER.unpack(header)[:3] == (_MAGIC, self.slots, self._layout)
+            )
+            if not valid:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, _HEADER.pack(_MAGIC, self.slots, self._layout, 0.0), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._mm = mmap.mmap(fd, self.size)
+        self._pid = os.getpid()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """Hold the cross-process lock; nested uses only lock once."""
+        with self._lock:
+            try:
+                if self._pid != os.getpid():
+                    self._depth = 0
+                    self._open()
+                if self._depth == 0:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except OSError as exc:
+                raise SharedStateError(f"cannot lock {self.path}: {exc}") from exc
+            self._depth += 1
+            try:
+                yield self._mm
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def hit(self, name: str, key: str, second: int, window: int, amount: int = 1):
+        with self.exclusive() as mm:
+            self.tables[name].hit(mm, _digest(key), second, amount)
+
+    def window_count(self, name: str, key: str, second: int, window: int) -> int:
+        with self.exclusive() as mm:
+            return self.tables[name].count(mm, _digest(key), second)
+
+    def put_latest(self, name: str, key: str, second: int, values: tuple):
+        with self.exclusive() as mm:
+            self.tables[name].put(mm, _digest(key), second, values)
+
+    def latest(self, name: str, key: str) -> tuple | None:
+        with self.exclusive() as mm:
+            return self.tables[name].get(mm, _digest(key))
+
+    def add_member(self, name: str, key: str, member: str, second: int, window: int):
+        with self.exclusive() as mm:
+            self.tables[name].add(mm, _digest(key), member, second)
+
+    def members(self, name: str, key: str, second: int, window: int) -> set:
+        with self.exclusive() as mm:
+            return self.tables[name].members(mm, _digest(key), second - window)
+
+    def rebuilt_at(self) -> float:
+        with self.exclusive() as mm:
+            return _HEADER.unpack_from(mm, 0)[3]
+
+    def mark_rebuilt(self, when: float):
+        with self.exclusive() as mm:
+            _HEADER.pack_into(mm, 0, _MAGIC, self.slots, self._layout, when)
+
+    def clear(self):
+        with self.exclusive():
+            # drop the pages rather than writing zeros over every table
+            os.ftruncate(self._fd, HEADER_SIZE)
+            os.ftruncate(self._fd, self.size)
+
+
+# -- Redis --------------------------------------------------------------------
+
+class RespClient:
+    """Just enough of the Redis protocol (RESP2) for `RedisSharedState`."""
+
+    def __init__(self, url: str = "redis://localhost:6379/0", timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _connect(self):
+        self.close()
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as exc:
+            raise SharedStateError(f"cannot connect to {self.host}:{self.port}: {exc}") from exc
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+        self._pid = os.getpid()
+        if self.password:
+            self._roundtrip([("AUTH", self.password)])
+        if self.db:
+            self._roundtrip([("SELECT", self.db)])
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    @staticmethod
+    def _encode(command) -> bytes:
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise SharedStateError("connection closed by the server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            return SharedStateError(rest.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise SharedStateError(f"unexpected reply {line!r}")
+
+    def _roundtrip(self, commands) -> list:
+        self._sock.sendall(b"".join(self._encode(c) for c in commands))
+        replies = [self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, SharedStateError):
+                raise reply
+        return replies
+
+    def pipeline(self, *commands) -> list:
+        """Send all commands in one write and return their replies in order."""
+        with self._lock:
+            try:
+                if self._sock is None or self._pid != os.getpid():
+                    self._connect()
+                return self._roundtrip(commands)
+            except SharedStateError:
+                raise
+            except (OSError, ValueError) as exc:
+                self.close()
+                raise SharedStateError(f"redis {self.host}:{self.port}: {exc}") from exc
+
+    def execute(self, *args):
+        return self.pipeline(args)[0]
+
+
+def _pairs(reply) -> dict:
+    reply = reply or []
+    return dict(zip(reply[::2], reply[1::2]))
+
+
+class RedisSharedState:
+    """The shared tables as Redis hashes under `prefix`.
+
+    Window counters are hashes of {second: count} that expire with the
+    window, latest values are hashes of their fields and member sets are
+    hashes of {member: second}. `put_latest` is last-writer-wins.
+    """
+
+    LATEST_TTL = 7 * 24 * 3600
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "accessguard", client=None):
+        self.client = client or RespClient(url)
+        self.prefix = prefix
+
+    def _key(self, name: str, key: str) -> str:
+        return f"{self.prefix}:{name}:{key}"
+
+    def hit(self, name: str, key: str, second: int, window: int, amount: int = 1):
+        k = self._key(name, key)
+        self.client.pipeline(("HINCRBY", k, second, amount), ("EXPIRE", k, window + 1))
+
+    def window_count(self, name: str, key: str, second: int, window: int) -> int:
+        fields = _pairs(self.client.execute("HGETALL", self._key(name, key)))
+        total, stale = 0, []
+        for field, value in fields.items():
+            if int(field) > second - window:
+                if int(field) <= second:
+                    total += int(value)
+            else:
+                stale.append(field)
+        if stale:
+            self.client.execute("HDEL", self._key(name, key), *stale)
+        return total
+
+    def put_latest(self, name: str, key: str, second: int, values: tuple):
+        k = self._key(name, key)
+        args = ["HSET", k, "_second", second]
+        for i, value in enumerate(values):
+            args += [f"v{i}", "" if value is None else "=" + value]
+        self.client.pipeline(tuple(args), ("EXPIRE", k, self.LATEST_TTL))
+
+    def latest(self, name: str, key: str) -> tuple | None:
+        fields = _pairs(self.client.execute("HGETALL", self._key(name, key)))
+        if not fields:
+            return None
+        n = len(fields) - 1
+        return tuple(fields.get(f"v{i}")[1:] if fields.get(f"v{i}") else None for i in range(n))
+
+    def add_member(self, name: str, key: str, member: str, second: int, window: int):
+        k = self._key(name, key)
+        self.client.pipeline(("HSET", k, member, second), ("EXPIRE", k, window + 1))
+
+    def members(self, name: str, key: str, second: int, window: int) -> set:
+        k = self._key(name, key)
+        fields = _pairs(self.client.execute("HGETALL", k))
+        live = {m for m, seen in fields.items() if int(seen) > second - window}
+        stale = set(fields) - live
+        if stale:
+            self.client.execute("HDEL", k, *stale)
+        return live
+
+    @contextlib.contextmanager
+    def exclusive(self, timeout: float = 60.0):
+        """A lock key held while the store is rebuilt (SET NX with expiry)."""
+        lock = f"{self.prefix}-rebuild-lock"
+        token = f"{socket.gethostname()}:{os.getpid()}:{time.monotonic()}"
+        deadline = time.monotonic() + timeout
+        while self.client.execute("SET", lock, token, "NX", "EX", int(timeout)) is None:
+            if time.monotonic() > deadline:
+                raise SharedStateError("timed out waiting for the rebuild lock")
+            time.sleep(0.05)
+        try:
+            yield self
+        finally:
+            if self.client.execute("GET", lock) == token:
+                self.client.execute("DEL", lock)
+
+    def rebuilt_at(self) -> float:
+        return float(self.client.execute("GET", f"{self.prefix}-rebuilt-at") or 0.0)
+
+    def mark_rebuilt(self, when: float):
+        self.client.execute("SET", f"{self.prefix}-rebuilt-at", repr(when))
+
+    def clear(self):
+        cursor = "0"
+        while True:
+            cursor, keys = self.client.execute("SCAN", cursor, "MATCH", f"{self.prefix}:*", "COUNT", 1000)
+            if keys:
+                self.client.execute("DEL", *keys)
+            if cursor == "0":
+                break
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,371 @@
+import calendar
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from App import config
+from App.config import SIGNAL_STORE_MAX_USERS
+from App.core.shared_state import (
+    LatestTable, MembersTable, MmapSharedState, RedisSharedState, SharedStateError, WindowTable, fcntl,
+)
+from App.database.models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+# Windows used by require_roles when scoring a request
+RECENT_WINDOW_SECONDS = 60
+FAILED_LOGIN_WINDOW_SECONDS = 300
+# how long other workers' IPs for a token are remembered (covers unflushed batches)
+TOKEN_IP_WINDOW_SECONDS = 300
+# a shared store rebuilt this recently by another worker is used as is
+REBUILD_GRACE_SECONDS = 30
+
+
+def _to_second(ts: datetime | None) -> int:
+    """Convert a (naive UTC) datetime into an epoch second."""
+    if ts is None:
+        ts = datetime.utcnow()
+    return calendar.timegm(ts.utctimetuple())
+
+
+class _WindowCounter:
+    """Ring buffer of one-second buckets with a running total over `window` seconds."""
+
+    __slots__ = ("window", "buckets", "head", "total")
+
+    def __init__(self, window: int):
+        self.window = window
+        self.buckets = [0] * window
+        self.head = None  # epoch second of the newest bucket
+        self.total = 0
+
+    def _advance(self, second: int):
+        if self.head is None:
+            self.head = second
+            return
+        if second <= self.head:
+            return
+        if second - self.head >= self.window:
+            self.buckets = [0] * self.window
+            self.total = 0
+        else:
+            # expire every bucket that falls out of the window
+            for s in range(self.head + 1, second + 1):
+                idx = s % self.window
+                self.total -= self.buckets[idx]
+                self.buckets[idx] = 0
+        self.head = second
+
+    def add(self, second: int, amount: int = 1):
+        self._advance(second)
+        if second <= self.head - self.window:
+            return  # older than the window, nothing to count
+        self.buckets[second % self.window] += amount
+        self.total += amount
+
+    def count(self, second: int) -> int:
+        self._advance(second)
+        return self.total
+
+
+class _UserSignals:
+    __slots__ = ("requests", "failed_logins", "last_seen")
+
+    def __init__(self):
+        self.requests = _WindowCounter(RECENT_WINDOW_SECONDS)
+        self.failed_logins = _WindowCounter(FAILED_LOGIN_WINDOW_SECONDS)
+        self.last_seen = 0
+
+
+class SignalStore:
+    """Per-user sliding-window counters for the risk signals used in `require_roles`.
+
+    Counters are updated by `log_access` as events are written, so reading the
+    request rate or recent failed logins does not touch `audit_logs`. Users with
+    no activity inside the largest window are evicted, and the total number of
+    tracked users is capped (least recently active first). The IP and user
+    agent of each user's latest successful login are kept as well, so the
+    IP/UA change signals see logins whose audit rows are not flushed yet.
+    """
+
+    def __init__(self, max_users: int = 10000):
+        self.max_users = max_users
+        self.ready = False
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, _UserSignals]" = OrderedDict()
+        self._last_logins: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._users)
+
+    def record(
+        self,
+        username: str | None,
+        event_type: str | None,
+        timestamp: datetime | None = None,
+        *,
+        ip: str | None = None,
+        user_agent: str | None = None,
+        jti: str | None = None,
+    ):
+        if not username:
+            return
+        second = _to_second(timestamp)
+        with self._lock:
+            if event_type == "login_success":
+                last = self._last_logins.get(username)
+                if last is None or second >= last[0]:
+                    self._last_logins[username] = (second, ip, user_agent)
+                    self._last_logins.move_to_end(username)
+                    if len(self._last_logins) > self.max_users:
+                        self._last_logins.popitem(last=False)
+            signals = self._users.get(username)
+            if signals is None:
+                signals = self._users[username] = _UserSignals()
+            elif second >= signals.last_seen:
+                self._users.move_to_end(username)
+            signals.requests.add(second)
+            if event_type == "login_failed":
+                signals.failed_logins.add(second)
+            signals.last_seen = max(signals.last_seen, second)
+            self._evict(second)
+
+    def recent_count(self, username: str, now: datetime | None = None) -> int:
+        """Events recorded for `username` in the last minute."""
+        with self._lock:
+            signals = self._users.get(username)
+            if signals is None:
+                return 0
+            return signals.requests.count(_to_second(now))
+
+    def failed_login_count(self, username: str, now: datetime | None = None) -> int:
+        """`login_failed` events recorded for `username` in the last five minutes."""
+        with self._lock:
+            signals = self._users.get(username)
+            if signals is None:
+                return 0
+            return signals.failed_logins.count(_to_second(now))
+
+    def last_login(self, username: str) -> tuple | None:
+        """`(ip, user_agent)` of the latest recorded `login_success`, if known."""
+        with self._lock:
+            last = self._last_logins.get(username)
+            return last[1:] if last else None
+
+    def token_ips(self, jti: str, now: datetime | None = None) -> set:
+        # one process: the audit writer's pending IPs already cover unflushed uses
+        return set()
+
+    def evict_idle(self, now: datetime | None = None) -> int:
+        with self._lock:
+            return self._evict(_to_second(now))
+
+    def _evict(self, second: int) -> int:
+        # entries are kept in order of last activity, so idle users sit at the front
+        evicted = 0
+        idle_before = second - FAILED_LOGIN_WINDOW_SECONDS
+        while self._users:
+            username, signals = next(iter(self._users.items()))
+            if len(self._users) <= self.max_users and signals.last_seen > idle_before:
+                break
+            del self._users[username]
+            evicted += 1
+        return evicted
+
+    def rebuild(self, db: Session) -> int:
+        """Reload the counters from the audit events still inside the windows."""
+        rows, logins = _recent_events(db, self.max_users)
+        self.reset()
+        with self._lock:
+            for username, timestamp, ip, user_agent in reversed(logins):
+                self._last_logins[username] = (_to_second(timestamp), ip, user_agent)
+        for username, event_type, timestamp, ip, user_agent in rows:
+            self.record(username, event_type, timestamp, ip=ip, user_agent=user_agent)
+        self.ready = True
+        return len(rows)
+
+    def reset(self):
+        with self._lock:
+            self._users.clear()
+            self._last_logins.clear()
+            self.ready = False
+
+
+def _recent_events(db: Session, max_users: int) -> tuple[list, list]:
+    """Audit events inside the largest window, and each user's latest login."""
+    since = datetime.utcnow() - timedelta(seconds=FAILED_LOGIN_WINDOW_SECONDS)
+    rows = (
+        db.query(AuditLog.username, AuditLog.event_type, AuditLog.timestamp, AuditLog.ip, AuditLog.user_agent)
+        .filter(AuditLog.timestamp >= since)
+        .order_by(AuditLog.timestamp)
+        .all()
+    )
+    latest = (
+        db.query(AuditLog.username, func.max(AuditLog.timestamp).label("timestamp"))
+        .filter(AuditLog.event_type == "login_success")
+        .group_by(AuditLog.username)
+        .subquery()
+    )
+    logins = (
+        db.query(AuditLog.username, AuditLog.timestamp, AuditLog.ip, AuditLog.user_agent)
+        .join(latest, (AuditLog.username == latest.c.username) & (AuditLog.timestamp == latest.c.timestamp))
+        .filter(AuditLog.event_type == "login_success")
+        .order_by(AuditLog.timestamp.desc())
+        .limit(max_users)
+        .all()
+    )
+    return rows, logins
+
+
+def signal_tables() -> dict:
+    """Table layout of the shared store in a memory-mapped file."""
+    return {
+        "requests": WindowTable(RECENT_WINDOW_SECONDS),
+        "failed_logins": WindowTable(FAILED_LOGIN_WINDOW_SECONDS),
+        "logins": LatestTable(64, 256),  # ip, user agent
+        "token_ips": MembersTable(8, 64),
+    }
+
+
+class SharedSignalStore:
+    """`SignalStore` over a shared state backend, for multi-worker deployments.
+
+    Every worker records into and reads from the same counters, so the risk
+    signals, and the decisions made from them, do not depend on which worker
+    served a request. It also tracks the IPs each token was recently used
+    from, so reuse across workers is seen before the audit rows are flushed.
+
+    When the backend fails, the store reports itself not ready for a few
+    seconds and `gather_signals` falls back to SQL in the meantime.
+    """
+
+    RETRY_SECONDS = 5.0
+
+    def __init__(self, backend, max_users: int = 10000):
+        self.backend = backend
+        self.max_users = max_users
+        self._ready = False
+        self._retry_at = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._ready and time.monotonic() >= self._retry_at
+
+    @ready.setter
+    def ready(self, value: bool):
+        self._ready = value
+
+    def _failed(self, exc: Exception):
+        logger.warning("shared signal store unavailable, using SQL for %.0fs: %s", self.RETRY_SECONDS, exc)
+        self._retry_at = time.monotonic() + self.RETRY_SECONDS
+
+    def _record(self, username, event_type, second, ip, user_agent, jti):
+        backend = self.backend
+        if event_type == "login_success":
+            backend.put_latest("logins", username, second, (ip, user_agent))
+        backend.hit("requests", username, second, RECENT_WINDOW_SECONDS)
+        if event_type == "login_failed":
+            backend.hit("failed_logins", username, second, FAILED_LOGIN_WINDOW_SECONDS)
+        if jti and ip:
+            backend.add_member("token_ips", jti, ip, second, TOKEN_IP_WINDOW_SECONDS)
+
+    def record(
+        self,
+        username: str | None,
+        event_type: str | None,
+        timestamp: datetime | None = None,
+        *,
+        ip: str | None = None,
+        user_agent: str | None = None,
+        jti: str | None = None,
+    ):
+        if not username:
+            return
+        try:
+            self._record(username, event_type, _to_second(timestamp), ip, user_agent, jti)
+        except SharedStateError as exc:
+            self._failed(exc)
+
+    def recent_count(self, username: str, now: datetime | None = None) -> int:
+        try:
+            return self.backend.window_count("requests", username, _to_second(now), RECENT_WINDOW_SECONDS)
+        except SharedStateError as exc:
+            self._failed(exc)
+            return 0
+
+    def failed_login_count(self, username: str, now: datetime | None = None) -> int:
+        try:
+            return self.backend.window_count("failed_logins", username, _to_second(now), FAILED_LOGIN_WINDOW_SECONDS)
+        except SharedStateError as exc:
+            self._failed(exc)
+            return 0
+
+    def last_login(self, username: str) -> tuple | None:
+        try:
+            return self.backend.latest("logins", username)
+        except SharedStateError as exc:
+            self._failed(exc)
+            return None
+
+    def token_ips(self, jti: str, now: datetime | None = None) -> set:
+        try:
+            return self.backend.members("token_ips", jti, _to_second(now), TOKEN_IP_WINDOW_SECONDS)
+        except SharedStateError as exc:
+            self._failed(exc)
+            return set()
+
+    def evict_idle(self, now: datetime | None = None) -> int:
+        # the backends bound their own size (fixed tables, or key expiry)
+        return 0
+
+    def rebuild(self, db: Session) -> int:
+        """Reload the shared counters, unless another worker just did.
+
+        Workers starting together rebuild once: the first takes the lock and
+        reloads, the others find a fresh rebuild time and reuse the result.
+        """
+        with self.backend.exclusive():
+            if time.time() - self.backend.rebuilt_at() < REBUILD_GRACE_SECONDS:
+                self._ready = True
+                return 0
+            rows, logins = _recent_events(db, self.max_users)
+            self.backend.clear()
+            for username, timestamp, ip, user_agent in reversed(logins):
+                self.backend.put_latest("logins", username, _to_second(timestamp), (ip, user_agent))
+            for username, event_type, timestamp, ip, user_agent in rows:
+                if username:
+                    self._record(username, event_type, _to_second(timestamp), ip, user_agent, None)
+            self.backend.mark_rebuilt(time.time())
+        self._ready = True
+        return len(rows)
+
+    def reset(self):
+        self._ready = False
+        try:
+            self.backend.clear()
+        except SharedStateError as exc:
+            self._failed(exc)
+
+
+def make_signal_store(backend: str = config.SIGNAL_BACKEND):
+    """The store selected by SIGNAL_BACKEND: "memory" (default), "mmap" or "redis"."""
+    if backend == "redis":
+        return SharedSignalStore(
+            RedisSharedState(config.SIGNAL_REDIS_URL, prefix=config.SIGNAL_REDIS_PREFIX), SIGNAL_STORE_MAX_USERS
+        )
+    if backend == "mmap":
+        if fcntl is not None:
+            return SharedSignalStore(
+                MmapSharedState(config.SIGNAL_MMAP_PATH, signal_tables(), slots=2 * SIGNAL_STORE_MAX_USERS),
+                SIGNAL_STORE_MAX_USERS,
+            )
+        logger.warning("SIGNAL_BACKEND=mmap needs fcntl; using per-process signal counters")
+    elif backend != "memory":
+        raise ValueError(f"unknown SIGNAL_BACKEND {backend!r}")
+    return SignalStore(max_users=SIGNAL_STORE_MAX_USERS)
+
+
+signal_store = make_signal_store()
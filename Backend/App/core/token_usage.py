@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from App.config import JWT_EXP_MINUTES
+from App.core.jwt_handler import EXP_LEEWAY_SECONDS
+from App.database.models import TokenUsage
+
+
+def _use_values(jti, username, ip, user_agent, seen_at, count):
+    seen_at = seen_at or datetime.utcnow()
+    return {"jti": jti, "username": username, "ip": ip, "user_agent": user_agent,
+            "use_count": count, "first_seen": seen_at, "last_seen": seen_at}
+
+
+def _upsert_stmt(dialect: str, values: dict):
+    """INSERT ... ON CONFLICT that adds to an existing row's use_count, or None.
+
+    NULL never conflicts in a unique index, so a use without an ip or user
+    agent can't be upserted and falls back to update-then-insert.
+    """
+    if values["ip"] is None or values["user_agent"] is None:
+        return None
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    stmt = insert(TokenUsage).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=["jti", "ip", "user_agent"],
+        set_={"use_count": TokenUsage.use_count + stmt.excluded.use_count, "last_seen": stmt.excluded.last_seen},
+    )
+
+
+def _update_stmt(values: dict):
+    return (
+        update(TokenUsage)
+        # == None compiles to IS NULL
+        .where(TokenUsage.jti == values["jti"], TokenUsage.ip == values["ip"],
+               TokenUsage.user_agent == values["user_agent"])
+        .values(use_count=TokenUsage.use_count + values["use_count"], last_seen=values["last_seen"])
+    )
+
+
+def record_token_use(
+    db: Session,
+    jti: str,
+    *,
+    username: str | None = None,
+    ip: str | None = None,
+    user_agent: str | None = None,
+    seen_at: datetime | None = None,
+    count: int = 1,
+):
+    """Add `count` uses to the usage row for this (jti, ip, user agent), creating it if needed.
+
+    A single upsert, so concurrent first uses of a token can't both insert.
+    The caller owns the transaction; nothing is committed here.
+    """
+    values = _use_values(jti, username, ip, user_agent, seen_at, count)
+    stmt = _upsert_stmt(db.get_bind().dialect.name, values)
+    if stmt is not None:
+        db.execute(stmt)
+    elif not db.execute(_update_stmt(values)).rowcount:
+        # flushed so the next update in this transaction finds it
+        db.add(TokenUsage(**values))
+        db.flush()
+
+
+async def record_token_use_async(
+    db: AsyncSession,
+    jti: str,
+    *,
+    username: str | None = None,
+    ip: str | None = None,
+    user_agent: str | None = None,
+    seen_at: datetime | None = None,
+    count: int = 1,
+):
+    """Async variant of `record_token_use`."""
+    values = _use_values(jti, username, ip, user_agent, seen_at, count)
+    stmt = _upsert_stmt(db.get_bind().dialect.name, values)
+    if stmt is not None:
+        await db.execute(stmt)
+    elif not (await db.execute(_update_stmt(values))).rowcount:
+        db.add(TokenUsage(**values))
+        await db.flush()
+
+
+def token_reuse_query(jti: str, ip: str | None = None, pending_ips=()):
+    """Select the distinct IPs, other than `ip` and `pending_ips`, seen for `jti`."""
+    stmt = select(func.count(func.distinct(TokenUsage.ip))).where(
+        TokenUsage.jti == jti,
+        TokenUsage.ip.isnot(None),
+    )
+    if ip:
+        stmt = stmt.where(TokenUsage.ip != ip)
+    if pending_ips:
+        stmt = stmt.where(TokenUsage.ip.notin_(pending_ips))
+    return stmt
+
+
+def token_reuse_count(db: Session, jti: str, ip: str | None = None, pending_ips=()) -> int:
+    """Number of IPs, other than `ip`, the token has already been presented from.
+
+    A token only ever used from one address scores 0; the same jti showing up
+    from several addresses is the reuse / theft signal the risk engine weighs.
+    `pending_ips` adds addresses from uses that are queued but not yet written.
+    """
+    pending = set(pending_ips) - {ip, None}
+    return (db.execute(token_reuse_query(jti, ip, pending)).scalar() or 0) + len(pending)
+
+
+async def token_reuse_count_async(db: AsyncSession, jti: str, ip: str | None = None, pending_ips=()) -> int:
+    """Async variant of `token_reuse_count`."""
+    pending = set(pending_ips) - {ip, None}
+    return ((await db.execute(token_reuse_query(jti, ip, pending))).scalar() or 0) + len(pending)
+
+
+def purge_stale(db: Session, now: datetime | None = None, batch_size: int = 1000) -> int:
+    """Delete usage rows whose token must have expired, in committed batches.
+
+    A token is used before it expires, so once `last_seen` is more than a
+    token lifetime (plus the decode leeway) ago, the token can't be presented again.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(minutes=JWT_EXP_MINUTES, seconds=EXP_LEEWAY_SECONDS)
+    purged = 0
+    while True:
+        ids = select(TokenUsage.id).where(TokenUsage.last_seen < cutoff).limit(batch_size)
+        deleted = db.execute(delete(TokenUsage).where(TokenUsage.id.in_(ids))).rowcount or 0
+        db.commit()
+        purged += deleted
+        if deleted < batch_size:
+            return purged
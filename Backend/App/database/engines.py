@@ -0,0 +1,108 @@
+"""Engine factory: SQLite tuning and the writer / reader split.
+
+SQLite allows one writer at a time, so the writer engine keeps a small pool
+(DB_WRITE_POOL_SIZE, 1 by default) and waits for the lock via busy_timeout
+instead of failing with "database is locked". In WAL mode readers never block
+the writer or each other, so reads that don't need to write (risk signals,
+admin log queries, credential lookups) go to a separate, larger pool of
+connections opened with `PRAGMA query_only`.
+
+Every SQLite connection gets journal_mode=WAL (persistent in the file once
+set), synchronous, busy_timeout, cache_size and mmap_size when it is opened.
+Other backends just get the pool sizes; set DATABASE_READ_URL to send the
+reads to a replica. In-memory SQLite has no separate readers (each
+connection would be its own empty database), so the writer is returned.
+"""
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from App import config
+
+
+def is_sqlite(url) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def is_memory(url) -> bool:
+    url = make_url(url)
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+
+_SYNCHRONOUS = {"OFF", "NORMAL", "FULL", "EXTRA", "0", "1", "2", "3"}
+
+
+def sqlite_pragmas(read_only: bool = False) -> list[str]:
+    synchronous = str(config.SQLITE_SYNCHRONOUS).upper()
+    if synchronous not in _SYNCHRONOUS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {sorted(_SYNCHRONOUS)}")
+    pragmas = []
+    if config.SQLITE_WAL:
+        pragmas.append("PRAGMA journal_mode=WAL")
+    pragmas += [
+        f"PRAGMA synchronous={synchronous}",
+        f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}",
+        # negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size={-int(config.SQLITE_CACHE_SIZE_KB)}",
+        f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=1")
+    return pragmas
+
+
+def apply_sqlite_pragmas(engine, read_only: bool = False):
+    """Run the tuning pragmas on every new DBAPI connection of `engine`.
+
+    For an AsyncEngine pass `async_engine.sync_engine`.
+    """
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    return engine
+
+
+def create_db_engine(url, *, read_only: bool = False):
+    """Build the writer engine, or a reader with `read_only=True`."""
+    if read_only:
+        pool = dict(pool_size=config.DB_READ_POOL_SIZE, max_overflow=config.DB_READ_MAX_OVERFLOW)
+    else:
+        pool = dict(pool_size=config.DB_WRITE_POOL_SIZE, max_overflow=config.DB_WRITE_MAX_OVERFLOW)
+    pool["pool_timeout"] = config.DB_POOL_TIMEOUT
+
+    if not is_sqlite(url):
+        return create_engine(url, pool_pre_ping=True, **pool)
+
+    connect_args = {
+        "check_same_thread": False,
+        # the driver's own lock wait, in seconds; busy_timeout covers the rest
+        "timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+    }
+    if is_memory(url):
+        # single shared connection per thread; pool sizing does not apply
+        return create_engine(url, connect_args=connect_args)
+    engine = create_engine(url, connect_args=connect_args, **pool)
+    return apply_sqlite_pragmas(engine, read_only)
+
+
+def create_read_engine(url, writer, read_url: str | None = None):
+    """The engine for read-only work: a replica, a query_only pool, or `writer`."""
+    if read_url:
+        return create_db_engine(read_url, read_only=is_sqlite(read_url))
+    if not is_sqlite(url) or is_memory(url):
+        return writer
+    return create_db_engine(url, read_only=True)
+
+
+def async_url_for(url) -> str | None:
+    """The async driver URL for `url`, when one can be derived."""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return None
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -26,11 +26,81 @@ class AuditLog(Base):
     suspicious = Column(Integer, default=0)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    # match the filters used by the risk checks and the admin log views
+    __table_args__ = (
+        Index("ix_audit_logs_username_timestamp", "username", "timestamp"),
+        Index("ix_audit_logs_username_event_timestamp", "username", "event_type", "timestamp"),
+        Index("ix_audit_logs_timestamp_desc", timestamp.desc()),
+    )
+
 
 class RefreshToken(Base):
+    """One row per live session: the digest of its current refresh token."""
     __tablename__ = "refresh_tokens"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    token = Column(String, nullable=False, unique=True)
+    # hex SHA-256 of the token; the column keeps its original name
+    token_hash = Column("token", String(64), nullable=False, unique=True)
+    jti = Column(String(32), nullable=True)
+    family = Column(String(32), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_refresh_tokens_family", "family"),
+        Index("ix_refresh_tokens_expires_at", "expires_at"),
+        Index("ix_refresh_tokens_user_id", "user_id"),
+    )
+
+
+class RevokedToken(Base):
+    """A revoked access token (jti), or every token of `username` issued before `revoked_at`."""
+    __tablename__ = "revoked_tokens"
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String, nullable=True, unique=True)
+    username = Column(String, nullable=True)
+    revoked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    reason = Column(String, nullable=True)
+    revoked_by = Column(String, nullable=True)
+
+    # workers sync on `id > last seen`, so ids must never be reused after a purge
+    __table_args__ = (
+        Index("ix_revoked_tokens_expires_at", "expires_at"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class TokenUsage(Base):
+    """Distinct (ip, user agent) pairs an access token (jti) has been presented from."""
+    __tablename__ = "token_usage"
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String, nullable=False)
+    username = Column(String, nullable=True)
+    ip = Column(String, nullable=True)
+    user_agent = Column(String, nullable=True)
+    use_count = Column(Integer, default=1)
+    first_seen = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("jti", "ip", "user_agent", name="uq_token_usage_jti_ip_ua"),
+        Index("ix_token_usage_jti_ip", "jti", "ip"),
+        Index("ix_token_usage_last_seen", "last_seen"),
+    )
+
+
+class AuditRollup(Base):
+    # per-minute audit event counts, maintained as events are written
+    __tablename__ = "audit_rollups"
+    id = Column(Integer, primary_key=True, index=True)
+    minute = Column(Integer, nullable=False)  # epoch minute (UTC)
+    dimension = Column(String, nullable=False)  # total, decision, endpoint, user or risk
+    key = Column(String, nullable=False, default="")
+    count = Column(Integer, nullable=False, default=0)
+    suspicious = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("dimension", "key", "minute", name="uq_audit_rollups_dimension_key_minute"),
+        Index("ix_audit_rollups_dimension_minute", "dimension", "minute"),
+    )
@@ -0,0 +1,43 @@
+import threading
+import weakref
+from App.database.models import Base
+
+# engines whose tables have already been checked / created
+_ready: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _engine_of(bind):
+    # Session.get_bind() may hand back a Connection; key the registry on its Engine
+    return getattr(bind, "engine", bind)
+
+
+def is_ready(bind) -> bool:
+    return _ready.get(_engine_of(bind), False)
+
+
+def ensure_schema(bind) -> bool:
+    """Create any missing tables on `bind`, once per engine.
+
+    The first call for an engine runs `create_all` (which inspects the
+    database); later calls are a dictionary lookup. Returns True when the
+    check actually ran.
+    """
+    engine = _engine_of(bind)
+    if _ready.get(engine):
+        return False
+    with _lock:
+        if _ready.get(engine):
+            return False
+        Base.metadata.create_all(bind=engine)
+        _ready[engine] = True
+        return True
+
+
+def invalidate(bind=None):
+    """Forget the readiness of `bind` (or of every engine) so the next call re-checks."""
+    with _lock:
+        if bind is None:
+            _ready.clear()
+        else:
+            _ready.pop(_engine_of(bind), None)
@@ -1,15 +1,39 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from pathlib import Path
+from App import config
+from App.database.engines import apply_sqlite_pragmas, async_url_for, create_db_engine, create_read_engine, is_memory, is_sqlite
+from App.database.schema import ensure_schema
+from App.core.metrics import metrics
+import time
 
 # Place the SQLite DB next to this file for predictable location
 db_path = Path(__file__).resolve().parent / "accessguard.db"
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{db_path.as_posix()}"
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL or f"sqlite:///{db_path.as_posix()}"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# `engine` is the writer; `read_engine` serves read-only work (see engines.py)
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = create_read_engine(SQLALCHEMY_DATABASE_URL, engine, config.DATABASE_READ_URL or None)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Async engine for the non-blocking request path (DB_MODE=async). Created on
+# first use so sync-only deployments don't need the aiosqlite driver.
+ASYNC_SQLALCHEMY_DATABASE_URL = config.DATABASE_ASYNC_URL or async_url_for(SQLALCHEMY_DATABASE_URL)
+_async_sessionmaker = None
+
+
+def get_async_sessionmaker():
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+        if not ASYNC_SQLALCHEMY_DATABASE_URL:
+            raise RuntimeError("DB_MODE=async needs DATABASE_ASYNC_URL for this DATABASE_URL")
+        async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL)
+        if is_sqlite(ASYNC_SQLALCHEMY_DATABASE_URL) and not is_memory(ASYNC_SQLALCHEMY_DATABASE_URL):
+            apply_sqlite_pragmas(async_engine.sync_engine)
+        _async_sessionmaker = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
 
 
 def get_db():
@@ -20,6 +44,17 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+_default_get_db = get_db
+
+
 def provide_db():
     """Wrapper dependency that calls the current `get_db` implementation.
 
@@ -27,13 +62,15 @@ def provide_db():
     and have the wrapper call the patched function at runtime.
     """
     # call the module-level get_db (may be monkeypatched in tests)
+    started = time.perf_counter()
     gen = get_db()
     try:
         db = next(gen)
     except StopIteration:
         return
 
-    # Ensure tables exist on the session bind if available.
+    # Ensure tables exist on the session bind. The schema registry checks
+    # each engine once, so after the first request this is a dict lookup.
     try:
         # Use Session.get_bind() which is more reliable across SQLAlchemy
         # versions to find the engine associated with this Session.
@@ -44,14 +81,41 @@ def provide_db():
             bind = getattr(db, "bind", None)
 
         if bind is not None:
-            from App.database.models import Base as ModelsBase
+            ensure_schema(bind)
+    except Exception:
+        pass
+    metrics.observe("db_session", time.perf_counter() - started)
+
+    try:
+        yield db
+    finally:
+        try:
+            next(gen)
+        except StopIteration:
+            pass
+
 
-            try:
-                ModelsBase.metadata.create_all(bind=bind)
-            except Exception:
-                pass
+def provide_read_db():
+    """Session on the read-only engine, for queries that never write.
+
+    When `get_db` has been monkeypatched (tests), this yields the patched
+    session instead so reads and writes see the same database.
+    """
+    if get_db is not _default_get_db:
+        yield from provide_db()
+        return
+    started = time.perf_counter()
+    gen = get_read_db()
+    try:
+        db = next(gen)
+    except StopIteration:
+        return
+    # read-only connections can't create tables; make sure the writer has
+    try:
+        ensure_schema(engine)
     except Exception:
         pass
+    metrics.observe("db_session", time.perf_counter() - started)
 
     try:
         yield db
@@ -60,3 +124,28 @@ def provide_db():
             next(gen)
         except StopIteration:
             pass
+
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+async def provide_async_db():
+    """Async counterpart of `provide_db`.
+
+    Calls the module-level `get_async_db` at runtime so tests can monkeypatch
+    it. Tables are expected to exist already (created at startup).
+    """
+    gen = get_async_db()
+    try:
+        db = await gen.__anext__()
+    except StopAsyncIteration:
+        return
+    try:
+        yield db
+    finally:
+        try:
+            await gen.__anext__()
+        except StopAsyncIteration:
+            pass
@@ -1,12 +1,17 @@
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from App import config
 from App.core.jwt_handler import decode_access_token
 from App.core.risk_engine import calculate_risk, evaluate_risk_score
-from App.core.audit_logger import log_access
+from App.core.audit_logger import log_access, log_access_async
+from App.core.audit_writer import audit_writer
+from App.core.risk_signals import gather_signals, gather_signals_async
+from App.core.metrics import annotate_user, metrics, route_label
+from App.core.revocation import revocations
 from App.database import session as db_session
-from App.database.models import AuditLog
-from datetime import datetime, timedelta
 from typing import List, Optional
 import hashlib
 
@@ -19,57 +24,24 @@ def require_roles(*required_roles: str):
 
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
-    async def _dependency(request: Request, db: Session = Depends(db_session.provide_db), token: str = Depends(oauth2_scheme)):
-        # Use OAuth2 scheme for token extraction
-        payload = decode_access_token(token)
+    async def _evaluate(request: Request, db, token: str, is_async: bool, read_db=None):
+        route = route_label(request)
+        with metrics.stage("require_roles", route):
+            return await _checked(request, db, read_db or db, token, is_async, route)
+
+    async def _checked(request: Request, db, read_db, token: str, is_async: bool, route: str):
+        with metrics.stage("jwt_decode", route):
+            payload = decode_access_token(token)
         username = payload.get("username")
         role = payload.get("role")
         if not username or not role:
             raise HTTPException(status_code=401, detail="Invalid token payload")
+        annotate_user(username)
 
         endpoint = request.url.path
 
-        # Calculate recent request count for this user (last 1 minute)
-        window = datetime.utcnow() - timedelta(minutes=1)
-        try:
-            recent_count = db.query(AuditLog).filter(
-                AuditLog.username == username,
-                AuditLog.timestamp >= window,
-            ).count()
-        except Exception:
-            recent_count = 0
-
-        # failed login attempts in last 5 minutes
-        window_failed = datetime.utcnow() - timedelta(minutes=5)
-        try:
-            failed_login_count = db.query(AuditLog).filter(
-                AuditLog.username == username,
-                AuditLog.event_type == "login_failed",
-                AuditLog.timestamp >= window_failed,
-            ).count()
-        except Exception:
-            failed_login_count = 0
-
-        # token metrics
         jti = payload.get("jti")
-        iat = payload.get("iat")
-        token_age_seconds = 0
-        if iat:
-            try:
-                token_age_seconds = int(datetime.utcnow().timestamp()) - int(iat)
-            except Exception:
-                token_age_seconds = 0
-
-        token_reuse_count = 0
-        if jti:
-            try:
-                token_reuse_count = db.query(AuditLog).filter(
-                    AuditLog.details.like(f"%jti:{jti}%"),
-                ).count()
-            except Exception:
-                token_reuse_count = 0
-
-        # detect IP / UA change compared to last successful login
+
         ip = None
         try:
             ip = request.client.host
@@ -78,45 +50,41 @@ def require_roles(*required_roles: str):
 
         user_agent = request.headers.get("user-agent")
 
-        last_success = None
-        try:
-            last_success = (
-                db.query(AuditLog)
-                .filter(AuditLog.username == username, AuditLog.event_type == "login_success")
-                .order_by(AuditLog.timestamp.desc())
-                .first()
-            )
-        except Exception:
-            last_success = None
-
-        ip_change = False
-        ua_change = False
-        if last_success:
-            if ip and last_success.ip and ip != last_success.ip:
-                ip_change = True
-            if user_agent and last_success.user_agent and user_agent != last_success.user_agent:
-                ua_change = True
-
-        req_roles: Optional[List[str]] = list(required_roles) if required_roles else None
-        risk_score = calculate_risk(
-            role,
-            endpoint,
-            request_count=recent_count,
-            required_roles=req_roles,
-            failed_login_count=failed_login_count,
-            token_age_seconds=token_age_seconds,
-            token_reuse_count=token_reuse_count,
-            ip_change=ip_change,
-            ua_change=ua_change,
+        # Bloom filter in memory; the table is only read on a filter hit
+        with metrics.stage("revocation_check", route):
+            if is_async:
+                revoked = await revocations.is_revoked_async(payload, db)
+            else:
+                revoked = await run_in_threadpool(revocations.is_revoked, payload, read_db)
+        if revoked:
+            revoked_args = dict(ip=ip, event_type="revoked_token", user_agent=user_agent, suspicious=1, jti=jti,
+                                details=f"jti:{jti}" if jti else None)
+            if is_async:
+                await log_access_async(db, username, endpoint, None, "deny", **revoked_args)
+            else:
+                await run_in_threadpool(lambda: log_access(db, username, endpoint, None, "deny", **revoked_args))
+            metrics.count_decision(route, "revoked")
+            raise HTTPException(status_code=401, detail="Token revoked")
+
+        # request rate, failed logins, token reuse and IP/UA change in one pass
+        signal_args = dict(
+            jti=jti,
+            iat=payload.get("iat"),
+            ip=ip,
+            user_agent=user_agent,
+            pending_ips=audit_writer.pending_ips(jti) if jti else (),
         )
-        decision = evaluate_risk_score(risk_score)
-
-        # extract client IP when available
-        ip = None
-        try:
-            ip = request.client.host
-        except Exception:
-            ip = None
+        with metrics.stage("risk_signals", route):
+            if is_async:
+                signals = await gather_signals_async(db, username, **signal_args)
+            else:
+                signals = await run_in_threadpool(lambda: gather_signals(read_db, username, **signal_args))
+
+        with metrics.stage("risk_scoring", route):
+            req_roles: Optional[List[str]] = list(required_roles) if required_roles else None
+            risk_score = calculate_risk(role, endpoint, required_roles=req_roles, **signals.as_kwargs())
+            decision = evaluate_risk_score(risk_score)
+        metrics.count_decision(route, decision)
 
         details = None
         if jti:
@@ -125,25 +93,37 @@ def require_roles(*required_roles: str):
             details = (details + ";" if details else "") + "Raised to allow+log"
 
         # Log every request with structured fields
-        log_access(
-            db,
-            username,
-            endpoint,
-            risk_score,
-            decision,
+        log_args = dict(
             ip=ip,
             details=details,
             event_type="api_call",
             user_agent=user_agent,
-            suspicious=1 if token_reuse_count or failed_login_count >= 10 else 0,
+            suspicious=1 if signals.token_reuse_count or signals.failed_login_count >= 10 else 0,
+            jti=jti,
         )
+        with metrics.stage("audit_log", route):
+            if is_async:
+                await log_access_async(db, username, endpoint, risk_score, decision, **log_args)
+            else:
+                await run_in_threadpool(lambda: log_access(db, username, endpoint, risk_score, decision, **log_args))
 
         if decision == "deny":
             raise HTTPException(status_code=403, detail="Access denied by Zero-Trust policy")
 
         return {"username": username, "role": role, "risk_score": risk_score, "decision": decision}
 
-    return _dependency
+    async def _dependency(request: Request, db: Session = Depends(db_session.provide_db),
+                          read_db: Session = Depends(db_session.provide_read_db), token: str = Depends(oauth2_scheme)):
+        # Use OAuth2 scheme for token extraction; signal queries go to the read pool.
+        # Blocking DB calls run on the threadpool so a request waiting for the
+        # writer connection can't stall the loop the holder needs to finish.
+        return await _evaluate(request, db, token, is_async=False, read_db=read_db)
+
+    async def _async_dependency(request: Request, db: AsyncSession = Depends(db_session.provide_async_db), token: str = Depends(oauth2_scheme)):
+        # AsyncSession path: DB work awaits instead of blocking the event loop
+        return await _evaluate(request, db, token, is_async=True)
+
+    return _async_dependency if config.DB_MODE == "async" else _dependency
 
 
 # Backwards-compatible default dependency (no required roles)
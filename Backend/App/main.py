@@ -1,9 +1,10 @@
+import time
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 # Support running as a package (recommended) and as a script
 try:
-	from .routers import auth, admin, user, public
+	from .routers import auth, admin, user, public, metrics as metrics_routes
 except Exception:
 	import sys
 	from pathlib import Path
@@ -14,7 +15,7 @@ except Exception:
 	pkg_root = Path(__file__).resolve().parent.parent
 	if str(pkg_root) not in sys.path:
 		sys.path.insert(0, str(pkg_root))
-	from App.routers import auth, admin, user, public
+	from App.routers import auth, admin, user, public, metrics as metrics_routes
 
 
 app = FastAPI(title="AccessGuard Zero-Trust API")
@@ -38,16 +39,69 @@ app.include_router(auth.router)
 app.include_router(admin.router)
 app.include_router(user.router)
 app.include_router(public.router)
+app.include_router(metrics_routes.router)
 
 
-from App.database.models import Base
-from App.database.session import engine
+from App.database.session import engine, ReadSessionLocal
+from App.database.schema import ensure_schema
+from App.core.signal_store import signal_store
+from App.core.audit_writer import audit_writer
+from App.core.refresh_tokens import refresh_purger
+from App.migrate import migrate
+from App.core.security import password_pool
+from App.core.login_throttle import login_throttle_reporter
+from App.core.policy import policy_manager
+from App.core.metrics import metrics, route_label
+from App.core.profiler import profiler
+from App.config import AUDIT_WRITER_MODE
+
+
+if metrics.enabled:
+	@app.middleware("http")
+	async def time_requests(request, call_next):
+		# whole-request latency per route, next to the per-stage timings
+		started = time.perf_counter()
+		try:
+			return await call_next(request)
+		finally:
+			metrics.observe("http_request", time.perf_counter() - started, route_label(request))
+
+
+if profiler.enabled:
+	@app.middleware("http")
+	async def profile_slow_requests(request, call_next):
+		# keeps call stacks only for requests over the threshold (or sampled)
+		return await profiler.handle(request, call_next)
 
 
 @app.on_event("startup")
 def startup_event():
-	# Ensure database tables exist when the app starts
-	Base.metadata.create_all(bind=engine)
+	# Ensure database tables and columns exist when the app starts
+	migrate(engine)
+	ensure_schema(engine)
+	# Warm the risk signal counters from recent audit events
+	db = ReadSessionLocal()
+	try:
+		signal_store.rebuild(db)
+	finally:
+		db.close()
+	if AUDIT_WRITER_MODE == "batched":
+		audit_writer.start()
+	# Delete expired refresh tokens in the background
+	refresh_purger.start()
+	# Audit blocked login attempts held back when an attack stops
+	login_throttle_reporter.start()
+	# Compile the risk policy now rather than on the first request
+	policy_manager.current()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+	# Write out any audit events still queued by the batched writer
+	audit_writer.stop()
+	refresh_purger.stop()
+	login_throttle_reporter.stop()
+	password_pool.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+"""Bring an existing database up to date with the models without dropping data.
+
+Creates missing tables, adds missing nullable columns and any indexes
+declared on the models that the database does not have yet, rebuilds SQLite
+tables that should have AUTOINCREMENT ids (revoked_tokens), then runs the
+data backfills (refresh tokens stored raw are replaced by their digest, and
+a new audit_rollups table is counted up from the existing audit logs).
+Safe to run repeatedly.
+
+Usage: python -m App.migrate [database_url]
+"""
+import sys
+from sqlalchemy import create_engine, func, inspect, select, text, update
+from sqlalchemy.orm import Session
+from App.core.audit_rollup import rebuild_rollups
+from App.core.refresh_tokens import hash_token
+from App.database.models import AuditRollup, Base, RefreshToken
+
+
+def _hash_raw_refresh_tokens(bind) -> int:
+    # earlier versions stored the full token; a hex SHA-256 digest is 64 chars
+    hashed = 0
+    with bind.begin() as conn:
+        rows = conn.execute(
+            select(RefreshToken.id, RefreshToken.token_hash).where(func.length(RefreshToken.token_hash) != 64)
+        ).all()
+        for row_id, token in rows:
+            conn.execute(update(RefreshToken).where(RefreshToken.id == row_id).values(token_hash=hash_token(token)))
+            hashed += 1
+    return hashed
+
+
+def _sqlite_autoincrement(bind, table) -> bool:
+    """Rebuild an SQLite `table` whose model asks for AUTOINCREMENT but that was created without it."""
+    if bind.dialect.name != "sqlite" or not table.dialect_options["sqlite"]["autoincrement"]:
+        return False
+    with bind.begin() as conn:
+        sql = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+        ).scalar()
+        if sql is None or "AUTOINCREMENT" in sql.upper():
+            return False
+        # copying the rows with their ids seeds sqlite_sequence with the current maximum
+        old = f"{table.name}_old"
+        conn.execute(text(f'ALTER TABLE {table.name} RENAME TO "{old}"'))
+        for index in table.indexes:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+        table.create(bind=conn)
+        columns = ", ".join(f'"{c.name}"' for c in table.columns)
+        conn.execute(text(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM "{old}"'))
+        conn.execute(text(f'DROP TABLE "{old}"'))
+    return True
+
+
+def migrate(bind) -> list[str]:
+    """Apply pending schema changes to `bind` and return what was created."""
+    applied = []
+    existing_tables = set(inspect(bind).get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            table.create(bind=bind)
+            applied.append(f"table {table.name}")
+            continue
+        existing_columns = {c["name"] for c in inspect(bind).get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns and column.nullable:
+                col_type = column.type.compile(dialect=bind.dialect)
+                with bind.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+                applied.append(f"column {table.name}.{column.name}")
+        existing_indexes = {ix["name"] for ix in inspect(bind).get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name not in existing_indexes:
+                index.create(bind=bind)
+                applied.append(f"index {index.name}")
+        if _sqlite_autoincrement(bind, table):
+            applied.append(f"autoincrement ids for {table.name}")
+    hashed = _hash_raw_refresh_tokens(bind)
+    if hashed:
+        applied.append(f"hashed {hashed} refresh tokens")
+    if AuditRollup.__tablename__ not in existing_tables and "audit_logs" in existing_tables:
+        with Session(bind=bind) as db:
+            counted = rebuild_rollups(db)
+        if counted:
+            applied.append(f"rolled up {counted} audit events")
+    return applied
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        target = create_engine(sys.argv[1])
+    else:
+        from App.database.session import engine as target
+
+    changes = migrate(target)
+    if changes:
+        for change in changes:
+            print("created", change)
+    else:
+        print("Database schema is up to date")
@@ -1,11 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from App.dependencies import require_roles
 from App.database import session as db_session
 from App.database.models import User, AuditLog
 from App.schemas.user import UserCreate, UserOut
-from App.core.security import hash_password
-from App.core.audit_logger import get_logs as core_get_logs
+from App.core.security import hash_password_pooled
+from App.core.audit_query import (
+    LogFilters, LOG_COLUMNS, LOG_FIELDS, MAX_PAGE_SIZE, etag_matches, logs_etag, query_logs, query_since, iter_logs,
+    serialize_row,
+)
+from App.core.event_bus import event_bus, stream
+from App import config
+from App.core.profiler import profiler, collapsed
+from App.core.revocation import revocations
+from App.core.login_throttle import login_throttle
+from App.core.audit_logger import log_access
+from App.core import audit_rollup
+from datetime import datetime, timedelta
+from typing import Optional
+import csv
+import io
+import json
 
 router = APIRouter(prefix="/admin")
 
@@ -17,26 +35,284 @@ def get_data(user=Depends(require_roles("admin"))):
 def get_settings(user=Depends(require_roles("admin"))):
     return {"message": "Admin settings", "user": user}
 
+def _log_filters(
+    user: Optional[str] = None,
+    event_type: Optional[str] = None,
+    decision: Optional[str] = None,
+    suspicious: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> LogFilters:
+    return LogFilters(username=user, event_type=event_type, decision=decision, suspicious=suspicious, since=since, until=until)
+
+
 @router.get("/logs")
-def get_logs(user=Depends(require_roles("admin")), db: Session = Depends(db_session.provide_db)):
-    # use core audit logger helper to fetch logs
-    logs = core_get_logs(db, limit=200)
-    out = []
-    for l in logs:
-        out.append({
-            "id": l.id,
-            "username": l.username,
-            "event_type": l.event_type,
-            "endpoint": l.endpoint,
-            "risk_score": l.risk_score,
-            "decision": l.decision,
-            "ip": l.ip,
-            "user_agent": l.user_agent,
-            "details": l.details,
-            "suspicious": l.suspicious,
-            "timestamp": l.timestamp.isoformat() if l.timestamp else None,
-        })
-    return out
+def get_logs(
+    request: Request,
+    response: Response,
+    limit: int = Query(200, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = Query(None, ge=0),
+    filters: LogFilters = Depends(_log_filters),
+    user=Depends(require_roles("admin")),
+    db: Session = Depends(db_session.provide_read_db),
+):
+    """Newest first; pass the X-Next-Cursor header back as `cursor` for the next page.
+
+    With `since_id`, only rows with a higher id are returned, oldest first,
+    and X-Last-Id carries the watermark for the next poll. A matching
+    If-None-Match is answered with 304 after a single max-id lookup. The
+    caller's own polls don't change the tag (see `logs_etag`) but are still
+    returned with the other rows.
+    """
+    if cursor is not None and since_id is not None:
+        raise HTTPException(status_code=400, detail="Use either cursor or since_id")
+    etag = logs_etag(db, filters, poller=user["username"], limit=limit, cursor=cursor, since_id=since_id)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    if since_id is not None:
+        logs = query_since(db, filters, since_id, limit=limit)
+        response.headers["X-Last-Id"] = str(logs[-1]["id"] if logs else since_id)
+        return logs
+    try:
+        logs, next_cursor = query_logs(db, filters, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return logs
+
+
+@router.get("/logs/export")
+def export_logs(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    filters: LogFilters = Depends(_log_filters),
+    user=Depends(require_roles("admin")),
+    db: Session = Depends(db_session.provide_read_db),
+):
+    """Stream every matching log as NDJSON or CSV, one keyset chunk at a time."""
+
+    def ndjson():
+        for rows in iter_logs(db, filters):
+            yield "".join(json.dumps(serialize_row(r)) + "\n" for r in rows)
+
+    def csv_rows():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(LOG_FIELDS)
+        for rows in iter_logs(db, filters):
+            for r in rows:
+                writer.writerow(serialize_row(r).values())
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        yield buf.getvalue()
+
+    if format == "csv":
+        return StreamingResponse(csv_rows(), media_type="text/csv",
+                                 headers={"Content-Disposition": "attachment; filename=audit_logs.csv"})
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+_DIMENSION_PATTERN = "^(" + "|".join(audit_rollup.DIMENSIONS) + ")$"
+
+
+def _stats_range(since: Optional[datetime], until: Optional[datetime]) -> tuple[datetime, datetime]:
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(days=1)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="`since` must be before `until`")
+    return since, until
+
+
+@router.get("/stats/series")
+def stats_series(
+    dimension: str = Query("total", pattern=_DIMENSION_PATTERN),
+    key: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    bucket: Optional[int] = Query(None, ge=1, le=10080, description="bucket width in minutes"),
+    top: int = Query(10, ge=1, le=100),
+    user=Depends(require_roles("admin")),
+    db: Session = Depends(db_session.provide_read_db),
+):
+    """Event counts over time from the per-minute rollups.
+
+    Without `key`, dimensions with many keys (endpoint, user) are limited to
+    the `top` busiest keys in the range.
+    """
+    since, until = _stats_range(since, until)
+    bucket = bucket or audit_rollup.pick_bucket(since, until)
+    if key is not None:
+        keys = [key]
+    elif dimension in ("endpoint", "user"):
+        keys = [row["key"] for row in audit_rollup.top_keys(db, dimension, since, until, limit=top)]
+    else:
+        keys = None
+    try:
+        points = audit_rollup.series(db, dimension, since, until, bucket, keys=keys)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"dimension": dimension, "since": since.isoformat(), "until": until.isoformat(),
+            "bucket_minutes": bucket, "points": points}
+
+
+@router.get("/stats/top")
+def stats_top(
+    dimension: str = Query("endpoint", pattern=_DIMENSION_PATTERN),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(10, ge=1, le=100),
+    user=Depends(require_roles("admin")),
+    db: Session = Depends(db_session.provide_read_db),
+):
+    since, until = _stats_range(since, until)
+    return audit_rollup.top_keys(db, dimension, since, until, limit=limit)
+
+
+@router.get("/stats/risk")
+def stats_risk_histogram(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user=Depends(require_roles("admin")),
+    db: Session = Depends(db_session.provide_read_db),
+):
+    # every bucket is listed, empty ones included, lowest score first
+    since, until = _stats_range(since, until)
+    found = {row["key"]: row for row in audit_rollup.top_keys(db, "risk", since, until, limit=100)}
+    return [
+        found.get(b, {"key": b, "count": 0, "suspicious": 0})
+        for b in (audit_rollup.risk_bucket(score) for score in range(0, 100, audit_rollup.RISK_BUCKET))
+    ]
+
+
+async def _auth_sessions(db: Session = Depends(db_session.provide_db)):
+    # the sessions require_roles ran on (shared through the dependency cache)
+    return [db]
+
+
+async def _auth_async_sessions(db=Depends(db_session.provide_async_db)):
+    return [db]
+
+
+@router.get("/logs/stream")
+async def stream_logs(
+    request: Request,
+    last_event_id: Optional[int] = Query(None, ge=0),
+    filters: LogFilters = Depends(_log_filters),
+    user=Depends(require_roles("admin")),
+    db: Session = Depends(db_session.provide_read_db),
+    auth_sessions=Depends(_auth_async_sessions if config.DB_MODE == "async" else _auth_sessions),
+):
+    """Push matching audit events as Server-Sent Events.
+
+    Resumes after `Last-Event-ID` (header, or `last_event_id` for clients
+    that can't set headers) by replaying newer rows first.
+
+    Every session is closed before the response starts: dependency teardown
+    only runs once the stream ends, and a stream can stay open for hours.
+    """
+    try:
+        header = request.headers.get("last-event-id")
+        if header is not None:
+            try:
+                last_event_id = int(header)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+        # subscribe before the replay query so nothing falls between the two
+        sub = event_bus.subscribe(filters)
+        replay, truncated = [], False
+        if last_event_id is not None:
+            limit = config.EVENT_STREAM_REPLAY_LIMIT
+            stmt = filters.apply(select(*LOG_COLUMNS)).where(AuditLog.id > last_event_id)
+            try:
+                replay = await run_in_threadpool(
+                    lambda: db.execute(stmt.order_by(AuditLog.id).limit(limit + 1)).all())
+            except Exception:
+                sub.close()
+                raise
+            truncated = len(replay) > limit
+            replay = replay[:limit]
+    finally:
+        await run_in_threadpool(db.close)
+        for session in auth_sessions:
+            if isinstance(session, Session):
+                await run_in_threadpool(session.close)
+            else:
+                await session.close()
+    return StreamingResponse(
+        stream(sub, replay, truncated, heartbeat=config.EVENT_STREAM_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/logs/stream/stats")
+def stream_stats(user=Depends(require_roles("admin"))):
+    return event_bus.stats()
+
+
+@router.get("/profiles")
+def list_profiles(user=Depends(require_roles("admin"))):
+    # newest first; stacks are left out, fetch a profile by id for those
+    return profiler.store.list()
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(
+    profile_id: str,
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+    user=Depends(require_roles("admin")),
+):
+    profile = profiler.store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(collapsed(profile), headers={
+            "Content-Disposition": f"attachment; filename=profile-{profile_id}.folded"})
+    return profile
+
+
+@router.post("/tokens/{jti}/revoke")
+def revoke_token(
+    jti: str,
+    reason: Optional[str] = None,
+    user=Depends(require_roles("admin")),
+    db: Session = Depends(db_session.provide_db),
+):
+    # takes effect here at once and on other workers within REVOCATION_SYNC_SECONDS
+    added = revocations.revoke_jti(db, jti, reason=reason, revoked_by=user["username"])
+    log_access(db, user["username"], f"/admin/tokens/{jti}/revoke", 0, "revoked", event_type="token_revoked",
+               details=f"jti:{jti}" + (f";{reason}" if reason else ""))
+    return {"jti": jti, "revoked": True, "already_revoked": not added}
+
+
+@router.post("/users/{username}/revoke-tokens")
+def revoke_user_tokens(
+    username: str,
+    reason: Optional[str] = None,
+    user=Depends(require_roles("admin")),
+    db: Session = Depends(db_session.provide_db),
+):
+    """Revoke every access token issued to `username` so far and end all their sessions."""
+    sessions = revocations.revoke_user(db, username, reason=reason, revoked_by=user["username"])
+    log_access(db, user["username"], f"/admin/users/{username}/revoke-tokens", 0, "revoked",
+               event_type="token_revoked", details=f"user:{username}" + (f";{reason}" if reason else ""))
+    return {"username": username, "revoked": True, "sessions_ended": sessions}
+
+
+@router.get("/tokens/revocations")
+def revocation_stats(user=Depends(require_roles("admin"))):
+    return revocations.stats()
+
+
+@router.get("/login-throttle")
+def login_throttle_stats(user=Depends(require_roles("admin"))):
+    return login_throttle.stats()
+
 
 @router.get("/users")
 def get_users(user=Depends(require_roles("admin"))):
@@ -49,13 +325,16 @@ def get_reports(user=Depends(require_roles("admin"))):
 def create_user(
     user_data: UserCreate,
     user=Depends(require_roles("admin")),
-    db: Session = Depends(db_session.provide_db)
+    db: Session = Depends(db_session.provide_db),
+    read_db: Session = Depends(db_session.provide_read_db),
 ):
 
     # Check if username or email already exists
-    existing_user = db.query(User).filter(
+    existing_user = read_db.query(User).filter(
         (User.username == user_data.username) | (User.email == user_data.email)
     ).first()
+    # end the read transaction before bcrypt so the connection goes back to the pool
+    read_db.rollback()
     if existing_user:
         raise HTTPException(status_code=400, detail="Username or email already exists")
 
@@ -63,7 +342,7 @@ def create_user(
     new_user = User(
         username=user_data.username,
         email=user_data.email,
-        password=hash_password(user_data.password),
+        password=hash_password_pooled(user_data.password),
         role=user_data.role
     )
     db.add(new_user)
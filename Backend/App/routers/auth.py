@@ -1,23 +1,47 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from App.schemas.auth import LoginRequest, TokenResponse, RefreshRequest, RegisterRequest
 from App.database import session as db_session
-from App.database.models import User, RefreshToken
+from App.database.models import User
 from sqlalchemy.exc import OperationalError
-from App.database.models import Base as ModelsBase
-from App.core.jwt_handler import create_access_token, create_refresh_token, decode_refresh_token
+from App.database.schema import ensure_schema, invalidate as invalidate_schema
+from App.core.jwt_handler import create_access_token
+from App.core.refresh_tokens import RefreshTokenReuse, issue_refresh_token, rotate_refresh_token
 from App.core.audit_logger import log_access
+from App.core.login_throttle import LoginThrottled, login_throttle
+from App.core.metrics import metrics
 import uuid
-from App.core.security import verify_password, hash_password
-from datetime import datetime, timedelta
+from App.core.security import hash_password_pooled, verify_password_pooled
 
 router = APIRouter()
 
 
+def _find_user(read_db: Session, username: str):
+    """The user's id, name, role and password hash; the read transaction ends before bcrypt."""
+    user = read_db.execute(
+        select(User.id, User.username, User.role, User.password).where(User.username == username)
+    ).first()
+    read_db.rollback()
+    return user
+
+
+def _throttle(db, username, route, client_ip, user_agent):
+    # runs before the user lookup and bcrypt; blocked attempts are audited in aggregate
+    try:
+        login_throttle.check(client_ip, username, route=route)
+    except LoginThrottled as exc:
+        metrics.count_decision(route, "throttled")
+        if exc.blocked:
+            log_access(db, username, route, None, "throttled", event_type="login_throttled", ip=client_ip,
+                       user_agent=user_agent, details=exc.details, suspicious=1)
+        raise
+
+
 @router.post("/token", response_model=TokenResponse)
-def token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(db_session.provide_db), request: Request = None):
-    user = db.query(User).filter(User.username == form_data.username).first()
+def token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(db_session.provide_db),
+          read_db: Session = Depends(db_session.provide_read_db), request: Request = None):
     client_ip = None
     user_agent = None
     try:
@@ -25,29 +49,34 @@ def token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
         user_agent = request.headers.get("user-agent")
     except Exception:
         pass
-
-    if not user or not verify_password(form_data.password, user.password):
+    _throttle(db, form_data.username, "/token", client_ip, user_agent)
+
+    # lookups use the read pool so the writer isn't held while bcrypt runs
+    user = _find_user(read_db, form_data.username)
+    with metrics.stage("password_verify", "/token"):
+        valid = user is not None and verify_password_pooled(form_data.password, user.password)
+    if not valid:
+        login_throttle.record_failure(client_ip, form_data.username)
         # log failed login
         log_access(db, form_data.username, "/token", None, "failed", event_type="login_failed", ip=client_ip, user_agent=user_agent, suspicious=1)
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    jti = uuid.uuid4().hex
-    access = create_access_token({"username": user.username, "role": user.role, "jti": jti})
-    refresh = create_refresh_token({"username": user.username})
-    expires_at = datetime.utcnow() + timedelta(days=7)
-    rt = RefreshToken(user_id=user.id, token=refresh, expires_at=expires_at)
-    db.add(rt)
-    db.commit()
+    login_throttle.record_success(client_ip, user.username)
+    with metrics.stage("token_issue", "/token"):
+        jti = uuid.uuid4().hex
+        access = create_access_token({"username": user.username, "role": user.role, "jti": jti})
+        refresh = issue_refresh_token(db, user.id, user.username)
+        db.commit()
 
     # log successful login and token issuance
-    log_access(db, user.username, "/token", 0, "issued", event_type="login_success", ip=client_ip, user_agent=user_agent, details=f"jti:{jti}")
+    log_access(db, user.username, "/token", 0, "issued", event_type="login_success", ip=client_ip, user_agent=user_agent, details=f"jti:{jti}", jti=jti)
 
     return {"access_token": access, "token_type": "bearer", "refresh_token": refresh}
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(request: LoginRequest, db: Session = Depends(db_session.provide_db), req: Request = None):
-    user = db.query(User).filter(User.username == request.username).first()
+def login(request: LoginRequest, db: Session = Depends(db_session.provide_db),
+          read_db: Session = Depends(db_session.provide_read_db), req: Request = None):
     client_ip = None
     user_agent = None
     try:
@@ -55,63 +84,63 @@ def login(request: LoginRequest, db: Session = Depends(db_session.provide_db), r
         user_agent = req.headers.get("user-agent")
     except Exception:
         pass
+    _throttle(db, request.username, "/login", client_ip, user_agent)
 
-    if not user or not verify_password(request.password, user.password):
+    user = _find_user(read_db, request.username)
+    with metrics.stage("password_verify", "/login"):
+        valid = user is not None and verify_password_pooled(request.password, user.password)
+    if not valid:
+        login_throttle.record_failure(client_ip, request.username)
         log_access(db, request.username, "/login", None, "failed", event_type="login_failed", ip=client_ip, user_agent=user_agent, suspicious=1)
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    jti = uuid.uuid4().hex
-    access = create_access_token({"username": user.username, "role": user.role, "jti": jti})
-    refresh = create_refresh_token({"username": user.username})
+    login_throttle.record_success(client_ip, user.username)
+    with metrics.stage("token_issue", "/login"):
+        jti = uuid.uuid4().hex
+        access = create_access_token({"username": user.username, "role": user.role, "jti": jti})
+        # only the token's digest is stored
+        refresh = issue_refresh_token(db, user.id, user.username)
+        db.commit()
 
-    # persist refresh token
-    expires_at = datetime.utcnow() + timedelta(days=7)
-    rt = RefreshToken(user_id=user.id, token=refresh, expires_at=expires_at)
-    db.add(rt)
-    db.commit()
-
-    log_access(db, user.username, "/login", 0, "issued", event_type="login_success", ip=client_ip, user_agent=user_agent, details=f"jti:{jti}")
+    log_access(db, user.username, "/login", 0, "issued", event_type="login_success", ip=client_ip, user_agent=user_agent, details=f"jti:{jti}", jti=jti)
 
     return {"access_token": access, "token_type": "bearer", "refresh_token": refresh}
 
 
 @router.post("/refresh", response_model=TokenResponse)
-def refresh_token(req: RefreshRequest, db: Session = Depends(db_session.provide_db)):
-    # validate provided refresh token exists and decode
-    token = req.refresh_token
-    db_token = db.query(RefreshToken).filter(RefreshToken.token == token).first()
-    if not db_token:
-        raise HTTPException(status_code=401, detail="Invalid refresh token")
-    if db_token.expires_at and db_token.expires_at < datetime.utcnow():
-        raise HTTPException(status_code=401, detail="Refresh token expired")
-
-    payload = decode_refresh_token(token)
-    username = payload.get("username")
-    if not username:
-        raise HTTPException(status_code=401, detail="Invalid token payload")
-
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    new_access = create_access_token({"username": user.username, "role": user.role})
-    # log refresh
+def refresh_token(req: RefreshRequest, db: Session = Depends(db_session.provide_db),
+                  read_db: Session = Depends(db_session.provide_read_db), request: Request = None):
+    client_ip = None
+    user_agent = None
     try:
-        # attempt to get jti from new token payload for logging
-        new_payload = None
+        client_ip = request.client.host
+        user_agent = request.headers.get("user-agent")
+    except Exception:
+        pass
+
+    # one decode and one joined lookup; the presented token is consumed and
+    # the next one in its family is returned
+    with metrics.stage("refresh_rotate", "/refresh"):
         try:
-            new_payload = decode_refresh_token(token)
-        except Exception:
-            new_payload = None
-        jti = new_payload.get("jti") if new_payload else None
-        log_access(db, user.username, "/refresh", 0, "refresh", event_type="refresh", details=(f"jti:{jti}" if jti else None))
+            user, new_refresh = rotate_refresh_token(db, req.refresh_token, read_db=read_db)
+        except RefreshTokenReuse as exc:
+            log_access(db, exc.username, "/refresh", None, "deny", event_type="refresh_reuse", ip=client_ip,
+                       user_agent=user_agent, details=f"family:{exc.family} revoked", suspicious=1)
+            raise
+
+    with metrics.stage("token_issue", "/refresh"):
+        jti = uuid.uuid4().hex
+        new_access = create_access_token({"username": user.username, "role": user.role, "jti": jti})
+    # log refresh and the jti of the newly issued access token
+    try:
+        log_access(db, user.username, "/refresh", 0, "refresh", event_type="refresh", ip=client_ip, user_agent=user_agent, details=f"jti:{jti}", jti=jti)
     except Exception:
         pass
-    return {"access_token": new_access, "token_type": "bearer"}
+    return {"access_token": new_access, "token_type": "bearer", "refresh_token": new_refresh}
 
 
 @router.post("/register", response_model=TokenResponse)
-def register(req: RegisterRequest, db: Session = Depends(db_session.provide_db)):
+def register(req: RegisterRequest, db: Session = Depends(db_session.provide_db), request: Request = None):
     # create a new user (default role: user)
     try:
         existing = db.query(User).filter((User.username == req.username) | (User.email == req.email)).first()
@@ -122,28 +151,39 @@ def register(req: RegisterRequest, db: Session = Depends(db_session.provide_db))
         try:
             bind = getattr(db, 'bind', None)
             if bind is not None:
-                ModelsBase.metadata.create_all(bind=bind)
+                invalidate_schema(bind)
+                ensure_schema(bind)
         except Exception:
             pass
         existing = db.query(User).filter((User.username == req.username) | (User.email == req.email)).first()
+    # end the check's transaction so the writer connection isn't held during bcrypt
+    db.rollback()
     if existing:
         raise HTTPException(status_code=400, detail="Username or email already exists")
 
-    hashed = hash_password(req.password)
+    with metrics.stage("password_hash", "/register"):
+        hashed = hash_password_pooled(req.password)
     new = User(username=req.username, email=req.email, password=hashed, role=req.role or "user")
     db.add(new)
     db.commit()
     db.refresh(new)
 
-    jti = uuid.uuid4().hex
-    access = create_access_token({"username": new.username, "role": new.role, "jti": jti})
-    refresh = create_refresh_token({"username": new.username})
-    rt = RefreshToken(user_id=new.id, token=refresh, expires_at=datetime.utcnow() + timedelta(days=7))
-    db.add(rt)
-    db.commit()
+    with metrics.stage("token_issue", "/register"):
+        jti = uuid.uuid4().hex
+        access = create_access_token({"username": new.username, "role": new.role, "jti": jti})
+        refresh = issue_refresh_token(db, new.id, new.username)
+        db.commit()
+    client_ip = None
+    user_agent = None
+    try:
+        client_ip = request.client.host
+        user_agent = request.headers.get("user-agent")
+    except Exception:
+        pass
+
     # log registration (user created and token issued)
     try:
-        log_access(db, new.username, "/register", 0, "registered", event_type="register", details=f"jti:{jti}")
+        log_access(db, new.username, "/register", 0, "registered", event_type="register", ip=client_ip, user_agent=user_agent, details=f"jti:{jti}", jti=jti)
     except Exception:
         pass
 
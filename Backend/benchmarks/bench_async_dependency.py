@@ -0,0 +1,104 @@
+"""Sync vs async DB path for the zero-trust dependency under concurrency.
+
+Runs the dependency's database work (signal gathering plus the audit write)
+for many concurrent requests on one event loop, once with the synchronous
+Session and once with AsyncSession/aiosqlite. Alongside, a heartbeat task
+measures how long the loop is stalled: with the sync path every query runs
+on the loop thread, so the heartbeat lag grows with the DB time.
+
+Usage: python -m benchmarks.bench_async_dependency [--rows 200000] [--requests 500] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from App.database.models import Base
+from App.core.audit_logger import log_access, log_access_async
+from App.core.risk_signals import gather_signals, gather_signals_async
+from App.core.signal_store import SignalStore
+from benchmarks.bench_audit_indexes import populate
+
+
+async def heartbeat(stop: asyncio.Event, lags: list, interval: float = 0.005):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - t0 - interval) * 1000)
+
+
+async def run_mode(mode: str, sync_factory, async_factory, users: int, requests: int, concurrency: int):
+    store = SignalStore()  # cold store: counts come from SQL, as after a restart
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        username = f"user{i % users}"
+        async with semaphore:
+            t0 = time.perf_counter()
+            if mode == "sync":
+                db = sync_factory()
+                try:
+                    gather_signals(db, username, jti=f"jti{i}", ip="10.1.1.1", store=store)
+                    log_access(db, username, "/user/profile", 5, "allow", event_type="api_call", ip="10.1.1.1", jti=f"jti{i}")
+                finally:
+                    db.close()
+            else:
+                async with async_factory() as db:
+                    await gather_signals_async(db, username, jti=f"jti{i}", ip="10.1.1.1", store=store)
+                    await log_access_async(db, username, "/user/profile", 5, "allow", event_type="api_call", ip="10.1.1.1", jti=f"jti{i}")
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    stop = asyncio.Event()
+    lags = []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await beat
+
+    latencies.sort()
+    return {
+        "req_per_s": requests / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "max_loop_lag_ms": max(lags) if lags else elapsed * 1000,
+        "heartbeats": len(lags),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        populate(engine, args.rows, args.users)
+        sync_factory = sessionmaker(bind=engine, autoflush=False)
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        async_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+        results = {}
+        for mode in ("sync", "async"):
+            results[mode] = asyncio.run(run_mode(mode, sync_factory, async_factory, args.users, args.requests, args.concurrency))
+        asyncio.run(async_engine.dispose())
+        engine.dispose()
+
+    print(f"{'mode':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max loop lag ms':>18}{'heartbeats':>12}")
+    for mode, r in results.items():
+        print(f"{mode:<8}{r['req_per_s']:>10.0f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['max_loop_lag_ms']:>18.2f}{r['heartbeats']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Latency of the audit_logs hot queries before and after the composite indexes.
+
+Builds a throwaway SQLite database with only the primary-key index, times the
+risk and admin queries, runs `App.migrate.migrate` to add the indexes and
+times them again.
+
+Usage: python -m benchmarks.bench_audit_indexes [--rows 1000000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, func, insert, select
+from App.database.models import Base, AuditLog
+from App.migrate import migrate
+
+EVENT_TYPES = ["api_call"] * 17 + ["login_success", "login_failed", "refresh"]
+DECISIONS = ["allow", "allow", "allow", "allow+log", "deny"]
+
+
+def populate(engine, rows: int, users: int, chunk: int = 50000):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    span = int(timedelta(days=30).total_seconds())
+    with engine.begin() as conn:
+        for start in range(0, rows, chunk):
+            batch = []
+            for _ in range(min(chunk, rows - start)):
+                batch.append({
+                    "username": f"user{rng.randrange(users)}",
+                    "endpoint": "/user/profile",
+                    "risk_score": rng.randrange(100),
+                    "decision": rng.choice(DECISIONS),
+                    "ip": f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+                    "event_type": rng.choice(EVENT_TYPES),
+                    "user_agent": "bench",
+                    "suspicious": 0,
+                    "timestamp": now - timedelta(seconds=rng.randrange(span)),
+                })
+            conn.execute(insert(AuditLog), batch)
+
+
+def hot_queries(username: str):
+    now = datetime.utcnow()
+    minute_ago = now - timedelta(minutes=1)
+    five_ago = now - timedelta(minutes=5)
+    return {
+        "recent_count": select(func.count()).select_from(AuditLog).where(
+            AuditLog.username == username, AuditLog.timestamp >= minute_ago),
+        "failed_login_count": select(func.count()).select_from(AuditLog).where(
+            AuditLog.username == username, AuditLog.event_type == "login_failed", AuditLog.timestamp >= five_ago),
+        "last_login_success": select(AuditLog.ip, AuditLog.user_agent).where(
+            AuditLog.username == username, AuditLog.event_type == "login_success",
+        ).order_by(AuditLog.timestamp.desc()).limit(1),
+        "admin_latest_200": select(AuditLog).order_by(AuditLog.timestamp.desc()).limit(200),
+        "signal_rebuild_window": select(AuditLog.username, AuditLog.event_type, AuditLog.timestamp).where(
+            AuditLog.timestamp >= five_ago),
+    }
+
+
+def time_queries(engine, users: int, repeat: int) -> dict:
+    rng = random.Random(7)
+    results = {}
+    with engine.connect() as conn:
+        for name in hot_queries("user0"):
+            samples = []
+            for _ in range(repeat):
+                stmt = hot_queries(f"user{rng.randrange(users)}")[name]
+                t0 = time.perf_counter()
+                conn.execute(stmt).all()
+                samples.append((time.perf_counter() - t0) * 1000)
+            results[name] = statistics.median(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        # start from the pre-index schema, where only the id is indexed
+        for index in AuditLog.__table__.indexes:
+            if index.name != "ix_audit_logs_id":
+                index.drop(bind=engine)
+
+        t0 = time.perf_counter()
+        populate(engine, args.rows, args.users)
+        print(f"inserted {args.rows} rows in {time.perf_counter() - t0:.1f}s")
+
+        before = time_queries(engine, args.users, args.repeat)
+        t0 = time.perf_counter()
+        migrate(engine)
+        print(f"migration built indexes in {time.perf_counter() - t0:.1f}s")
+        after = time_queries(engine, args.users, args.repeat)
+        engine.dispose()
+
+    print(f"{'query':<24}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in before:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        print(f"{name:<24}{before[name]:>12.3f}{after[name]:>12.3f}{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
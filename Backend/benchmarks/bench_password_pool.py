@@ -0,0 +1,39 @@
+"""Login-style bcrypt throughput through the password worker pool.
+
+Runs a burst of concurrent verify_password calls through pools of
+increasing size and reports verifications per second and queue time.
+Throughput should grow with the worker count up to the number of cores.
+
+Usage: python -m benchmarks.bench_password_pool [--burst 32] [--workers 1,2,4,8] [--kind thread]
+"""
+import argparse
+import asyncio
+import time
+from App.core.security import PasswordPool, hash_password, verify_password
+
+
+async def burst(pool: PasswordPool, hashed: str, size: int) -> float:
+    t0 = time.perf_counter()
+    await asyncio.gather(*(pool.run(verify_password, "benchpass", hashed) for _ in range(size)))
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--burst", type=int, default=32)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--kind", default="thread", choices=["thread", "process"])
+    args = parser.parse_args()
+
+    hashed = hash_password("benchpass")
+    print(f"{'workers':>8}{'verify/s':>12}{'avg queue ms':>15}{'avg run ms':>12}")
+    for workers in (int(w) for w in args.workers.split(",")):
+        pool = PasswordPool(args.kind, workers=workers, max_pending=args.burst)
+        elapsed = asyncio.run(burst(pool, hashed, args.burst))
+        stats = pool.stats()
+        pool.shutdown()
+        print(f"{workers:>8}{args.burst / elapsed:>12.1f}{stats['queue_time_ms_avg']:>15.1f}{stats['run_time_ms_avg']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Throughput of calculate_risk (per row) against calculate_risk_batch on replayed traffic.
+
+Usage: python -m benchmarks.bench_risk_batch [--rows 1000000] [--scalar-rows 100000]
+"""
+import argparse
+import time
+import numpy as np
+from App.core.risk_engine import SENSITIVITY_MAP, calculate_risk, calculate_risk_batch
+
+
+def make_columns(rows: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    endpoints = np.array(list(SENSITIVITY_MAP) + ["/user/me", "/auth/refresh"])
+    return {
+        "endpoints": endpoints[rng.integers(0, len(endpoints), rows)],
+        "role_mismatch": rng.random(rows) < 0.05,
+        "request_count": rng.poisson(8, rows),
+        "failed_login_count": rng.poisson(1, rows),
+        "token_age_seconds": rng.integers(0, 60 * 60 * 24 * 14, rows),
+        "token_reuse_count": rng.poisson(0.1, rows),
+        "ip_change": rng.random(rows) < 0.1,
+        "ua_change": rng.random(rows) < 0.05,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--scalar-rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    cols = make_columns(args.rows)
+
+    t0 = time.perf_counter()
+    calculate_risk_batch(**cols)
+    batch = time.perf_counter() - t0
+
+    n = min(args.scalar_rows, args.rows)
+    t0 = time.perf_counter()
+    for i in range(n):
+        calculate_risk(
+            "user",
+            cols["endpoints"][i],
+            request_count=int(cols["request_count"][i]),
+            required_roles=["admin"] if cols["role_mismatch"][i] else None,
+            failed_login_count=int(cols["failed_login_count"][i]),
+            token_age_seconds=int(cols["token_age_seconds"][i]),
+            token_reuse_count=int(cols["token_reuse_count"][i]),
+            ip_change=bool(cols["ip_change"][i]),
+            ua_change=bool(cols["ua_change"][i]),
+        )
+    scalar = (time.perf_counter() - t0) / n * args.rows
+
+    print(f"scalar: {scalar:8.2f} s for {args.rows} rows (extrapolated from {n})")
+    print(f"batch:  {batch:8.2f} s for {args.rows} rows  ({scalar / batch:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
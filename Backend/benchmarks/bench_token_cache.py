@@ -0,0 +1,42 @@
+"""Per-request cost of decode_access_token with and without the verified-token cache.
+
+Usage: python -m benchmarks.bench_token_cache [--iterations 20000]
+"""
+import argparse
+import time
+from App.core import jwt_handler
+from App.core.jwt_handler import create_access_token, decode_access_token
+
+
+def time_decode(token: str, iterations: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        decode_access_token(token)
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = create_access_token({"username": "bench", "role": "user"})
+    cache = jwt_handler._token_cache
+
+    max_size = cache.max_size
+    cache.max_size = 0
+    cache.clear()
+    uncached = time_decode(token, args.iterations)
+
+    cache.max_size = max_size or 4096
+    cache.clear()
+    cached = time_decode(token, args.iterations)
+    stats = cache.stats()
+    cache.max_size = max_size
+
+    print(f"uncached decode: {uncached:8.2f} us/request")
+    print(f"cached decode:   {cached:8.2f} us/request  ({uncached / cached:.1f}x, hits={stats['hits']} misses={stats['misses']})")
+
+
+if __name__ == "__main__":
+    main()
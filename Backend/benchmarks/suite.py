@@ -0,0 +1,302 @@
+"""Microbenchmarks for the zero-trust hot path, with JSON results for comparing runs.
+
+Covers token decoding, risk scoring, the audit write, each risk-signal query
+run by `require_roles` at several audit_logs sizes, bcrypt verification and
+the /admin/logs page serialization. `run` writes one result per benchmark
+(median/p95/mean/min per call, in microseconds) plus machine metadata;
+`compare` lines two result files up and exits non-zero when a benchmark got
+slower than the threshold.
+
+Usage: python -m benchmarks.suite run [--sizes 10000,1000000,10000000] [--only PREFIX,...]
+                                      [--data-dir DIR] [--output results.json]
+       python -m benchmarks.suite compare BASELINE.json CURRENT.json [--threshold 0.10]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from App.database.models import Base, TokenUsage
+from benchmarks.bench_audit_indexes import hot_queries, populate
+
+DEFAULT_SIZES = "10000,1000000,10000000"
+USERS = 1000
+
+
+def measure(fn, *, repeat: int = 15, number: int | None = None, min_sample: float = 0.005) -> dict:
+    """Time `fn()`; each of `repeat` samples runs it `number` times (calibrated if None)."""
+    fn()  # warm up caches and lazy imports
+    if number is None:
+        number = 1
+        while True:
+            t0 = time.perf_counter()
+            for _ in range(number):
+                fn()
+            if time.perf_counter() - t0 >= min_sample or number >= 1 << 20:
+                break
+            number *= 2
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number * 1e6)
+    samples.sort()
+    return {
+        "unit": "us",
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "mean": statistics.fmean(samples),
+        "min": samples[0],
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def _result_id(name: str, params: dict) -> str:
+    if not params:
+        return name
+    return name + "[" + ",".join(f"{k}={v}" for k, v in sorted(params.items())) + "]"
+
+
+# -- benchmarks ---------------------------------------------------------------
+
+def bench_tokens():
+    from App.core import jwt_handler
+    from App.core.jwt_handler import create_access_token, decode_access_token
+
+    token = create_access_token({"username": "bench", "role": "user"})
+    yield "jwt.decode_uncached", {}, measure(lambda: jwt_handler._decode_access_token(token))
+    jwt_handler.clear_token_cache()
+    yield "jwt.decode_cached", {}, measure(lambda: decode_access_token(token))
+
+
+def bench_risk():
+    from App.core.risk_engine import calculate_risk, evaluate_risk_score
+
+    def score():
+        evaluate_risk_score(calculate_risk("user", "/admin/logs", request_count=12, required_roles=["admin"],
+                                           failed_login_count=3, token_age_seconds=7200, token_reuse_count=1,
+                                           ip_change=True))
+
+    yield "risk.calculate_risk", {}, measure(score)
+
+
+def bench_password():
+    from App.core.security import hash_password, verify_password
+
+    hashed = hash_password("benchpass")
+    yield "security.verify_password", {}, measure(lambda: verify_password("benchpass", hashed), repeat=5, number=2)
+
+
+def bench_log_access(tmp: str):
+    from App.core.audit_logger import log_access
+
+    engine = create_engine(f"sqlite:///{os.path.join(tmp, 'log_access.db')}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+    counter = iter(range(10 ** 9))
+
+    def write():
+        i = next(counter)
+        log_access(db, f"user{i % USERS}", "/user/profile", 5, "allow", event_type="api_call",
+                   ip="10.1.1.1", user_agent="bench", jti=f"jti{i % 5000}")
+
+    try:
+        yield "audit.log_access", {}, measure(write, repeat=10)
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def bench_serialize():
+    from App.core.audit_query import serialize_row
+
+    now = datetime.utcnow()
+    page = [(i, f"user{i % USERS}", "api_call", "/user/profile", 12, "allow", "10.1.1.1", "bench",
+             f"jti:{i:032x}", 0, now - timedelta(seconds=i)) for i in range(1000)]
+    yield "admin.logs_serialize", {"rows": 1000}, measure(lambda: json.dumps([serialize_row(r) for r in page]))
+
+
+def _audit_db(rows: int, data_dir: str):
+    path = os.path.join(data_dir, f"audit-{rows}.db")
+    engine = create_engine(f"sqlite:///{path}")
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        Base.metadata.create_all(bind=engine)
+        print(f"  populating {rows} audit rows ...", file=sys.stderr)
+        populate(engine, rows, USERS)
+        rng = random.Random(3)
+        now = datetime.utcnow()
+        with engine.begin() as conn:
+            conn.execute(insert(TokenUsage), [
+                {"jti": f"jti{i % (rows // 20 + 1)}", "username": f"user{i % USERS}",
+                 "ip": f"10.2.{rng.randrange(256)}.{rng.randrange(256)}", "user_agent": "bench",
+                 "use_count": 1, "first_seen": now - timedelta(minutes=5), "last_seen": now}
+                for i in range(max(100, rows // 10))
+            ])
+    return engine
+
+
+def bench_signals(rows: int, data_dir: str):
+    from App.core.audit_query import query_logs
+    from App.core.risk_signals import gather_signals
+    from App.core.shared_state import MmapSharedState
+    from App.core.signal_store import SharedSignalStore, SignalStore, signal_tables
+    from App.core.token_usage import token_reuse_query
+
+    engine = _audit_db(rows, data_dir)
+    db = sessionmaker(bind=engine, autoflush=False)()
+    rng = random.Random(11)
+    params = {"rows": rows}
+    try:
+        with engine.connect() as conn:
+            # one benchmark per query require_roles may run
+            for name in ("recent_count", "failed_login_count", "last_login_success"):
+                yield f"signals.{name}", params, measure(
+                    lambda: conn.execute(hot_queries(f"user{rng.randrange(USERS)}")[name]).all())
+            yield "signals.token_reuse", params, measure(
+                lambda: conn.execute(token_reuse_query(f"jti{rng.randrange(rows // 20 + 1)}", "10.1.1.1")).all())
+
+        cold = SignalStore()  # after a restart: counts come from SQL in one statement
+        yield "signals.gather_cold_store", params, measure(
+            lambda: gather_signals(db, f"user{rng.randrange(USERS)}", jti="jti1", ip="10.1.1.1", user_agent="bench",
+                                   store=cold))
+        warm = SignalStore()
+        warm.ready = True
+        for i in range(USERS):
+            warm.record(f"user{i}", "login_success", ip="10.1.1.1", user_agent="bench")
+        yield "signals.gather_warm_store", params, measure(
+            lambda: gather_signals(db, f"user{rng.randrange(USERS)}", jti="jti1", ip="10.1.1.1", user_agent="bench",
+                                   store=warm))
+
+        shared = SharedSignalStore(MmapSharedState(os.path.join(data_dir, "signals.mmap"), signal_tables(),
+                                                   slots=2 * USERS))
+        shared.ready = True
+        for i in range(USERS):
+            shared.record(f"user{i}", "login_success", ip="10.1.1.1", user_agent="bench")
+        yield "signals.gather_mmap_store", params, measure(
+            lambda: gather_signals(db, f"user{rng.randrange(USERS)}", jti="jti1", ip="10.1.1.1", user_agent="bench",
+                                   store=shared))
+        shared.backend.close()
+
+        yield "admin.logs_page", {**params, "limit": 200}, measure(
+            lambda: json.dumps(query_logs(db, limit=200, include_archive=False)[0]))
+    finally:
+        db.close()
+        engine.dispose()
+
+
+# -- runner -------------------------------------------------------------------
+
+def _metadata(sizes) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "created": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "sizes": sizes,
+    }
+
+
+def run(sizes: list[int], only: list[str], data_dir: str | None) -> dict:
+    results = {}
+
+    def collect(gen):
+        for name, params, stats in gen:
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            rid = _result_id(name, params)
+            results[rid] = {"name": name, "params": params, **stats}
+            print(f"{rid:<58}{stats['median']:>12.2f} us  (p95 {stats['p95']:.2f})", file=sys.stderr)
+
+    def wanted(prefix):
+        return not only or any(p.startswith(prefix) or prefix.startswith(p) for p in only)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        if wanted("jwt."):
+            collect(bench_tokens())
+        if wanted("risk."):
+            collect(bench_risk())
+        if wanted("security."):
+            collect(bench_password())
+        if wanted("audit."):
+            collect(bench_log_access(tmp))
+        if wanted("admin."):
+            collect(bench_serialize())
+        if wanted("signals.") or wanted("admin."):
+            for rows in sizes:
+                collect(bench_signals(rows, data_dir))
+    return {"meta": _metadata(sizes), "results": results}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> int:
+    """Print the median change per benchmark; return how many regressed."""
+    regressions = 0
+    print(f"{'benchmark':<58}{'baseline us':>14}{'current us':>14}{'change':>10}")
+    for rid in sorted(set(baseline["results"]) | set(current["results"])):
+        base, cur = baseline["results"].get(rid), current["results"].get(rid)
+        if base is None or cur is None:
+            print(f"{rid:<58}{'-' if base is None else format(base['median'], '.2f'):>14}"
+                  f"{'-' if cur is None else format(cur['median'], '.2f'):>14}{'n/a':>10}")
+            continue
+        change = cur["median"] / base["median"] - 1 if base["median"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{rid:<58}{base['median']:>14.2f}{cur['median']:>14.2f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--sizes", default=DEFAULT_SIZES, help="audit_logs row counts for the query benchmarks")
+    run_parser.add_argument("--only", default="", help="comma-separated benchmark name prefixes")
+    run_parser.add_argument("--data-dir", help="keep the generated databases here and reuse them")
+    run_parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown, 0.10 = 10%%")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        sizes = [int(s) for s in args.sizes.split(",") if s]
+        only = [p for p in args.only.split(",") if p]
+        report = run(sizes, only, args.data_dir)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as fh:
+                json.dump(report, fh, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+    else:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        with open(args.current, encoding="utf-8") as fh:
+            current = json.load(fh)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"{regressions} benchmark(s) slower than the {args.threshold:.0%} threshold")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+
+# Per-process risk signal counters, whatever the local .env says: a shared
+# mmap file or Redis would carry state from one test (or checkout) to the next.
+os.environ["SIGNAL_BACKEND"] = "memory"
@@ -1,10 +1,16 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
+from datetime import datetime
+
+from App import config
 from App.main import app
-from App.database.models import Base
+from App.database.models import AuditLog, Base
+from App.core.audit_archive import archive_before
 from App.core.audit_logger import log_access
 from App.core.jwt_handler import create_access_token
 from App.database import session as db_session_module
@@ -12,7 +18,7 @@ from App.database import session as db_session_module
 
 @pytest.fixture
 def test_db():
-    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
     Base.metadata.create_all(bind=engine)
     TestingSessionLocal = sessionmaker(bind=engine)
     db = TestingSessionLocal()
@@ -56,3 +62,114 @@ def test_admin_logs_with_token(client, test_db):
     assert isinstance(data, list)
     assert len(data) >= 1
     assert data[0]["username"] == "adminuser"
+
+
+def test_admin_logs_keyset_pagination_and_filters(client, test_db):
+    for i in range(5):
+        log_access(test_db, username="pager", endpoint=f"/user/p{i}", risk_score=i, decision="allow", event_type="api_call")
+    token = create_access_token({"username": "adminuser", "role": "admin"})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    r = client.get("/admin/logs", params={"user": "pager", "limit": 3}, headers=headers)
+    assert r.status_code == 200
+    first = r.json()
+    assert [row["endpoint"] for row in first] == ["/user/p4", "/user/p3", "/user/p2"]
+    cursor = r.headers["X-Next-Cursor"]
+
+    r = client.get("/admin/logs", params={"user": "pager", "limit": 3, "cursor": cursor}, headers=headers)
+    assert [row["endpoint"] for row in r.json()] == ["/user/p1", "/user/p0"]
+    assert "X-Next-Cursor" not in r.headers
+
+    r = client.get("/admin/logs", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert r.status_code == 400
+
+
+def test_admin_logs_export_streams_ndjson_and_csv(client):
+    token = create_access_token({"username": "adminuser", "role": "admin"})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    r = client.get("/admin/logs/export", params={"decision": "deny"}, headers=headers)
+    assert r.status_code == 200
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["endpoint"] for row in lines] == ["/admin/test"]
+
+    r = client.get("/admin/logs/export", params={"format": "csv", "user": "adminuser"}, headers=headers)
+    assert r.status_code == 200
+    header, *rows = r.text.strip().splitlines()
+    assert header.startswith("id,username,event_type")
+    assert len(rows) >= 1
+
+
+def test_admin_logs_since_id_returns_only_newer_rows(client, test_db):
+    token = create_access_token({"username": "adminuser", "role": "admin"})
+    headers = {"Authorization": f"Bearer {token}"}
+    first = log_access(test_db, username="poller", endpoint="/user/a", risk_score=1, decision="allow")
+
+    r = client.get("/admin/logs", params={"user": "poller", "since_id": first.id}, headers=headers)
+    assert r.json() == [] and r.headers["X-Last-Id"] == str(first.id)
+
+    for name in ("b", "c", "d"):
+        log_access(test_db, username="poller", endpoint=f"/user/{name}", risk_score=1, decision="allow")
+    r = client.get("/admin/logs", params={"user": "poller", "since_id": first.id, "limit": 2}, headers=headers)
+    assert [row["endpoint"] for row in r.json()] == ["/user/b", "/user/c"]
+    r = client.get("/admin/logs", params={"user": "poller", "since_id": r.headers["X-Last-Id"]}, headers=headers)
+    assert [row["endpoint"] for row in r.json()] == ["/user/d"]
+
+    r = client.get("/admin/logs", params={"since_id": 0, "cursor": "x"}, headers=headers)
+    assert r.status_code == 400
+
+
+def test_admin_logs_etag_answers_304_until_a_matching_row_arrives(client, test_db):
+    token = create_access_token({"username": "adminuser", "role": "admin"})
+    headers = {"Authorization": f"Bearer {token}"}
+    params = {"decision": "deny"}
+
+    r = client.get("/admin/logs", params=params, headers=headers)
+    etag = r.headers["ETag"]
+    assert etag.startswith('W/"') and r.json()[0]["endpoint"] == "/admin/test"
+
+    # the poll itself is logged as an allowed call, which this view doesn't include
+    r = client.get("/admin/logs", params=params, headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304 and r.content == b"" and r.headers["ETag"] == etag
+    r = client.get("/admin/logs", params=params, headers={**headers, "If-None-Match": f'"other", {etag[2:]}'})
+    assert r.status_code == 304
+
+    # another filter set or page gets its own tag
+    assert client.get("/admin/logs", params={"decision": "deny", "limit": 5}, headers=headers).headers["ETag"] != etag
+
+    log_access(test_db, username="mallory", endpoint="/admin/x", risk_score=95, decision="deny")
+    r = client.get("/admin/logs", params=params, headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag
+    assert r.json()[0]["username"] == "mallory"
+
+
+def test_admin_logs_polls_do_not_change_the_tag_but_stay_visible(client, test_db):
+    token = create_access_token({"username": "adminuser", "role": "admin"})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    r = client.get("/admin/logs", headers=headers)
+    etag = r.headers["ETag"]
+    r = client.get("/admin/logs", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+
+    # the audit trail still shows every poll
+    r = client.get("/admin/logs", params={"since_id": 0}, headers=headers)
+    polls = [row for row in r.json() if row["endpoint"] == "/admin/logs"]
+    assert len(polls) == 3
+    watermark = r.headers["X-Last-Id"]
+    r = client.get("/admin/logs", params={"since_id": watermark}, headers=headers)
+    assert [row["endpoint"] for row in r.json()] == ["/admin/logs"]
+
+
+def test_admin_logs_tag_changes_when_rows_are_archived(client, test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "AUDIT_ARCHIVE_DIR", str(tmp_path / "archive"))
+    token = create_access_token({"username": "adminuser", "role": "admin"})
+    headers = {"Authorization": f"Bearer {token}"}
+    test_db.add(AuditLog(username="old", endpoint="/x", decision="allow", timestamp=datetime(2024, 1, 1)))
+    test_db.commit()
+
+    etag = client.get("/admin/logs", headers=headers).headers["ETag"]
+    archive_before(test_db, datetime(2024, 1, 5))
+    # the newest id is unchanged, but the rows moved
+    r = client.get("/admin/logs", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag
@@ -0,0 +1,41 @@
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from App import config
+from App.dependencies import require_roles
+from App.database.models import Base, AuditLog, TokenUsage
+from App.core.jwt_handler import create_access_token
+from App.database import session as db_session_module
+
+
+def test_async_dependency_scores_and_logs(tmp_path, monkeypatch):
+    db_file = tmp_path / "async.db"
+    sync_engine = create_engine(f"sqlite:///{db_file}")
+    Base.metadata.create_all(bind=sync_engine)
+    AsyncTestingSession = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_file}"), expire_on_commit=False)
+
+    async def get_test_db():
+        async with AsyncTestingSession() as db:
+            yield db
+
+    monkeypatch.setattr(db_session_module, "get_async_db", get_test_db)
+    monkeypatch.setattr(config, "DB_MODE", "async")
+
+    app = FastAPI()
+
+    @app.get("/user/profile")
+    async def profile(user=Depends(require_roles("user"))):
+        return user
+
+    token = create_access_token({"username": "hank", "role": "user", "jti": "async-jti"})
+    r = TestClient(app).get("/user/profile", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200
+    assert r.json()["decision"] == "allow"
+
+    db = sessionmaker(bind=sync_engine)()
+    entry = db.query(AuditLog).one()
+    assert (entry.username, entry.event_type, entry.endpoint) == ("hank", "api_call", "/user/profile")
+    assert db.query(TokenUsage).filter(TokenUsage.jti == "async-jti").count() == 1
@@ -0,0 +1,73 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from App.database.models import Base, AuditLog
+from App.core.audit_archive import archive_before, apply_retention, iter_archived, list_segments
+from App.core.audit_logger import get_logs
+from App.core.audit_query import LogFilters, query_logs, iter_logs
+from App import config
+
+
+def make_session():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def seed(db, now):
+    # one row per day for the last 10 days, newest first by id
+    for days_ago in range(10):
+        db.add(AuditLog(username="jack", endpoint=f"/d{days_ago}", decision="allow" if days_ago % 2 else "deny",
+                        event_type="api_call", timestamp=now - timedelta(days=days_ago)))
+    db.commit()
+
+
+def test_archive_moves_old_days_and_reads_are_transparent(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "AUDIT_ARCHIVE_DIR", str(tmp_path))
+    now = datetime.utcnow().replace(hour=12)
+    db = make_session()
+    seed(db, now)
+
+    moved = archive_before(db, now - timedelta(days=3))
+    # whole days only: the row from the cutoff day itself stays hot
+    assert sum(moved.values()) == 6
+    assert db.query(AuditLog).count() == 4
+    assert len(list_segments()) == 6
+    with gzip.open(list_segments()[0][1], "rt") as fh:
+        assert '"/d4"' in fh.read()
+
+    page, cursor = query_logs(db, limit=4)
+    assert [row["endpoint"] for row in page] == ["/d0", "/d1", "/d2", "/d3"]
+    page, cursor = query_logs(db, limit=4, cursor=cursor)
+    assert [row["endpoint"] for row in page] == ["/d4", "/d5", "/d6", "/d7"]
+    page, cursor = query_logs(db, limit=4, cursor=cursor)
+    assert [row["endpoint"] for row in page] == ["/d8", "/d9"] and cursor is None
+
+    denies = [r.endpoint for rows in iter_logs(db, LogFilters(decision="deny"), chunk_size=2) for r in rows]
+    assert denies == ["/d0", "/d2", "/d4", "/d6", "/d8"]
+    assert [l.endpoint for l in get_logs(db, limit=5)] == ["/d0", "/d1", "/d2", "/d3", "/d4"]
+
+    removed = apply_retention(5, now=now)
+    assert len(removed) == 4
+    assert [r["endpoint"] for r in query_logs(db, limit=20)[0]][-1] == "/d5"
+
+
+def test_rearchiving_a_day_keeps_its_segment_newest_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "AUDIT_ARCHIVE_DIR", str(tmp_path))
+    day = datetime(2024, 5, 1)
+    db = make_session()
+    db.add_all([AuditLog(username="kim", endpoint=f"/h{h}", timestamp=day + timedelta(hours=h)) for h in (3, 9)])
+    db.commit()
+    archive_before(db, day + timedelta(days=2))
+    # late rows for the same day land on both sides of the archived ones
+    db.add_all([AuditLog(username="kim", endpoint=f"/h{h}", timestamp=day + timedelta(hours=h)) for h in (1, 6, 12)])
+    db.commit()
+    assert archive_before(db, day + timedelta(days=2)) == {day.date(): 3}
+
+    (_, path), = list_segments()
+    with gzip.open(path, "rt") as fh:
+        assert [json.loads(line)["endpoint"] for line in fh] == ["/h12", "/h9", "/h6", "/h3", "/h1"]
+    rows = iter_archived(LogFilters(since=day + timedelta(hours=2)), after=(day + timedelta(hours=9), 10**6))
+    assert [r.endpoint for r in rows] == ["/h9", "/h6", "/h3"]
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from App.core.audit_logger import log_access
+from App.core.audit_rollup import rebuild_rollups, record_rollups, series, top_keys
+from App.core.audit_writer import AuditWriter
+from App.core.jwt_handler import create_access_token
+from App.database import session as db_session_module
+from App.database.models import AuditLog, AuditRollup, Base
+from App.main import app
+from App.migrate import migrate
+
+START = datetime(2024, 3, 1, 12, 0, 0)
+
+
+def make_factory():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def db():
+    session = make_factory()()
+    yield session
+    session.close()
+
+
+def row(minute=0, username="erin", decision="allow", risk=5, suspicious=0, endpoint="/user/profile"):
+    return {
+        "username": username, "endpoint": endpoint, "risk_score": risk, "decision": decision,
+        "ip": "10.0.0.1", "details": None, "event_type": "api_call", "user_agent": "ua",
+        "suspicious": suspicious, "timestamp": START + timedelta(minutes=minute, seconds=30), "jti": None,
+    }
+
+
+def _count(db, dimension, key):
+    return sum(r.count for r in db.query(AuditRollup).filter_by(dimension=dimension, key=key))
+
+
+def test_log_access_updates_rollups_in_the_same_commit(db):
+    log_access(db, "erin", "/user/profile", 72, "deny", event_type="api_call", suspicious=1)
+    log_access(db, "erin", "/user/profile", 8, "allow", event_type="api_call")
+    assert _count(db, "total", "") == 2
+    assert _count(db, "decision", "deny") == 1
+    assert _count(db, "user", "erin") == 2
+    assert _count(db, "risk", "70") == 1 and _count(db, "risk", "00") == 1
+    assert db.query(AuditRollup).filter_by(dimension="total").one().suspicious == 1
+
+
+def test_batched_writer_folds_a_batch_into_few_upserts():
+    Session = make_factory()
+    writer = AuditWriter(Session, batch_size=500)
+    for i in range(300):
+        writer.enqueue(row(minute=i % 3, username=f"u{i % 2}"))
+    writer.flush()
+    db = Session()
+    assert db.query(AuditLog).count() == 300
+    # 3 minutes x (total, decision, endpoint, 2 users, risk)
+    assert db.query(AuditRollup).count() == 18
+    assert _count(db, "total", "") == 300
+
+
+def test_series_groups_minutes_into_buckets(db):
+    rows = [row(minute=m) for m in range(0, 180, 2)] + [row(minute=5, decision="deny", suspicious=1)]
+    record_rollups(db, rows)
+    db.commit()
+
+    hourly = series(db, "total", START, START + timedelta(hours=3), bucket_minutes=60)
+    assert [(p["time"], p["count"]) for p in hourly] == [
+        ("2024-03-01T12:00:00", 31), ("2024-03-01T13:00:00", 30), ("2024-03-01T14:00:00", 30)]
+    assert hourly[0]["suspicious"] == 1
+
+    denies = series(db, "decision", START, START + timedelta(hours=1), bucket_minutes=15, keys=["deny"])
+    assert denies == [{"time": "2024-03-01T12:00:00", "key": "deny", "count": 1, "suspicious": 1}]
+    with pytest.raises(ValueError):
+        series(db, "total", START, START + timedelta(days=30), bucket_minutes=1)
+
+
+def test_rebuild_matches_incremental_counts(db):
+    for i in range(40):
+        log_access(db, f"user{i % 4}", f"/e{i % 3}", i * 2, "allow" if i % 5 else "deny")
+    before = sorted((r.minute, r.dimension, r.key, r.count) for r in db.query(AuditRollup))
+    assert rebuild_rollups(db) == 40
+    after = sorted((r.minute, r.dimension, r.key, r.count) for r in db.query(AuditRollup))
+    assert after == before
+    now = datetime.utcnow()
+    assert top_keys(db, "user", now - timedelta(hours=1), now + timedelta(minutes=1), limit=1)[0]["count"] == 10
+
+
+def test_migrate_backfills_a_new_rollup_table():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([AuditLog(username="ann", endpoint="/x", decision="allow", timestamp=START) for _ in range(3)])
+    db.commit()
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE audit_rollups"))
+
+    assert "rolled up 3 audit events" in migrate(engine)
+    assert _count(db, "user", "ann") == 3
+
+
+def test_stats_routes_serve_the_rollups(db, monkeypatch):
+    def get_test_db():
+        yield db
+
+    monkeypatch.setattr(db_session_module, "get_db", get_test_db)
+    record_rollups(db, [row(minute=m, username=f"u{m % 3}", risk=m) for m in range(60)])
+    db.commit()
+    client = TestClient(app)
+    token = create_access_token({"username": "root", "role": "admin", "jti": "stats"})
+    headers = {"Authorization": f"Bearer {token}"}
+    window = {"since": START.isoformat(), "until": (START + timedelta(hours=1)).isoformat()}
+
+    r = client.get("/admin/stats/series", params={**window, "dimension": "user", "bucket": 30, "top": 2},
+                   headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["bucket_minutes"] == 30
+    assert {p["key"] for p in body["points"]} == {"u0", "u1"}  # ties go to the lower key
+    assert sum(p["count"] for p in body["points"]) == 40
+
+    r = client.get("/admin/stats/risk", params=window, headers=headers)
+    assert [b["count"] for b in r.json()] == [10] * 6 + [0] * 4
+
+    r = client.get("/admin/stats/top", params={**window, "dimension": "endpoint"}, headers=headers)
+    assert r.json() == [{"key": "/user/profile", "count": 60, "suspicious": 0}]
+    assert client.get("/admin/stats/series", params={"dimension": "nope"}, headers=headers).status_code == 422
@@ -0,0 +1,84 @@
+import time
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from App.database.models import Base, AuditLog, TokenUsage
+from App.core.audit_writer import AuditWriter
+
+
+def make_factory():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def row(ip="10.0.0.1", jti="tok"):
+    return {
+        "username": "erin", "endpoint": "/user/profile", "risk_score": 5, "decision": "allow",
+        "ip": ip, "details": None, "event_type": "api_call", "user_agent": "ua",
+        "suspicious": 0, "timestamp": datetime.utcnow(), "jti": jti,
+    }
+
+
+def test_flush_bulk_inserts_and_releases_pending_ips():
+    Session = make_factory()
+    writer = AuditWriter(Session, batch_size=2)
+    for ip in ("10.0.0.1", "10.0.0.1", "10.0.0.2"):
+        assert writer.enqueue(row(ip))
+    assert writer.pending_ips("tok") == {"10.0.0.1", "10.0.0.2"}
+
+    assert writer.flush() == 3
+    assert writer.pending_ips("tok") == set()
+    db = Session()
+    assert db.query(AuditLog).count() == 3
+    usage = db.query(TokenUsage).filter(TokenUsage.ip == "10.0.0.1").one()
+    assert usage.use_count == 2
+
+
+def test_full_queue_rejects_and_background_thread_flushes():
+    Session = make_factory()
+    writer = AuditWriter(Session, max_queue=1, put_timeout=0, flush_interval=0.05)
+    assert writer.enqueue(row())
+    assert not writer.enqueue(row())
+    assert writer.rejected == 1
+    assert writer.pending_ips("tok") == {"10.0.0.1"}
+
+    writer.start()
+    deadline = time.monotonic() + 2
+    while writer.flushed < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.stop()
+    assert Session().query(AuditLog).count() == 1
+
+
+def test_failed_flush_is_retried_then_written_row_by_row():
+    Session = make_factory()
+    failures = {"left": 1}
+
+    def flaky_factory():
+        db = Session()
+        if failures["left"]:
+            failures["left"] -= 1
+
+            def fail():
+                raise RuntimeError("database is locked")
+            db.commit = fail
+        return db
+
+    writer = AuditWriter(flaky_factory)
+    for ip in ("10.0.0.1", "10.0.0.1"):
+        writer.enqueue(row(ip))
+    assert writer.flush() == 2
+    db = Session()
+    assert db.query(AuditLog).count() == 2
+    assert db.query(TokenUsage).one().use_count == 2  # the failed attempt was rolled back
+    assert writer.pending_ips("tok") == set()
+
+    # a row that can never be inserted fails the batch twice, then only itself
+    writer.enqueue(row("10.0.0.3"))
+    writer.enqueue({**row("10.0.0.4"), "timestamp": "yesterday"})
+    writer.enqueue(row("10.0.0.5"))
+    writer.flush()
+    assert {ip for (ip,) in db.query(AuditLog.ip)} == {"10.0.0.1", "10.0.0.3", "10.0.0.5"}
+    assert writer.pending_ips("tok") == set()
@@ -0,0 +1,76 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from App.database.models import Base, AuditLog
+from App.core.risk_engine import calculate_risk, evaluate_risk_score
+from App.backtest import RiskPolicy, plan_partitions, run_backtest
+
+pytest.importorskip("numpy")
+
+
+def seed(url):
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    start = datetime(2024, 1, 1, 12, 0, 0)
+
+    def call(username, endpoint, ts, ip, role_mismatch=False, **signals):
+        score = calculate_risk("user", endpoint, required_roles=["admin"] if role_mismatch else None,
+                               ip_change=signals.pop("ip_change", False), **signals)
+        db.add(AuditLog(username=username, endpoint=endpoint, risk_score=score, decision=evaluate_risk_score(score),
+                        event_type="api_call", ip=ip, user_agent="ua", details="jti:t-" + username, timestamp=ts))
+
+    # alice: a burst of profile reads, then the same token from a second IP
+    db.add(AuditLog(username="alice", event_type="login_success", ip="1.1.1.1", user_agent="ua",
+                    endpoint="/login", timestamp=start))
+    for i in range(8):
+        call("alice", "/user/profile", start + timedelta(seconds=i + 1), "1.1.1.1", request_count=i + 1)
+    call("alice", "/user/profile", start + timedelta(seconds=20), "2.2.2.2",
+         request_count=9, token_reuse_count=1, ip_change=True)
+    # bob: two failed logins then a non-admin hitting /admin/logs
+    for i in range(2):
+        db.add(AuditLog(username="bob", event_type="login_failed", endpoint="/login", timestamp=start + timedelta(seconds=i)))
+    db.add(AuditLog(username="bob", event_type="login_success", ip="3.3.3.3", user_agent="ua",
+                    endpoint="/login", timestamp=start + timedelta(seconds=2)))
+    call("bob", "/admin/logs", start + timedelta(seconds=3), "3.3.3.3", role_mismatch=True, request_count=3)
+    db.commit()
+    db.close()
+    engine.dispose()
+
+
+def test_replay_reproduces_recorded_decisions_and_reports_changes(tmp_path):
+    url = f"sqlite:///{(tmp_path / 'audit.db').as_posix()}"
+    seed(url)
+    candidate = RiskPolicy({"/admin/logs": 0, "/user/profile": 30})
+
+    report = run_backtest(url, candidate, chunk_size=4).as_dict()
+    assert report["rows"] == 10
+    assert report["replay_mismatches"] == 0
+    # bob: 5 + 40 + 0 -> allow+log instead of deny
+    assert report["users"]["bob"]["matrix"] == {"deny": {"allow+log": 1}}
+    assert report["endpoints"]["/admin/logs"]["changed"] == 1
+    # alice's profile reads gain 25 points each
+    assert report["endpoints"]["/user/profile"]["matrix"]["allow"]["allow+log"] >= 1
+
+    unchanged = run_backtest(url, RiskPolicy(), chunk_size=3).as_dict()
+    assert unchanged["changed"] == 0 and unchanged["rows"] == 10
+
+    parallel = run_backtest(url, candidate, workers=2, chunk_size=4).as_dict()
+    assert parallel == report
+
+
+def test_policy_file_and_partitions(tmp_path):
+    url = f"sqlite:///{(tmp_path / 'audit.db').as_posix()}"
+    seed(url)
+    path = tmp_path / "policy.json"
+    path.write_text(json.dumps({"sensitivity": {"/admin/logs": 10}, "thresholds": {"allow": 20}}))
+    policy = RiskPolicy.from_file(str(path))
+    assert policy.rules == {"/admin/logs": 10} and (policy.allow_max, policy.log_max) == (20, 60)
+
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        assert plan_partitions(conn, 2) == [("alice", "alice"), ("bob", "bob")]
+        assert plan_partitions(conn, 1) == [("alice", "bob")]
+    engine.dispose()
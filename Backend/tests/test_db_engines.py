@@ -0,0 +1,140 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from App.database import session as db_session
+from App.database.engines import async_url_for, create_db_engine, create_read_engine, sqlite_pragmas
+from App.database.models import Base, User
+
+
+def _pragma(conn, name):
+    return conn.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_writer_and_reader_pragmas(tmp_path):
+    url = f"sqlite:///{(tmp_path / 'tuned.db').as_posix()}"
+    writer = create_db_engine(url)
+    reader = create_read_engine(url, writer)
+    try:
+        assert reader is not writer
+        Base.metadata.create_all(bind=writer)
+        with writer.connect() as conn:
+            assert _pragma(conn, "journal_mode") == "wal"
+            assert _pragma(conn, "synchronous") == 1  # NORMAL
+            assert _pragma(conn, "busy_timeout") == 5000
+            assert _pragma(conn, "cache_size") == -65536
+            assert _pragma(conn, "query_only") == 0
+        with reader.connect() as conn:
+            assert _pragma(conn, "query_only") == 1
+            with pytest.raises(OperationalError):
+                conn.execute(text("INSERT INTO users (username, email, password, role) VALUES ('a', 'a@x', 'p', 'user')"))
+    finally:
+        reader.dispose()
+        writer.dispose()
+
+
+def test_readers_see_commits_while_a_write_is_open(tmp_path):
+    url = f"sqlite:///{(tmp_path / 'wal.db').as_posix()}"
+    writer = create_db_engine(url)
+    reader = create_read_engine(url, writer)
+    try:
+        Base.metadata.create_all(bind=writer)
+        with writer.begin() as conn:
+            conn.execute(text("INSERT INTO users (username, email, password, role) VALUES ('a', 'a@x', 'p', 'user')"))
+        with writer.connect() as wconn:
+            wconn.begin()
+            wconn.execute(text("INSERT INTO users (username, email, password, role) VALUES ('b', 'b@x', 'p', 'user')"))
+            # in WAL mode the open write transaction does not block readers
+            with reader.connect() as rconn:
+                assert rconn.execute(text("SELECT count(*) FROM users")).scalar() == 1
+            wconn.commit()
+        with reader.connect() as rconn:
+            assert rconn.execute(text("SELECT count(*) FROM users")).scalar() == 2
+    finally:
+        reader.dispose()
+        writer.dispose()
+
+
+def test_memory_database_has_no_separate_reader():
+    writer = create_db_engine("sqlite:///:memory:")
+    assert create_read_engine("sqlite:///:memory:", writer) is writer
+
+
+def test_invalid_synchronous_setting(monkeypatch):
+    from App import config
+
+    monkeypatch.setattr(config, "SQLITE_SYNCHRONOUS", "sometimes")
+    with pytest.raises(ValueError):
+        sqlite_pragmas()
+
+
+def test_async_url_for():
+    assert async_url_for("sqlite:////tmp/x.db") == "sqlite+aiosqlite:////tmp/x.db"
+    assert async_url_for("postgresql://u:p@db/app") is None
+
+
+def test_provide_read_db_follows_patched_get_db(monkeypatch):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    test_db = sessionmaker(bind=engine)()
+    test_db.add(User(username="reader", email="r@x", password="p", role="user"))
+    test_db.commit()
+
+    def get_test_db():
+        yield test_db
+
+    monkeypatch.setattr(db_session, "get_db", get_test_db)
+    gen = db_session.provide_read_db()
+    db = next(gen)
+    assert db is test_db
+    assert db.query(User).filter(User.username == "reader").count() == 1
+    gen.close()
+
+
+def test_concurrent_protected_calls_share_a_single_writer_connection(tmp_path, monkeypatch):
+    from App import config
+    from App.core.jwt_handler import create_access_token
+    from App.main import app
+
+    monkeypatch.setattr(config, "DB_WRITE_POOL_SIZE", 1)
+    monkeypatch.setattr(config, "DB_WRITE_MAX_OVERFLOW", 0)
+    monkeypatch.setattr(config, "DB_POOL_TIMEOUT", 2)
+    url = f"sqlite:///{(tmp_path / 'busy.db').as_posix()}"
+    writer = create_db_engine(url)
+    reader = create_read_engine(url, writer)
+    Base.metadata.create_all(bind=writer)
+    monkeypatch.setattr(db_session, "SessionLocal", sessionmaker(bind=writer, autoflush=False))
+    monkeypatch.setattr(db_session, "ReadSessionLocal", sessionmaker(bind=reader, autoflush=False))
+    token = create_access_token({"username": "root", "role": "admin", "jti": "busy"})
+
+    async def get(path):
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+                 "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+                 "headers": [(b"authorization", f"Bearer {token}".encode())], "client": ("127.0.0.1", 1234),
+                 "server": ("testserver", 80)}
+        statuses = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        await app(scope, receive, send)
+        return statuses[0]
+
+    async def burst():
+        # all on one event loop, as under uvicorn
+        return await asyncio.wait_for(asyncio.gather(*(get("/admin/data") for _ in range(4))), 20)
+
+    try:
+        assert asyncio.run(burst()) == [200] * 4
+        with writer.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM audit_logs")).scalar() == 4
+    finally:
+        reader.dispose()
+        writer.dispose()
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from App import config
+from App.core import audit_logger, audit_writer as audit_writer_module
+from App.core.audit_logger import log_access
+from App.core.audit_query import LOG_FIELDS, LogFilters
+from App.core.audit_writer import AuditWriter
+from App.core.event_bus import EventBus, stream
+from App.core.jwt_handler import create_access_token
+from App.database import session as db_session_module
+from App.database.models import Base
+from App.main import app
+from App.routers import admin
+
+
+def event(i, **fields):
+    row = {"id": i, "username": "erin", "event_type": "api_call", "endpoint": "/user/profile", "risk_score": 5,
+           "decision": "allow", "suspicious": 0, "timestamp": datetime(2024, 1, 1)}
+    row.update(fields)
+    return row
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_filters_apply_before_buffering_and_drops_are_counted():
+    async def scenario():
+        bus = EventBus(buffer_size=3)
+        denies = bus.subscribe(LogFilters(decision="deny"))
+        everything = bus.subscribe()
+        for i in range(1, 6):
+            bus.publish(event(i, decision="deny" if i == 2 else "allow"))
+
+        events, dropped = await denies.next_batch(0)
+        assert [e.id for e in events] == [2] and dropped == 0
+        events, dropped = await everything.next_batch(0)
+        assert [e.id for e in events] == [3, 4, 5] and dropped == 2
+        assert bus.stats() == {"subscribers": 2, "published": 5, "dropped": 2}
+        # the same serialized payload is shared by every subscriber
+        bus.publish(event(6, decision="deny"))
+        (a,), _ = await denies.next_batch(0)
+        (b,), _ = await everything.next_batch(0)
+        assert a is b and json.loads(a.data)["id"] == 6
+
+    run(scenario())
+
+
+def test_publish_from_another_thread_wakes_the_subscriber():
+    async def scenario():
+        bus = EventBus()
+        sub = bus.subscribe()
+        threading.Timer(0.05, bus.publish, args=(event(1),)).start()
+        events, _ = await sub.next_batch(5)
+        assert [e.id for e in events] == [1]
+        sub.close()
+        assert not bus.active
+        bus.publish(event(2))  # nobody listening: nothing is built
+        assert bus.published == 1
+
+    run(scenario())
+
+
+def test_stream_replays_then_skips_events_it_already_sent():
+    async def scenario():
+        bus = EventBus()
+        sub = bus.subscribe()
+        bus.publish(event(3))  # committed while the replay query ran
+        bus.publish(event(4))
+        replay = [tuple(event(i).get(f) for f in LOG_FIELDS) for i in (2, 3)]
+        body = stream(sub, replay, heartbeat=0.01)
+        chunks = [await body.__anext__() for _ in range(3)]
+        await body.aclose()
+        ids = [int(line[4:]) for chunk in chunks for line in chunk.splitlines() if line.startswith("id: ")]
+        assert ids == [2, 3, 4]
+        assert not bus.active  # closing the stream unsubscribes
+
+    run(scenario())
+
+
+def test_batched_writer_publishes_rows_with_their_ids(monkeypatch):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    bus = EventBus()
+    monkeypatch.setattr(audit_writer_module, "event_bus", bus)
+
+    async def scenario():
+        sub = bus.subscribe()
+        writer = AuditWriter(sessionmaker(bind=engine))
+        for i in range(3):
+            row = event(None, username=f"u{i}", ip=None, details=None, user_agent=None, jti=None)
+            del row["id"]
+            writer.enqueue(row)
+        writer.flush()
+        events, _ = await sub.next_batch(0)
+        return [(e.id, e.row.username) for e in events]
+
+    assert run(scenario()) == [(1, "u0"), (2, "u1"), (3, "u2")]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_stream_route_resumes_from_last_event_id(db, monkeypatch):
+    def get_test_db():
+        yield db
+
+    bus = EventBus()
+    monkeypatch.setattr(db_session_module, "get_db", get_test_db)
+    monkeypatch.setattr(admin, "event_bus", bus)
+    monkeypatch.setattr(audit_logger, "event_bus", bus)
+    monkeypatch.setattr(config, "EVENT_STREAM_HEARTBEAT_SECONDS", 0.05)
+    for i in range(3):
+        log_access(db, "erin", "/user/profile", 90 if i == 1 else 5, "deny" if i == 1 else "allow", suspicious=i == 1)
+
+    token = create_access_token({"username": "root", "role": "admin", "jti": "stream"})
+    status, headers, body = run(_read_stream("/admin/logs/stream", "suspicious=1", token, last_event_id="0"))
+    assert status == 200
+    assert headers[b"content-type"].startswith(b"text/event-stream")
+    lines = body.splitlines()
+    assert lines[:2] == ["id: 2", "event: audit"]
+    data = json.loads(lines[2][len("data: "):])
+    assert data["decision"] == "deny" and data["suspicious"] == 1
+    assert not bus.active  # the disconnect closed the subscription
+
+    status, _, _ = run(_read_stream("/admin/logs/stream", "", token, last_event_id="x"))
+    assert status == 400
+
+
+def test_stream_returns_its_connections_before_streaming(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stream.db'}", pool_size=2, max_overflow=0, pool_timeout=1)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    def get_test_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    with Session() as seed:
+        log_access(seed, "erin", "/user/profile", 5, "allow")
+    monkeypatch.setattr(db_session_module, "get_db", get_test_db)
+    monkeypatch.setattr(admin, "event_bus", EventBus())
+    checked_out = []
+    token = create_access_token({"username": "root", "role": "admin", "jti": "pool"})
+    status, _, body = run(_read_stream("/admin/logs/stream", "", token, last_event_id="0",
+                                       on_body=lambda: checked_out.append(engine.pool.checkedout())))
+    assert status == 200 and body.startswith("id: 1")
+    assert checked_out == [0]
+
+
+async def _read_stream(path, query, token, last_event_id=None, on_body=None):
+    """Drive the ASGI app directly and disconnect after the first body chunk.
+
+    TestClient only reports a disconnect once the app has finished, which an
+    endless event stream never does.
+    """
+    headers = [(b"authorization", f"Bearer {token}".encode())]
+    if last_event_id is not None:
+        headers.append((b"last-event-id", last_event_id.encode()))
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+             "headers": headers, "client": ("127.0.0.1", 1234), "server": ("testserver", 80)}
+    received = asyncio.Event()
+    response = {"body": ""}
+    sent_request = False
+
+    async def receive():
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await received.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message["headers"])
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"").decode()
+            if response["body"] or not message.get("more_body"):
+                if on_body is not None and not received.is_set():
+                    on_body()
+                received.set()
+
+    await asyncio.wait_for(app(scope, receive, send), 10)
+    return response["status"], response["headers"], response["body"]
@@ -0,0 +1,40 @@
+import pytest
+from datetime import timedelta
+from fastapi import HTTPException
+from App.core import jwt_handler
+from App.core.jwt_handler import create_access_token, decode_access_token
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    jwt_handler.clear_token_cache()
+    yield
+    jwt_handler.clear_token_cache()
+
+
+def test_repeated_decode_hits_the_cache():
+    token = create_access_token({"username": "ivy", "role": "user", "jti": "c1"})
+    first = decode_access_token(token)
+    first["role"] = "admin"  # callers can't poison the cached payload
+    second = decode_access_token(token)
+    assert second["role"] == "user"
+    stats = jwt_handler.token_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+
+def test_revoked_jti_is_evicted():
+    token = create_access_token({"username": "ivy", "role": "user", "jti": "c2"})
+    decode_access_token(token)
+    assert jwt_handler.evict_cached_jti("c2") == 1
+    decode_access_token(token)
+    assert jwt_handler.token_cache_stats()["misses"] == 2
+
+
+def test_cached_entry_expires_with_the_token(monkeypatch):
+    token = create_access_token({"username": "ivy", "role": "user"}, expires_minutes=1)
+    decode_access_token(token)
+    later = jwt_handler._now_utc() + timedelta(minutes=3)
+    monkeypatch.setattr(jwt_handler, "_now_utc", lambda: later)
+    with pytest.raises(HTTPException) as exc:
+        decode_access_token(token)
+    assert exc.value.detail == "Token expired"
@@ -0,0 +1,139 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from App.core.login_throttle import LoginThrottle, LoginThrottled
+from App.database import session as db_session_module
+from App.database.models import AuditLog, Base
+from App.main import app
+from App.routers import auth
+
+
+def _throttle(**kwargs):
+    options = dict(ip_per_minute=60, ip_burst=10, ip_lockout_after=100, user_per_minute=60, user_burst=3,
+                   user_lockout_after=3, lockout_base=30, lockout_max=600, report_interval=60)
+    options.update(kwargs)
+    return LoginThrottle(True, **options)
+
+
+def test_bucket_empties_and_refills():
+    throttle = _throttle()
+    for _ in range(3):
+        throttle.check("10.0.0.1", "amy", now=0)
+    with pytest.raises(LoginThrottled) as exc:
+        throttle.check("10.0.0.1", "amy", now=0)
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "1"
+    assert exc.value.key == "user:amy"
+
+    throttle.check("10.0.0.1", "amy", now=1)  # one token back after a second at 60/min
+    throttle.check("10.0.0.1", "bob", now=1)  # other accounts are unaffected
+
+
+def test_ip_bucket_covers_spraying_many_accounts():
+    throttle = _throttle()
+    for i in range(10):
+        throttle.check("10.0.0.2", f"user{i}", now=0)
+    with pytest.raises(LoginThrottled) as exc:
+        throttle.check("10.0.0.2", "fresh", now=0)
+    assert exc.value.key == "ip:10.0.0.2"
+
+
+def test_failures_lock_out_exponentially_until_success():
+    throttle = _throttle(user_burst=100)
+    for _ in range(3):
+        throttle.check("10.0.0.3", "cat", now=0)
+        throttle.record_failure("10.0.0.3", "cat", now=0)
+    with pytest.raises(LoginThrottled) as exc:
+        throttle.check("10.0.0.3", "cat", now=1)
+    assert exc.value.retry_after == 29
+
+    throttle.check("10.0.0.3", "cat", now=31)
+    throttle.record_failure("10.0.0.3", "cat", now=31)
+    with pytest.raises(LoginThrottled) as exc:
+        throttle.check("10.0.0.3", "cat", now=32)
+    assert exc.value.retry_after == 59  # doubled
+
+    throttle.record_success("10.0.0.3", "cat")
+    throttle.check("10.0.0.3", "cat", now=32)
+    assert throttle.stats()["lockouts"] == 2
+
+
+def test_blocked_attempts_are_reported_in_aggregate():
+    throttle = _throttle(user_burst=1)
+    throttle.check("10.0.0.4", "dan", now=0)
+    reports = []
+    for t in range(100):
+        try:
+            throttle.check("10.0.0.4", "dan", now=t * 0.01)
+        except LoginThrottled as exc:
+            reports.append(exc.blocked)
+    assert reports[0] == 1 and sum(reports) == 1  # later ones wait for the next report
+    throttle.check("10.0.0.4", "dan", now=60)  # refilled
+    with pytest.raises(LoginThrottled) as exc:
+        throttle.check("10.0.0.4", "dan", now=60)
+    assert exc.value.blocked == 100  # 99 held back plus this one
+
+
+def test_counts_held_back_when_an_attack_stops_are_still_reported(db):
+    throttle = _throttle(user_burst=1)
+    throttle.check("10.0.0.5", "eve", now=0)
+    blocked = []
+    for t in range(1, 5):
+        with pytest.raises(LoginThrottled) as exc:
+            throttle.check("10.0.0.5", "eve", now=t * 0.1, route="/token")
+        blocked.append(exc.value.blocked)
+    assert blocked == [1, 0, 0, 0]  # the attack stops here with 3 attempts unreported
+
+    assert throttle.report_due(db, now=30) == 0  # not due yet
+    assert throttle.report_due(db, now=61) == 1
+    event = db.query(AuditLog).filter_by(event_type="login_throttled").one()
+    assert (event.username, event.endpoint, event.details) == ("eve", "/token", "user:eve blocked:3")
+    assert throttle.report_due(db, now=200) == 0
+
+
+def test_key_table_is_bounded():
+    throttle = _throttle(max_keys=50)
+    for i in range(200):
+        throttle.check(f"10.1.0.{i}", None, now=0)
+    assert throttle.stats()["keys"] == 50
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_throttled_logins_skip_bcrypt(db, monkeypatch):
+    def get_test_db():
+        yield db
+
+    verifies = []
+    real_verify = auth.verify_password_pooled
+
+    def counting_verify(plain, hashed):
+        verifies.append(plain)
+        return real_verify(plain, hashed)
+
+    monkeypatch.setattr(db_session_module, "get_db", get_test_db)
+    monkeypatch.setattr(auth, "login_throttle", _throttle(user_per_minute=0.001))
+    monkeypatch.setattr(auth, "verify_password_pooled", counting_verify)
+    client = TestClient(app)
+    client.post("/register", json={"username": "eli", "email": "eli@example.com", "password": "pw123"})
+
+    codes = [client.post("/login", json={"username": "eli", "password": "wrong"}).status_code for _ in range(20)]
+    assert codes[:3] == [401, 401, 401]
+    assert set(codes[3:]) == {429}
+    assert len(verifies) == 3
+
+    r = client.post("/token", data={"username": "eli", "password": "pw123"})
+    assert r.status_code == 429 and int(r.headers["Retry-After"]) > 0
+    assert db.query(AuditLog).filter(AuditLog.event_type == "login_failed").count() == 3
+    throttled = db.query(AuditLog).filter(AuditLog.event_type == "login_throttled").all()
+    assert len(throttled) == 1 and "blocked:1" in throttled[0].details
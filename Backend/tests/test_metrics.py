@@ -0,0 +1,83 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from App import config
+from App.main import app
+from App.database.models import Base
+from App.core.jwt_handler import create_access_token
+from App.core.metrics import Metrics, metrics
+from App.database import session as db_session_module
+
+SCRAPE = {"Authorization": "Bearer scrape-secret"}
+
+
+def test_histogram_buckets_and_rendering():
+    m = Metrics(buckets=(0.001, 0.01))
+    m.observe("jwt_decode", 0.0005, "/admin/logs")
+    m.observe("jwt_decode", 0.001, "/admin/logs")
+    m.observe("jwt_decode", 0.5, "/admin/logs")
+    m.count_decision("/admin/logs", "allow")
+    text = m.render()
+    labels = 'stage="jwt_decode",route="/admin/logs"'
+    assert f'accessguard_stage_duration_seconds_bucket{{{labels},le="0.001"}} 2' in text
+    assert f'accessguard_stage_duration_seconds_bucket{{{labels},le="0.01"}} 2' in text
+    assert f'accessguard_stage_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+    assert f"accessguard_stage_duration_seconds_count{{{labels}}} 3" in text
+    assert 'accessguard_decisions_total{route="/admin/logs",decision="allow"} 1' in text
+
+
+def test_disabled_metrics_record_nothing():
+    m = Metrics(enabled=False)
+    with m.stage("jwt_decode", "/x"):
+        pass
+    m.count_decision("/x", "deny")
+    assert m.snapshot() == ({}, {})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    def get_test_db():
+        yield db
+
+    monkeypatch.setattr(db_session_module, "get_db", get_test_db)
+    monkeypatch.setattr(config, "METRICS_TOKEN", "scrape-secret")
+    metrics.reset()
+    yield TestClient(app)
+    db.close()
+
+
+def test_protected_call_is_timed_per_stage(client):
+    token = create_access_token({"username": "adminuser", "role": "admin"})
+    assert client.get("/admin/data", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+    r = client.get("/metrics", headers=SCRAPE)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    for stage in ("require_roles", "jwt_decode", "risk_signals", "risk_scoring", "audit_log", "http_request"):
+        assert f'stage="{stage}",route="/admin/data"' in r.text
+    assert 'stage="audit_commit",route=""' in r.text
+    assert 'stage="db_session",route=""' in r.text
+    assert 'accessguard_decisions_total{route="/admin/data",decision="allow"} 1' in r.text
+    assert "# TYPE accessguard_password_pool_pending gauge\naccessguard_password_pool_pending 0\n" in r.text
+    assert "# TYPE accessguard_password_pool_rejected_total counter" in r.text
+
+
+def test_metrics_route_is_hidden_when_disabled(client, monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", False)
+    assert client.get("/metrics", headers=SCRAPE).status_code == 404
+
+
+def test_metrics_route_needs_the_scrape_token(client, monkeypatch):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    token = create_access_token({"username": "adminuser", "role": "admin"})
+    assert client.get("/metrics", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+    monkeypatch.setattr(config, "METRICS_TOKEN", "")
+    assert client.get("/metrics", headers=SCRAPE).status_code == 404
@@ -0,0 +1,44 @@
+from datetime import datetime
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from App.database.models import Base, AuditLog, RevokedToken
+from App.migrate import migrate
+
+
+def test_migrate_adds_missing_indexes_and_keeps_rows():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    for index in AuditLog.__table__.indexes:
+        if index.name != "ix_audit_logs_id":
+            index.drop(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add(AuditLog(username="frank", event_type="api_call"))
+    db.commit()
+
+    applied = migrate(engine)
+    assert "index ix_audit_logs_username_event_timestamp" in applied
+    names = {ix["name"] for ix in inspect(engine).get_indexes("audit_logs")}
+    assert {"ix_audit_logs_username_timestamp", "ix_audit_logs_timestamp_desc"} <= names
+    assert db.query(AuditLog).count() == 1
+    assert migrate(engine) == []
+
+
+def test_migrate_gives_revoked_tokens_autoincrement_ids():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE revoked_tokens"))
+        conn.execute(text("CREATE TABLE revoked_tokens (id INTEGER PRIMARY KEY, jti VARCHAR UNIQUE, "
+                          "username VARCHAR, revoked_at DATETIME NOT NULL, expires_at DATETIME NOT NULL, "
+                          "reason VARCHAR, revoked_by VARCHAR)"))
+        conn.execute(text("INSERT INTO revoked_tokens (id, jti, revoked_at, expires_at) "
+                          "VALUES (7, 'old', '2024-01-01', '2024-01-02')"))
+
+    assert "autoincrement ids for revoked_tokens" in migrate(engine)
+    db = sessionmaker(bind=engine)()
+    db.query(RevokedToken).delete()
+    db.add(RevokedToken(jti="new", revoked_at=datetime(2024, 1, 3), expires_at=datetime(2024, 1, 4)))
+    db.commit()
+    assert db.query(RevokedToken.id).scalar() == 8
+    assert "ix_revoked_tokens_expires_at" in {ix["name"] for ix in inspect(engine).get_indexes("revoked_tokens")}
+    assert migrate(engine) == []
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from App.core.security import PasswordPool, hash_password, verify_password
+from App.database import session as db_session_module
+from App.database.models import Base
+from App.main import app
+from App.routers import auth
+
+
+def test_pool_hashes_and_verifies_off_the_loop():
+    pool = PasswordPool("thread", workers=2)
+
+    async def run():
+        hashed = await pool.run(hash_password, "s3cret")
+        return hashed, await pool.run(verify_password, "s3cret", hashed)
+
+    hashed, ok = asyncio.run(run())
+    pool.shutdown()
+    assert ok and hashed != "s3cret"
+    stats = pool.stats()
+    assert stats["completed"] == 2 and stats["pending"] == 0
+
+
+def test_pool_rejects_work_beyond_the_cap():
+    pool = PasswordPool("thread", workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def run():
+        blocked = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as exc:
+            await pool.run(hash_password, "x")
+        release.set()
+        await blocked
+        return exc.value
+
+    exc = asyncio.run(run())
+    pool.shutdown()
+    assert exc.status_code == 503
+    assert pool.stats()["rejected"] == 1
+
+
+def test_blocking_call_shares_the_cap_and_stats():
+    pool = PasswordPool("thread", workers=1, max_pending=1)
+    hashed = pool.call(hash_password, "s3cret")
+    assert pool.call(verify_password, "s3cret", hashed)
+    release = threading.Event()
+    blocker = threading.Thread(target=pool.call, args=(release.wait,))
+    blocker.start()
+    while pool.stats()["pending"] == 0:
+        time.sleep(0.01)
+    with pytest.raises(HTTPException):
+        pool.call(hash_password, "x")
+    release.set()
+    blocker.join()
+    pool.shutdown()
+    assert pool.stats()["completed"] == 3 and pool.stats()["rejected"] == 1
+
+
+def test_register_releases_the_writer_before_hashing(monkeypatch):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    def get_test_db():
+        yield db
+
+    held_during_hash = []
+
+    def hash_and_check(password):
+        held_during_hash.append(db.in_transaction())
+        return hash_password(password)
+
+    monkeypatch.setattr(db_session_module, "get_db", get_test_db)
+    monkeypatch.setattr(auth, "hash_password_pooled", hash_and_check)
+    r = TestClient(app).post("/register", json={"username": "hal", "email": "hal@example.com", "password": "pw123"})
+    assert r.status_code == 200
+    assert held_during_hash == [False]
@@ -0,0 +1,71 @@
+import json
+import os
+import pickle
+import pytest
+from App.core.policy import PolicyError, PolicyManager, RiskPolicy
+from App.core.risk_engine import SENSITIVITY_MAP, calculate_risk, evaluate_risk_score
+from App.core import policy as policy_module
+
+
+def test_patterns_resolve_most_specific_first():
+    policy = RiskPolicy({
+        "/admin/**": 30,
+        "/admin/logs": 35,
+        "/admin/*/export": 40,
+        "/user/{user_id}/settings": 10,
+        "/user/*": 5,
+        "/files/**/raw": 20,
+    })
+    assert policy.sensitivity("/admin/logs") == 35
+    assert policy.sensitivity("/admin/logs/export") == 40
+    assert policy.sensitivity("/admin/users/42/disable") == 30
+    assert policy.sensitivity("/admin") == 30
+    assert policy.sensitivity("/user/42/settings") == 10
+    assert policy.sensitivity("/user/42") == 5
+    assert policy.sensitivity("/user/42/other") == 0
+    assert policy.sensitivity("/files/raw") == 20
+    assert policy.sensitivity("/files/a/b/raw") == 20
+    assert policy.sensitivity("/files/a/b") == 0
+    assert policy.sensitivity("/public/info") == 0
+    assert not policy.exact
+
+
+def test_builtin_policy_matches_the_exact_map():
+    policy = RiskPolicy()
+    assert policy.exact
+    for path, sensitivity in SENSITIVITY_MAP.items():
+        assert policy.sensitivity(path) == sensitivity
+    assert policy.sensitivity("/admin/logs/") == 0
+    assert [policy.decision(s) for s in (30, 31, 60, 61)] == ["allow", "allow+log", "allow+log", "deny"]
+    assert pickle.loads(pickle.dumps(policy)) == policy
+
+
+def test_invalid_policies_are_rejected(tmp_path):
+    with pytest.raises(PolicyError):
+        RiskPolicy.from_dict({"thresholds": {"allow": 70, "allow+log": 60}})
+    with pytest.raises(PolicyError):
+        RiskPolicy.from_dict({"sensitivity": {"/a": "high"}})
+    path = tmp_path / "broken.json"
+    path.write_text("{not json")
+    with pytest.raises(PolicyError):
+        RiskPolicy.from_file(str(path))
+
+
+def test_manager_hot_reloads_and_keeps_last_good_policy(tmp_path, monkeypatch):
+    path = tmp_path / "policy.json"
+    path.write_text(json.dumps({"sensitivity": {"/reports/**": 50}, "thresholds": {"allow": 10, "allow+log": 20}}))
+    manager = PolicyManager(str(path), reload_interval=0)
+    monkeypatch.setattr(policy_module, "policy_manager", manager)
+
+    assert calculate_risk("user", "/reports/2024/q1") == 55
+    assert evaluate_risk_score(15) == "allow+log"
+
+    path.write_text(json.dumps({"sensitivity": {"/reports/*": 1}}))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    assert calculate_risk("user", "/reports/2024") == 6
+    assert evaluate_risk_score(15) == "allow"
+    assert manager.reloads == 2
+
+    path.write_text("{broken")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2 * 10 ** 9))
+    assert calculate_risk("user", "/reports/2024") == 6
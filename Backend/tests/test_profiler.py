@@ -0,0 +1,79 @@
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from App.database.models import Base
+from App.core.jwt_handler import create_access_token
+from App.core.profiler import ProfileStore, StackSampler, fold_stacks, profiler
+from App.database import session as db_session_module
+from App.routers import admin
+
+
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampler_captures_busy_stacks():
+    sampler = StackSampler(interval=0.001)
+    sampler.begin()
+    start = time.perf_counter()
+    spin(0.1)
+    finished = time.perf_counter()
+    sampler.end()
+    stacks = fold_stacks(sampler.samples_between(start, finished))
+    assert stacks
+    assert any("spin (test_profiler.py" in s["stack"] for s in stacks)
+
+
+def test_store_is_a_bounded_ring(tmp_path):
+    store = ProfileStore(tmp_path, max_files=3)
+    ids = [store.save({"route": f"/r{i}", "stacks": [{"stack": "a;b", "count": 1}]}) for i in range(5)]
+    assert store.ids() == sorted(ids, reverse=True)[:3]
+    assert [p["route"] for p in store.list()] == ["/r4", "/r3", "/r2"]
+    assert "stacks" not in store.list()[0]
+    assert store.get(ids[0]) is None
+    assert store.get("../../etc/passwd") is None
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    def get_test_db():
+        yield db
+
+    monkeypatch.setattr(db_session_module, "get_db", get_test_db)
+    monkeypatch.setattr(profiler, "store", ProfileStore(tmp_path))
+    monkeypatch.setattr(profiler, "threshold", 0.0)
+
+    app = FastAPI()
+    app.middleware("http")(profiler.handle)
+    app.include_router(admin.router)
+    yield TestClient(app)
+    db.close()
+
+
+def test_slow_requests_are_saved_and_served(client):
+    token = create_access_token({"username": "adminuser", "role": "admin"})
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/admin/data", headers=headers).status_code == 200
+
+    listed = client.get("/admin/profiles", headers=headers).json()
+    first = listed[-1]
+    assert first["route"] == "/admin/data" and first["user"] == "adminuser"
+    assert first["status"] == 200 and first["reason"] == "slow"
+    assert {"require_roles", "jwt_decode", "risk_signals", "audit_log"} <= set(first["stages_ms"])
+
+    full = client.get(f"/admin/profiles/{first['id']}", headers=headers).json()
+    assert "stacks" in full
+    folded = client.get(f"/admin/profiles/{first['id']}?format=collapsed", headers=headers)
+    assert folded.status_code == 200
+    assert client.get("/admin/profiles/0000000000000-deadbeef", headers=headers).status_code == 404
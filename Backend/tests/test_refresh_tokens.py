@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from App.core.refresh_tokens import (
+    RefreshTokenReuse, find_refresh_token, hash_token, issue_refresh_token, purge_expired, rotate_refresh_token,
+)
+from App.database import session as db_session_module
+from App.database.models import AuditLog, Base, RefreshToken, User
+from App.main import app
+from App.migrate import migrate
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(username="rita", email="rita@example.com", password="x", role="user"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def _user(db):
+    return db.query(User).filter(User.username == "rita").one()
+
+
+def test_only_the_digest_is_stored(db):
+    token = issue_refresh_token(db, _user(db).id, "rita")
+    db.commit()
+    row = db.query(RefreshToken).one()
+    assert row.token_hash == hash_token(token) and len(row.token_hash) == 64
+    assert token not in {row.token_hash, row.jti, row.family}
+    stored, user = find_refresh_token(db, token)
+    assert stored.id == row.id and user.username == "rita"
+
+
+def test_rotation_keeps_one_row_per_session(db):
+    first = issue_refresh_token(db, _user(db).id, "rita")
+    db.commit()
+    family = db.query(RefreshToken).one().family
+
+    user, second = rotate_refresh_token(db, first)
+    assert user.username == "rita" and second != first
+    user, third = rotate_refresh_token(db, second)
+    rows = db.query(RefreshToken).all()
+    assert len(rows) == 1
+    assert rows[0].family == family and rows[0].token_hash == hash_token(third)
+
+
+def test_replaying_a_rotated_token_revokes_the_family(db):
+    first = issue_refresh_token(db, _user(db).id, "rita")
+    other_session = issue_refresh_token(db, _user(db).id, "rita")
+    db.commit()
+    _, second = rotate_refresh_token(db, first)
+
+    with pytest.raises(RefreshTokenReuse):
+        rotate_refresh_token(db, first)
+    # the thief's copy and the legitimate successor are both dead now
+    with pytest.raises(HTTPException):
+        rotate_refresh_token(db, second)
+    assert [r.token_hash for r in db.query(RefreshToken).all()] == [hash_token(other_session)]
+
+
+def test_expired_rows_are_rejected_and_purged(db):
+    user_id = _user(db).id
+    old = datetime.utcnow() - timedelta(days=30)
+    for _ in range(5):
+        issue_refresh_token(db, user_id, "rita", now=old)
+    live = issue_refresh_token(db, user_id, "rita")
+    db.commit()
+
+    assert purge_expired(db, batch_size=2) == 5
+    assert db.query(RefreshToken).count() == 1
+    assert find_refresh_token(db, live) is not None
+
+
+def test_migrate_hashes_raw_tokens_and_adds_columns():
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL UNIQUE, "
+                          "email VARCHAR NOT NULL UNIQUE, password VARCHAR NOT NULL, role VARCHAR NOT NULL)"))
+        conn.execute(text("CREATE TABLE refresh_tokens (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+                          "token VARCHAR NOT NULL UNIQUE, created_at DATETIME, expires_at DATETIME)"))
+        conn.execute(text("INSERT INTO users VALUES (1, 'rita', 'rita@example.com', 'x', 'user')"))
+        conn.execute(text("INSERT INTO refresh_tokens (user_id, token, expires_at) VALUES (1, 'legacy.raw.token', :e)"),
+                     {"e": datetime.utcnow() + timedelta(days=1)})
+
+    applied = migrate(engine)
+    assert {"column refresh_tokens.jti", "column refresh_tokens.family", "hashed 1 refresh tokens"} <= set(applied)
+    assert {"jti", "family"} <= {c["name"] for c in inspect(engine).get_columns("refresh_tokens")}
+    db = sessionmaker(bind=engine)()
+    assert find_refresh_token(db, "legacy.raw.token") is not None
+    assert migrate(engine) == []
+
+
+def test_refresh_route_rotates_and_flags_replays(db, monkeypatch):
+    def get_test_db():
+        yield db
+
+    monkeypatch.setattr(db_session_module, "get_db", get_test_db)
+    client = TestClient(app)
+    r = client.post("/register", json={"username": "sam", "email": "sam@example.com", "password": "pw123"})
+    assert r.status_code == 200
+    first = r.json()["refresh_token"]
+
+    r = client.post("/refresh", json={"refresh_token": first})
+    assert r.status_code == 200
+    assert r.json()["refresh_token"] not in (None, first)
+
+    r = client.post("/refresh", json={"refresh_token": first})
+    assert r.status_code == 401
+    flagged = db.query(AuditLog).filter(AuditLog.event_type == "refresh_reuse").one()
+    assert flagged.username == "sam" and flagged.suspicious == 1
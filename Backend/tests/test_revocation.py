@@ -0,0 +1,158 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from App import dependencies
+from App.core.jwt_handler import decode_access_token
+from App.core.refresh_tokens import issue_refresh_token
+from App.core.revocation import BloomFilter, RevocationList, purge_expired
+from App.database import session as db_session_module
+from App.database.models import Base, RefreshToken, RevokedToken, User
+from App.main import app
+from App.routers import admin
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: session.statements.append(args[2]))
+    yield session
+    session.close()
+
+
+def _payload(username="ivy", jti=None, iat=None):
+    return {"username": username, "jti": jti or uuid.uuid4().hex, "iat": iat or int(time.time())}
+
+
+def test_bloom_filter_has_no_false_negatives_and_a_bounded_error_rate():
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    keys = [uuid.uuid4().hex for _ in range(10000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(20000))
+    assert false_positives / 20000 < 0.03
+
+
+def test_unrevoked_tokens_are_checked_without_queries(db):
+    revocations = RevocationList(capacity=1000, sync_interval=60)
+    revocations.sync(db)
+    revoked = _payload()
+    revocations.revoke_jti(db, revoked["jti"], reason="stolen")
+
+    db.statements.clear()
+    assert not any(revocations.is_revoked(_payload(), db) for _ in range(200))
+    assert len(db.statements) <= 1  # at most a rare filter false positive
+    assert revocations.is_revoked(revoked, db)
+    assert revocations.revoke_jti(db, revoked["jti"]) is False  # already revoked
+
+
+def test_other_workers_pick_up_revocations_incrementally(db):
+    worker_a = RevocationList(capacity=1000, sync_interval=0)
+    worker_b = RevocationList(capacity=1000, sync_interval=0)
+    worker_b.sync(db)
+    token = _payload()
+    assert not worker_b.is_revoked(token, db)
+
+    worker_a.revoke_jti(db, token["jti"])
+    db.statements.clear()
+    assert worker_b.is_revoked(token, db)
+    assert any("revoked_tokens.id >" in s for s in db.statements)  # only new rows were read
+
+
+def test_revocations_after_a_purge_reach_other_workers(db):
+    past = datetime.utcnow() - timedelta(days=1)
+    for jti in ("a", "b", "c"):
+        db.add(RevokedToken(jti=jti, revoked_at=past, expires_at=past + timedelta(hours=1)))
+    db.commit()
+    worker_a = RevocationList(capacity=1000, sync_interval=0)
+    worker_b = RevocationList(capacity=1000, sync_interval=0)
+    worker_b.sync(db)
+    assert worker_b._last_id == 3
+
+    assert purge_expired(db) == 3
+    stolen = _payload(jti="stolen")
+    worker_a.revoke_jti(db, "stolen")
+    assert db.query(RevokedToken.id).filter_by(jti="stolen").scalar() == 4  # ids are not reused
+    assert worker_b.is_revoked(stolen, db)
+
+
+def test_rebuild_resets_the_sync_watermark(db):
+    worker = RevocationList(capacity=1000, sync_interval=0)
+    worker._last_id = 50  # ahead of the table, e.g. after it was recreated
+    worker.sync(db)
+    assert worker._last_id == 0
+    RevocationList(capacity=1000).revoke_jti(db, "late")
+    assert worker.is_revoked(_payload(jti="late"), db)
+
+
+def test_user_wide_revocation_cuts_off_older_tokens_and_sessions(db):
+    db.add(User(username="ivy", email="ivy@example.com", password="x", role="user"))
+    db.commit()
+    user_id = db.query(User.id).filter(User.username == "ivy").scalar()
+    issue_refresh_token(db, user_id, "ivy")
+    issue_refresh_token(db, user_id, "ivy")
+    db.commit()
+
+    revocations = RevocationList(capacity=1000, sync_interval=60)
+    old = _payload(iat=int(time.time()) - 10)
+    assert revocations.revoke_user(db, "ivy") == 2
+    assert db.query(RefreshToken).count() == 0
+    assert revocations.is_revoked(old, db)
+    assert not revocations.is_revoked(_payload(iat=int(time.time()) + 1), db)
+    assert not revocations.is_revoked(_payload(username="other", iat=int(time.time()) - 10), db)
+
+    # a freshly started worker rebuilds the same cutoff from the table
+    fresh = RevocationList(capacity=1000)
+    assert fresh.is_revoked(old, db)
+
+
+def test_rebuild_and_purge_drop_expired_revocations(db):
+    past = datetime.utcnow() - timedelta(days=1)
+    db.add(RevokedToken(jti="gone", revoked_at=past, expires_at=past + timedelta(hours=1)))
+    db.add(RevokedToken(jti="live", revoked_at=datetime.utcnow(), expires_at=datetime.utcnow() + timedelta(hours=1)))
+    db.commit()
+
+    revocations = RevocationList(capacity=1000)
+    assert revocations.sync(db) == 1
+    assert revocations.stats()["revoked_jtis"] == 1
+    assert purge_expired(db) == 1
+    assert [r.jti for r in db.query(RevokedToken).all()] == ["live"]
+
+
+def test_admin_revocation_rejects_the_token(db, monkeypatch):
+    def get_test_db():
+        yield db
+
+    monkeypatch.setattr(db_session_module, "get_db", get_test_db)
+    revocations = RevocationList(capacity=1000, sync_interval=0)
+    monkeypatch.setattr(dependencies, "revocations", revocations)
+    monkeypatch.setattr(admin, "revocations", revocations)
+    client = TestClient(app)
+
+    admin_token = client.post("/register", json={"username": "root", "email": "root@example.com",
+                                                 "password": "pw123", "role": "admin"}).json()["access_token"]
+    user = client.post("/register", json={"username": "uma", "email": "uma@example.com", "password": "pw123"}).json()
+    user_headers = {"Authorization": f"Bearer {user['access_token']}"}
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    assert client.get("/user/profile", headers=user_headers).status_code == 200
+
+    jti = decode_access_token(user["access_token"])["jti"]
+    r = client.post(f"/admin/tokens/{jti}/revoke", params={"reason": "lost laptop"}, headers=admin_headers)
+    assert r.status_code == 200 and r.json()["revoked"]
+    r = client.get("/user/profile", headers=user_headers)
+    assert r.status_code == 401 and r.json()["detail"] == "Token revoked"
+
+    r = client.post("/admin/users/uma/revoke-tokens", headers=admin_headers)
+    assert r.json()["sessions_ended"] == 1
+    assert client.post("/refresh", json={"refresh_token": user["refresh_token"]}).status_code == 401
+    assert client.get("/admin/tokens/revocations", headers=admin_headers).json()["revoked_users"] == 1
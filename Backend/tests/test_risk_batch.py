@@ -0,0 +1,80 @@
+import random
+import pytest
+from App.core.risk_engine import SENSITIVITY_MAP, calculate_risk, calculate_risk_batch, evaluate_risk_score, evaluate_risk_scores
+
+np = pytest.importorskip("numpy")
+
+ENDPOINTS = list(SENSITIVITY_MAP) + ["/user/me", "/unknown", ""]
+# values on and around every threshold in calculate_risk
+COUNTS = [-1, 0, 1, 2, 3, 4, 5, 6, 9, 10, 11, 19, 20, 21, 49, 50, 51, 1000]
+AGES = [0, 86399, 86400, 86401, 604799, 604800, 604801, 10 ** 7]
+
+
+def random_rows(rng, n):
+    return {
+        "endpoints": [rng.choice(ENDPOINTS) for _ in range(n)],
+        "role_mismatch": [rng.random() < 0.3 for _ in range(n)],
+        "request_count": [rng.choice(COUNTS) for _ in range(n)],
+        "failed_login_count": [rng.choice(COUNTS) for _ in range(n)],
+        "token_age_seconds": [rng.choice(AGES) for _ in range(n)],
+        "token_reuse_count": [rng.choice(COUNTS[:8]) for _ in range(n)],
+        "ip_change": [rng.random() < 0.5 for _ in range(n)],
+        "ua_change": [rng.random() < 0.5 for _ in range(n)],
+    }
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_batch_matches_scalar_path(seed):
+    rng = random.Random(seed)
+    cols = random_rows(rng, 500)
+    scores, decisions = calculate_risk_batch(**cols)
+
+    for i in range(500):
+        expected = calculate_risk(
+            "user",
+            cols["endpoints"][i],
+            request_count=cols["request_count"][i],
+            required_roles=["admin"] if cols["role_mismatch"][i] else None,
+            failed_login_count=cols["failed_login_count"][i],
+            token_age_seconds=cols["token_age_seconds"][i],
+            token_reuse_count=cols["token_reuse_count"][i],
+            ip_change=cols["ip_change"][i],
+            ua_change=cols["ua_change"][i],
+        )
+        assert scores[i] == expected, {k: v[i] for k, v in cols.items()}
+        assert decisions[i] == evaluate_risk_score(expected)
+
+
+def test_decisions_cover_every_score():
+    scores = np.arange(0, 101)
+    _, decisions = calculate_risk_batch(["/"] * 101)
+    assert list(evaluate_risk_scores(scores)) == [evaluate_risk_score(s) for s in range(101)]
+    assert list(decisions) == ["allow"] * 101
+
+
+def test_missing_columns_default_to_zero_and_lengths_are_checked():
+    scores, _ = calculate_risk_batch(["/admin/logs", "/user/profile"])
+    assert list(scores) == [40, 10]
+    with pytest.raises(ValueError):
+        calculate_risk_batch(["/admin/logs"], request_count=[1, 2])
+
+
+def test_batch_matches_scalar_under_a_pattern_policy(monkeypatch):
+    from App.core import policy as policy_module
+    from App.core.policy import PolicyManager, RiskPolicy
+
+    manager = PolicyManager()
+    manager._policy = RiskPolicy({"/admin/**": 35, "/user/*": 5, "/user/settings": 10}, allow_max=20, log_max=50)
+    monkeypatch.setattr(policy_module, "policy_manager", manager)
+    rng = random.Random(7)
+    cols = random_rows(rng, 300)
+    scores, decisions = calculate_risk_batch(**cols)
+    for i in range(300):
+        expected = calculate_risk(
+            "user", cols["endpoints"][i], request_count=cols["request_count"][i],
+            required_roles=["admin"] if cols["role_mismatch"][i] else None,
+            failed_login_count=cols["failed_login_count"][i], token_age_seconds=cols["token_age_seconds"][i],
+            token_reuse_count=cols["token_reuse_count"][i], ip_change=cols["ip_change"][i], ua_change=cols["ua_change"][i],
+        )
+        assert scores[i] == expected
+        assert decisions[i] == evaluate_risk_score(expected)
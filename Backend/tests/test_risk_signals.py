@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from App.database.models import Base, AuditLog, TokenUsage
+from App.core.risk_signals import gather_signals
+from App.core.signal_store import SignalStore
+
+
+def make_session():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return sessionmaker(bind=engine)(), statements
+
+
+def seed(db, now):
+    db.add_all([
+        AuditLog(username="gina", event_type="login_success", ip="10.0.0.1", user_agent="ua-1", timestamp=now - timedelta(minutes=30)),
+        AuditLog(username="gina", event_type="api_call", timestamp=now - timedelta(seconds=20)),
+        AuditLog(username="gina", event_type="login_failed", timestamp=now - timedelta(seconds=30)),
+        AuditLog(username="gina", event_type="login_failed", timestamp=now - timedelta(minutes=3)),
+        AuditLog(username="gina", event_type="login_failed", timestamp=now - timedelta(minutes=10)),
+        TokenUsage(jti="t1", ip="10.0.0.1"),
+        TokenUsage(jti="t1", ip="10.0.0.9"),
+    ])
+    db.commit()
+
+
+def test_cold_store_uses_a_single_statement():
+    now = datetime.utcnow()
+    db, statements = make_session()
+    seed(db, now)
+    statements.clear()
+
+    signals = gather_signals(db, "gina", jti="t1", ip="10.0.0.2", user_agent="ua-2",
+                             iat=int(now.timestamp()) - 90000, store=SignalStore(), now=now)
+    assert len(statements) == 1
+    assert signals.request_count == 2
+    assert signals.failed_login_count == 2
+    assert signals.token_reuse_count == 2
+    assert signals.ip_change and signals.ua_change
+    assert signals.token_age_seconds == 90000
+
+
+def test_warm_store_matches_sql_and_counts_pending_ips():
+    now = datetime.utcnow()
+    db, statements = make_session()
+    seed(db, now)
+    store = SignalStore()
+    store.rebuild(db)
+    statements.clear()
+
+    signals = gather_signals(db, "gina", jti="t1", ip="10.0.0.1", user_agent="ua-1",
+                             pending_ips={"10.0.0.5"}, store=store, now=now)
+    assert len(statements) == 1
+    assert (signals.request_count, signals.failed_login_count) == (2, 2)
+    assert signals.token_reuse_count == 2
+    assert not signals.ip_change and not signals.ua_change
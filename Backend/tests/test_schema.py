@@ -0,0 +1,20 @@
+from sqlalchemy import create_engine, event, inspect
+from App.database import schema
+
+
+def test_schema_is_checked_once_per_engine_until_invalidated():
+    engine = create_engine("sqlite:///:memory:")
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    assert schema.ensure_schema(engine) is True
+    assert "audit_logs" in inspect(engine).get_table_names()
+    statements.clear()
+
+    assert schema.ensure_schema(engine) is False
+    assert schema.is_ready(engine)
+    assert statements == []
+
+    schema.invalidate(engine)
+    assert not schema.is_ready(engine)
+    assert schema.ensure_schema(engine) is True
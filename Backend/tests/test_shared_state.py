@@ -0,0 +1,268 @@
+import fnmatch
+import multiprocessing
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from App.core.risk_engine import calculate_risk, evaluate_risk_score
+from App.core.risk_signals import gather_signals
+from App.core.shared_state import MmapSharedState, RedisSharedState, RespClient, SharedStateError, WindowTable
+from App.core.signal_store import SharedSignalStore, SignalStore, signal_tables
+from App.database.models import AuditLog, Base
+
+
+class _RespStandIn(socketserver.ThreadingTCPServer):
+    """A tiny in-process server speaking the subset of RESP the adapter uses."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), _RespHandler)
+
+    def _get(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def run(self, cmd, *args):
+        cmd = cmd.upper()
+        if cmd == "PING":
+            return "+PONG"
+        if cmd == "GET":
+            return self._get(args[0])
+        if cmd == "SET":
+            key, value, opts = args[0], args[1], [a.upper() for a in args[2:]]
+            if "NX" in opts and self._get(key) is not None:
+                return None
+            self.data[key] = value
+            self.expires.pop(key, None)
+            if "EX" in opts:
+                self.expires[key] = time.monotonic() + int(args[2 + opts.index("EX") + 1])
+            return "+OK"
+        if cmd == "DEL":
+            return sum(self.data.pop(k, None) is not None for k in args)
+        if cmd == "EXPIRE":
+            if self._get(args[0]) is None:
+                return 0
+            self.expires[args[0]] = time.monotonic() + int(args[1])
+            return 1
+        if cmd == "HINCRBY":
+            h = self._get(args[0]) or self.data.setdefault(args[0], {})
+            h[args[1]] = str(int(h.get(args[1], 0)) + int(args[2]))
+            return int(h[args[1]])
+        if cmd == "HSET":
+            h = self._get(args[0]) or self.data.setdefault(args[0], {})
+            pairs = dict(zip(args[1::2], args[2::2]))
+            added = len(set(pairs) - set(h))
+            h.update(pairs)
+            return added
+        if cmd == "HGETALL":
+            return [x for kv in (self._get(args[0]) or {}).items() for x in kv]
+        if cmd == "HDEL":
+            h = self._get(args[0]) or {}
+            return sum(h.pop(f, None) is not None for f in args[1:])
+        if cmd == "SCAN":
+            pattern = args[args.index("MATCH") + 1] if "MATCH" in args else "*"
+            return ["0", [k for k in list(self.data) if self._get(k) is not None and fnmatch.fnmatchcase(k, pattern)]]
+        return Exception(f"ERR unknown command '{cmd}'")
+
+
+def _encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return b"-" + str(reply).encode() + b"\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(_encode(r) for r in reply)
+    if reply.startswith("+"):
+        return reply.encode() + b"\r\n"
+    data = reply.encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2].decode())
+            with self.server.lock:
+                reply = self.server.run(*args)
+            self.wfile.write(_encode(reply))
+
+
+@pytest.fixture
+def resp_server():
+    server = _RespStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _redis_backend(server):
+    host, port = server.server_address
+    return RedisSharedState(f"redis://{host}:{port}/0", prefix="t")
+
+
+def _mmap_backend(path, slots=64):
+    return MmapSharedState(str(path), signal_tables(), slots=slots)
+
+
+@pytest.fixture(params=["mmap", "redis"])
+def two_workers(request, tmp_path):
+    """Two stores over one shared backend, as two uvicorn workers would have."""
+    if request.param == "mmap":
+        backends = [_mmap_backend(tmp_path / "signals"), _mmap_backend(tmp_path / "signals")]
+    else:
+        server = request.getfixturevalue("resp_server")
+        backends = [_redis_backend(server), _redis_backend(server)]
+    stores = [SharedSignalStore(b) for b in backends]
+    for store in stores:
+        store.ready = True
+    yield stores
+    for b in backends:
+        b.close()
+
+
+def test_counts_slide_with_the_window(two_workers):
+    store = two_workers[0]
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    for i in range(3):
+        store.record("alice", "api_call", now - timedelta(seconds=i))
+    store.record("alice", "login_failed", now - timedelta(seconds=90))
+
+    assert store.recent_count("alice", now) == 3
+    assert store.failed_login_count("alice", now) == 1
+    assert store.recent_count("alice", now + timedelta(seconds=59)) == 1
+    assert store.recent_count("alice", now + timedelta(seconds=61)) == 0
+    assert store.failed_login_count("alice", now + timedelta(seconds=211)) == 0
+    assert store.recent_count("bob", now) == 0
+
+
+def test_workers_see_each_others_events(two_workers):
+    a, b = two_workers
+    now = datetime.utcnow()
+    for i in range(6):
+        (a if i % 2 else b).record("dana", "login_failed", now - timedelta(seconds=i), ip="10.0.0.1")
+    a.record("dana", "login_success", now, ip="10.0.0.7", user_agent="x" * 400, jti="j1")
+    b.record("dana", "api_call", now, ip="10.0.0.8", jti="j1")
+
+    for store in (a, b):
+        assert store.recent_count("dana", now) == 8
+        assert store.failed_login_count("dana", now) == 6
+        ip, user_agent = store.last_login("dana")
+        assert ip == "10.0.0.7"
+        assert store.token_ips("j1", now) == {"10.0.0.7", "10.0.0.8"}
+
+    # every worker scores the request the same way
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    results = []
+    for store in (a, b):
+        signals = gather_signals(db, "dana", jti="j1", ip="10.0.0.9", user_agent="x" * 400, store=store, now=now)
+        assert not signals.ua_change  # fingerprinted user agent still compares equal
+        assert signals.token_reuse_count == 2
+        score = calculate_risk("user", "/user/profile", **signals.as_kwargs())
+        results.append((score, evaluate_risk_score(score)))
+    assert results[0] == results[1]
+
+
+def _hammer(path, n):
+    store = SharedSignalStore(_mmap_backend(path))
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    for _ in range(n):
+        store.record("eve", "login_failed", now)
+
+
+def test_mmap_updates_are_atomic_across_processes(tmp_path):
+    path = tmp_path / "signals"
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_hammer, args=(path, 300)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+    store = SharedSignalStore(_mmap_backend(path))
+    assert store.failed_login_count("eve", datetime(2024, 1, 1, 12, 0, 0)) == 1200
+
+
+def test_full_table_evicts_the_oldest_key(tmp_path):
+    backend = MmapSharedState(str(tmp_path / "tiny"), {"w": WindowTable(60)}, slots=4)
+    for i in range(4):
+        backend.hit("w", f"user{i}", 1000 + i, 60)
+    backend.hit("w", "late", 1010, 60)
+    assert backend.window_count("w", "late", 1010, 60) == 1
+    assert backend.window_count("w", "user0", 1010, 60) == 0
+    assert backend.window_count("w", "user3", 1010, 60) == 1
+
+
+def test_changed_layout_reinitialises_the_file(tmp_path):
+    path = str(tmp_path / "signals")
+    _mmap_backend(path, slots=64).hit("requests", "a", 1000, 60)
+    assert _mmap_backend(path, slots=64).window_count("requests", "a", 1000, 60) == 1
+    assert _mmap_backend(path, slots=128).window_count("requests", "a", 1000, 60) == 0
+
+
+def test_rebuild_runs_once_for_workers_starting_together(two_workers):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    now = datetime.utcnow()
+    db.add_all([
+        AuditLog(username="carol", event_type="login_failed", timestamp=now - timedelta(seconds=10)),
+        AuditLog(username="carol", event_type="login_success", ip="10.0.0.3", timestamp=now - timedelta(hours=2)),
+        AuditLog(username="carol", event_type="api_call", timestamp=now - timedelta(seconds=120)),
+    ])
+    db.commit()
+    a, b = two_workers
+
+    assert a.rebuild(db) == 2
+    assert b.rebuild(db) == 0  # a rebuilt moments ago
+    assert b.ready
+    assert b.recent_count("carol") == 1
+    assert b.failed_login_count("carol") == 1
+    assert b.last_login("carol") == ("10.0.0.3", None)
+
+
+def test_backend_failure_falls_back_to_sql():
+    store = SharedSignalStore(RedisSharedState("redis://127.0.0.1:1/0"))
+    store.ready = True
+    store.record("frank", "api_call")
+    assert not store.ready
+    assert store.recent_count("frank") == 0
+
+
+def test_resp_errors_are_raised(resp_server):
+    host, port = resp_server.server_address
+    client = RespClient(f"redis://{host}:{port}/0")
+    assert client.execute("PING") == "PONG"
+    with pytest.raises(SharedStateError):
+        client.execute("NOPE")
+    assert client.pipeline(("SET", "k", "v"), ("GET", "k")) == ["OK", "v"]
+    client.close()
+
+
+def test_memory_store_keeps_no_token_ips():
+    store = SignalStore()
+    store.record("gail", "api_call", ip="10.0.0.1", jti="j")
+    assert store.token_ips("j") == set()
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from App.database.models import Base, AuditLog
+from App.core.signal_store import SignalStore, make_signal_store, signal_store
+
+
+def test_counts_slide_with_the_window():
+    store = SignalStore()
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    for i in range(3):
+        store.record("alice", "api_call", now - timedelta(seconds=i))
+    store.record("alice", "login_failed", now - timedelta(seconds=90))
+
+    assert store.recent_count("alice", now) == 3
+    assert store.failed_login_count("alice", now) == 1
+    assert store.recent_count("alice", now + timedelta(seconds=59)) == 1
+    assert store.recent_count("alice", now + timedelta(seconds=61)) == 0
+    assert store.failed_login_count("alice", now + timedelta(seconds=211)) == 0
+    assert store.recent_count("bob", now) == 0
+
+
+def test_idle_and_excess_users_are_evicted():
+    store = SignalStore(max_users=2)
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    store.record("a", "api_call", now)
+    store.record("b", "api_call", now)
+    store.record("c", "api_call", now)
+    assert len(store) == 2
+    assert store.recent_count("a", now) == 0
+
+    assert store.evict_idle(now + timedelta(minutes=10)) == 2
+    assert len(store) == 0
+
+
+def test_rebuild_from_audit_logs():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    now = datetime.utcnow()
+    db.add_all([
+        AuditLog(username="carol", event_type="login_failed", timestamp=now - timedelta(seconds=10)),
+        AuditLog(username="carol", event_type="api_call", timestamp=now - timedelta(seconds=120)),
+        AuditLog(username="carol", event_type="api_call", timestamp=now - timedelta(hours=1)),
+    ])
+    db.commit()
+
+    store = SignalStore()
+    assert store.rebuild(db) == 2
+    assert store.ready
+    assert store.recent_count("carol") == 1
+    assert store.failed_login_count("carol") == 1
+
+
+def test_tests_run_on_the_per_process_store():
+    # a shared mmap file would leak counters between test runs and checkouts
+    assert type(signal_store) is SignalStore
+    assert type(make_signal_store("memory")) is SignalStore
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from App.database.models import Base, TokenUsage
+from App.core.audit_logger import log_access
+from App.core.refresh_tokens import RefreshTokenPurger
+from App.core.token_usage import record_token_use, token_reuse_count
+
+
+def make_session():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    return Session()
+
+
+def test_reuse_counts_other_ips_only():
+    db = make_session()
+    log_access(db, "dave", "/token", 0, "issued", event_type="login_success", ip="10.0.0.1", user_agent="ua", jti="abc")
+    log_access(db, "dave", "/user/profile", 5, "allow", event_type="api_call", ip="10.0.0.1", user_agent="ua", jti="abc")
+
+    assert db.query(TokenUsage).filter(TokenUsage.jti == "abc").one().use_count == 2
+    assert token_reuse_count(db, "abc", "10.0.0.1") == 0
+    assert token_reuse_count(db, "abc", "10.0.0.2") == 1
+
+    log_access(db, "dave", "/user/profile", 5, "allow", event_type="api_call", ip="10.0.0.2", user_agent="ua", jti="abc")
+    assert token_reuse_count(db, "abc", "10.0.0.3") == 2
+    assert token_reuse_count(db, "other", "10.0.0.3") == 0
+
+
+def test_concurrent_first_uses_fold_into_one_row():
+    db = make_session()
+    # without autoflush neither call sees the other's row, like two writers racing
+    db.autoflush = False
+    record_token_use(db, "race", username="dave", ip="10.0.0.1", user_agent="ua")
+    record_token_use(db, "race", username="dave", ip="10.0.0.1", user_agent="ua", count=3)
+    record_token_use(db, "race", username="dave", ip=None, user_agent="ua")
+    record_token_use(db, "race", username="dave", ip=None, user_agent="ua")
+    db.commit()
+    counts = sorted((u.ip or "", u.use_count) for u in db.query(TokenUsage).filter(TokenUsage.jti == "race"))
+    assert counts == [("", 2), ("10.0.0.1", 4)]
+
+
+def test_purger_drops_usage_of_expired_tokens():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    now = datetime.utcnow()
+    for i, minutes_ago in enumerate((5, 59, 62, 300)):
+        record_token_use(db, f"t{i}", ip="10.0.0.1", user_agent="ua", seen_at=now - timedelta(minutes=minutes_ago))
+    db.commit()
+
+    RefreshTokenPurger(Session, batch_size=1).purge_once()
+    # tokens live 60 minutes, plus a minute of leeway
+    assert sorted(u.jti for u in db.query(TokenUsage)) == ["t0", "t1"]